@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from collisions import find_overlaps
+from gravity import DEFAULT_THETA
+from headless import PRESETS
+from integrators import INTEGRATORS
+from scenarios import keplerian_disk
+from simulation import DEFAULT_G, DT_NORM, GRAVITY_MODES, Simulation
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+
+# Metrics and whether a larger value is better, for the baseline comparison
+METRICS = {
+    'steps_per_sec': True,
+    'ns_per_pair': False,
+    'collide_ms': False,
+    'peak_memory_mb': False,
+    'render_ms_per_frame': False,
+}
+
+
+def build_scene(simulation, scene):
+    if scene in PRESETS:
+        PRESETS[scene](simulation)
+    else:
+        keplerian_disk(simulation, int(scene.split('=')[1]), seed=0)
+
+
+def timed_repeats(function, min_time, max_repeats):
+    # Repeats function until min_time has passed, returns seconds per call
+    repeats = 0
+    start = time.perf_counter()
+    while True:
+        function()
+        repeats += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or repeats >= max_repeats:
+            return elapsed / repeats
+
+
+def bench_case(scene, gravity_mode, integrator, dt, min_time, max_steps):
+    simulation = Simulation(gravity_mode, DEFAULT_THETA, 0, integrator)
+    simulation.G = DEFAULT_G
+    build_scene(simulation, scene)
+    store = simulation.particles
+    n = len(store)
+    result = {'bodies': n}
+    try:
+        seconds = timed_repeats(lambda: simulation.computeAccelerations(store.x, store.y, store.mass),
+                                min_time, max_steps)
+        result['ns_per_pair'] = seconds * 1e9 / max(n * (n - 1), 1)
+        result['collide_ms'] = timed_repeats(lambda: find_overlaps(store.x, store.y, store.radius),
+                                             min_time, max_steps) * 1e3
+
+        tracemalloc.start()
+        simulation.step(dt)
+        result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+        # Bodies merge as the run goes, so steps/s is for the scene as it evolves
+        result['steps_per_sec'] = 1 / timed_repeats(lambda: simulation.step(dt), min_time, max_steps)
+        result['bodies_after'] = len(store)
+    finally:
+        simulation.close()
+    return result
+
+
+def bench_render(viewer, scene, frames):
+    build_scene(viewer, scene)
+    viewer.update_frame()
+    viewer.center_on_massive()
+    start = time.perf_counter()
+    for _ in range(frames):
+        viewer.screen.fill((0, 0, 0))
+        viewer.draw_grid()
+        viewer.draw_particles()
+        viewer.draw_ui()
+    return (time.perf_counter() - start) * 1e3 / frames
+
+
+def make_viewer():
+    # Renders into an off-screen surface; None when pygame is not available
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    try:
+        from sim import PhysicsSimulation
+    except ImportError:
+        return None
+    return PhysicsSimulation(seed=0)
+
+
+def compare(results, baseline, tolerance):
+    # Cases and metrics that got worse than the baseline by more than tolerance
+    regressions = []
+    for case, metrics in results.items():
+        old = baseline.get(case)
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in metrics or old.get(metric) is None or not old[metric]:
+                continue
+            change = metrics[metric] / old[metric] - 1
+            if higher_is_better:
+                change = -change
+            if change > tolerance:
+                regressions.append((case, metric, old[metric], metrics[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark force kernels, integrators, collisions and rendering")
+    parser.add_argument("--presets", default=",".join(PRESETS), help="comma-separated presets to run")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+                        help="comma-separated body counts for the Keplerian disk scenario")
+    parser.add_argument("--gravity", default="direct,barnes_hut", help="comma-separated gravity modes")
+    parser.add_argument("--integrators", default="leapfrog", help="comma-separated integrators")
+    parser.add_argument("--max-direct", type=int, default=20000,
+                        help="skip the direct-sum gravity modes above this many bodies")
+    parser.add_argument("--dt", type=float, default=DT_NORM)
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds spent timing each measurement")
+    parser.add_argument("--max-steps", type=int, default=200, help="repeat each measurement at most this often")
+    parser.add_argument("--render-frames", type=int, default=30, help="0 disables the render benchmark")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    modes = args.gravity.split(",")
+    integrators = args.integrators.split(",")
+    for mode in modes:
+        if mode not in GRAVITY_MODES:
+            parser.error("unknown gravity mode: " + mode)
+    for name in integrators:
+        if name not in INTEGRATORS:
+            parser.error("unknown integrator: " + name)
+    scenes = [p for p in args.presets.split(",") if p] + ["N=" + s for s in args.sizes.split(",") if s]
+    viewer = make_viewer() if args.render_frames else None
+
+    results = {}
+    for scene in scenes:
+        render_ms = None
+        if viewer is not None:
+            render_ms = bench_render(viewer, scene, args.render_frames)
+        for mode in modes:
+            for integrator in integrators:
+                case = "/".join((scene, mode, integrator))
+                n = int(scene.split('=')[1]) if scene.startswith("N=") else 0
+                if n > args.max_direct and mode not in ("barnes_hut", "pm", "p3m"):
+                    results[case] = {'bodies': n, 'skipped': "above --max-direct"}
+                    print(f"{case}: skipped", file=sys.stderr)
+                    continue
+                result = bench_case(scene, mode, integrator, args.dt, args.min_time, args.max_steps)
+                if render_ms is not None:
+                    result['render_ms_per_frame'] = render_ms
+                results[case] = result
+                print(f"{case}: " + ", ".join(f"{k}={v:.4g}" for k, v in result.items()), file=sys.stderr)
+    if viewer is not None:
+        viewer.close()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for case, metric, old, new in regressions:
+            print(f"REGRESSION {case} {metric}: {old:.4g} -> {new:.4g}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import numpy as np
+
+# Walls, in the order the spawn velocities below are listed
+WALLS = ('left', 'right', 'bottom', 'top')
+
+
+def reflect(store, box):
+    # Clamp bodies that left the box back onto the wall and turn their
+    # velocity inwards. Left/right are checked before bottom/top, and a body
+    # past two walls at once bounces off both. Returns the hit mask per wall
+    # and the speeds before the bounce, as needed for explosion spawns.
+    left, top, right, bottom = box
+    x, y, vx, vy = store.x, store.y, store.vx, store.vy
+    speed = np.hypot(vx, vy)
+    hits = {'left': x < left, 'right': x > right, 'bottom': y > bottom}
+    hits['top'] = ~hits['bottom'] & (y < top)
+
+    x[hits['left']] = left
+    vx[hits['left']] = np.abs(vx[hits['left']])
+    x[hits['right']] = right
+    vx[hits['right']] = -np.abs(vx[hits['right']])
+    y[hits['bottom']] = bottom
+    vy[hits['bottom']] = -np.abs(vy[hits['bottom']])
+    y[hits['top']] = top
+    vy[hits['top']] = np.abs(vy[hits['top']])
+    if any(mask.any() for mask in hits.values()):
+        store.version += 1
+    return hits, speed
+
+
+def explosion_spawns(store, box, hits, speed, count, rng):
+    # count copies of every body that hit a wall, entering from the opposite
+    # wall at a random point with the parent's speed in a random direction.
+    # Returns columns for ParticleStore.add_many, built without touching the store.
+    left, top, right, bottom = box
+    parts = []
+    for wall in WALLS:
+        parents = np.repeat(np.nonzero(hits[wall])[0], count)
+        k = len(parents)
+        if k == 0:
+            continue
+        vmag = speed[parents]
+        vcos = vmag * np.cos(rng.random(k) * 2 * np.pi)
+        vsin = vmag * np.sin(rng.random(k) * 2 * np.pi)
+        if wall in ('left', 'right'):
+            along = rng.random(k) * (bottom - top) + top
+            if wall == 'left':
+                parts.append((parents, np.full(k, right), along, -np.abs(vcos), vsin))
+            else:
+                parts.append((parents, np.full(k, left), along, np.abs(vcos), vsin))
+        else:
+            along = rng.random(k) * (right - left) + left
+            if wall == 'bottom':
+                parts.append((parents, along, np.full(k, top), vcos, np.abs(vsin)))
+            else:
+                parts.append((parents, along, np.full(k, bottom), vcos, -np.abs(vsin)))
+    if not parts:
+        return None
+    parents = np.concatenate([part[0] for part in parts])
+    spawns = {name: np.concatenate([part[i] for part in parts]) for i, name in enumerate(('x', 'y', 'vx', 'vy'), 1)}
+    spawns['mass'] = store.mass[parents].copy()
+    spawns['colors'] = store.colors[parents].copy()
+    spawns['tracer'] = store.tracer[parents].copy()
+    # Numbered names give each spawn its parent's prefix and its own id
+    spawns['names'] = (store.name_codes[parents], store.numbered[parents])
+    return spawns
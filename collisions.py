@@ -0,0 +1,157 @@
+import numpy as np
+
+# Bodies up to this radius percentile share the finest grid level; larger
+# ones go to coarser levels whose cells double in size
+SMALL_RADIUS_PERCENTILE = 90
+
+
+def cell_keys(cx, cy):
+    return (cx << 32) + cy
+
+
+def runs(sorted_keys):
+    # Distinct keys of a sorted array with where each run starts and its length
+    starts = np.flatnonzero(np.diff(sorted_keys, prepend=sorted_keys[0] - 1))
+    return sorted_keys[starts], starts, np.diff(starts, append=len(sorted_keys))
+
+
+def find_overlaps(x, y, radius):
+    # Broad phase on a hierarchy of uniform grids, followed by the exact
+    # distance test. Each body is bucketed once, at the finest level whose
+    # cells are at least its diameter, so a level's cells double in size
+    # from the one below. A body looks for partners at its own level and the
+    # coarser ones, in the cells its disc reaches when grown by the largest
+    # radius there: at most 3x3 cells, usually 2x2. Returns sorted (i, j)
+    # index pairs with i < j.
+    n = len(x)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    cell = 2 * float(np.percentile(radius, SMALL_RADIUS_PERCENTILE))
+    if cell <= 0:
+        cell = max(2 * float(np.max(radius)), 1.0)
+    level = np.ceil(np.log2(np.maximum(2 * radius / cell, 1))).astype(np.int64)
+    level += 2 * radius > cell * 2.0 ** level  # Rounding in log2
+    x = x - float(np.min(x))
+    y = y - float(np.min(y))
+
+    candidates_i, candidates_j = [], []
+    for depth in np.unique(level).tolist():
+        size = cell * 2.0 ** depth
+        members = np.flatnonzero(level == depth)
+        keys = cell_keys((x[members] // size).astype(np.int64), (y[members] // size).astype(np.int64))
+        order = np.argsort(keys, kind='stable')
+        bucket_keys, bucket_starts, bucket_counts = runs(keys[order])
+        bucket_bodies = members[order]
+
+        queries = np.flatnonzero(level <= depth)
+        reach = radius[queries] + float(np.max(radius[members]))
+        low_x = ((x[queries] - reach) // size).astype(np.int64)
+        low_y = ((y[queries] - reach) // size).astype(np.int64)
+        high_x = ((x[queries] + reach) // size).astype(np.int64)
+        high_y = ((y[queries] + reach) // size).astype(np.int64)
+        if 9 * len(bucket_keys) < len(queries):
+            # Sparse level: drop bodies with no occupied cell around them first
+            bx, by = bucket_keys >> 32, bucket_keys & 0xFFFFFFFF
+            near = np.sort(np.concatenate([cell_keys(bx + ox, by + oy) for ox in (-1, 0, 1) for oy in (-1, 0, 1)]))
+            centre = cell_keys((x[queries] // size).astype(np.int64), (y[queries] // size).astype(np.int64))
+            close = near[np.minimum(np.searchsorted(near, centre), len(near) - 1)] == centre
+            queries, low_x, low_y, high_x, high_y = (queries[close], low_x[close], low_y[close], high_x[close],
+                                                     high_y[close])
+
+        for ox in (0, 1, 2):
+            for oy in (0, 1, 2):
+                # Pair every query body with every member in this cell of its range
+                inside = (low_x + ox <= high_x) & (low_y + oy <= high_y)
+                query_keys = cell_keys(low_x[inside] + ox, low_y[inside] + oy)
+                slot = np.minimum(np.searchsorted(bucket_keys, query_keys), len(bucket_keys) - 1)
+                found = bucket_keys[slot] == query_keys
+                slot = slot[found]
+                counts = bucket_counts[slot]
+                i = np.repeat(queries[inside][found], counts)
+                offsets = np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+                j = bucket_bodies[np.repeat(bucket_starts[slot], counts) + offsets]
+                # Within a level each pair is seen from both ends, keep one
+                keep = (level[i] < depth) | (i < j)
+                candidates_i.append(np.minimum(i[keep], j[keep]))
+                candidates_j.append(np.maximum(i[keep], j[keep]))
+
+    i = np.concatenate(candidates_i)
+    j = np.concatenate(candidates_j)
+    dx = x[i] - x[j]
+    dy = y[i] - y[j]
+    reach = radius[i] + radius[j]
+    hit = dx * dx + dy * dy < reach * reach
+    # Every pair is found exactly once, so sorting is all that is left
+    i, j = i[hit], j[hit]
+    order = np.argsort(i * n + j)
+    return np.column_stack((i[order], j[order]))
+
+
+def merge_groups(pairs, mass, ids):
+    # Union-find over overlapping pairs. Each connected group collapses into
+    # its most massive member (lowest id on ties), so every body is absorbed
+    # at most once and the outcome does not depend on pair order.
+    parent = {}
+
+    def find(body):
+        root = body
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while body != root:
+            parent[body], body = root, parent[body]
+        return root
+
+    def rank(body):
+        return mass[body], -ids[body]
+
+    for i, j in pairs.tolist():
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j:
+            continue
+        if rank(root_i) >= rank(root_j):
+            parent[root_j] = root_i
+        else:
+            parent[root_i] = root_j
+
+    absorbers = []
+    absorbed = []
+    for body in sorted(parent):
+        root = find(body)
+        if root != body:
+            absorbers.append(root)
+            absorbed.append(body)
+    return np.array(absorbers, dtype=np.int64), np.array(absorbed, dtype=np.int64)
+
+
+def merge_overlapping(store, pairs=None):
+    # Perfectly inelastic mergers: mass, momentum and centre of mass are conserved.
+    # pairs can be passed in when a force kernel already found the overlaps.
+    if pairs is None:
+        pairs = find_overlaps(store.x, store.y, store.radius)
+    if len(pairs) == 0:
+        return 0
+    absorbers, absorbed = merge_groups(pairs, store.mass, store.ids[:store.count])
+    groups = np.unique(absorbers)
+    members = np.concatenate((groups, absorbed))
+    owner = np.concatenate((groups, absorbers))
+    slot = np.searchsorted(groups, owner)
+
+    m = store.mass[members]
+    total = np.bincount(slot, weights=m)
+    px = np.bincount(slot, weights=m * store.vx[members])
+    py = np.bincount(slot, weights=m * store.vy[members])
+    mx = np.bincount(slot, weights=m * store.x[members])
+    my = np.bincount(slot, weights=m * store.y[members])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        store.vx[groups] = np.where(total > 0, px / total, store.vx[groups])
+        store.vy[groups] = np.where(total > 0, py / total, store.vy[groups])
+        store.x[groups] = np.where(total > 0, mx / total, store.x[groups])
+        store.y[groups] = np.where(total > 0, my / total, store.y[groups])
+    store.mass[groups] = total
+    store.radius[groups] = np.cbrt(total)
+    # A merger is a tracer only if all its members were
+    store.tracer[groups] = np.bincount(slot, weights=store.tracer[members] == 0) == 0
+
+    for body_id in store.ids[absorbed].tolist():
+        store.remove_id(body_id)
+    return len(absorbed)
@@ -0,0 +1,168 @@
+import numpy as np
+
+from gravity import DEFAULT_SOFTENING, potential_at
+
+SAMPLE_INTERVAL = 10  # Steps between conservation samples
+QUANTITIES = ('energy', 'px', 'py', 'angular_momentum', 'mass')
+COLUMNS = ('x', 'y', 'vx', 'vy', 'mass')
+
+
+def moments(x, y, vx, vy, mass):
+    # Kinetic energy, linear and angular momentum (about the origin) and mass
+    return {'kinetic': float(0.5 * np.sum(mass * (vx * vx + vy * vy))),
+            'px': float(np.sum(mass * vx)),
+            'py': float(np.sum(mass * vy)),
+            'angular_momentum': float(np.sum(mass * (x * vy - y * vx))),
+            'mass': float(np.sum(mass))}
+
+
+def pair_energy(x, y, mass, G, softening=DEFAULT_SOFTENING):
+    # Potential energy of a set of bodies among themselves
+    if len(x) < 2:
+        return 0.0
+    return float(0.5 * np.sum(mass * potential_at(x, y, x, y, mass, G, softening)))
+
+
+def massive_state(store, copy=False):
+    # Columns and ids of the massive bodies. Tracers exert no force, so
+    # nothing is conserved with them in the sums and they are left out.
+    tracer = store.tracer
+    if tracer.any():
+        massive = tracer == 0
+        state = {name: getattr(store, name)[massive] for name in COLUMNS}
+        state['ids'] = store.ids[:store.count][massive]
+        return state
+    state = {name: getattr(store, name) for name in COLUMNS}
+    state['ids'] = store.ids[:store.count]
+    if copy:
+        state = {name: column.copy() for name, column in state.items()}
+    return state
+
+
+def totals(simulation, potential=None, state=None):
+    # Conserved totals of the current state. potential is the per-body
+    # potential if a force pass already produced it at these positions,
+    # otherwise the potential energy costs one chunked O(N^2) sweep.
+    if state is None:
+        state = massive_state(simulation.particles)
+    result = moments(state['x'], state['y'], state['vx'], state['vy'], state['mass'])
+    if potential is None:
+        result['potential'] = pair_energy(state['x'], state['y'], state['mass'], simulation.G, simulation.softening)
+    else:
+        result['potential'] = float(0.5 * np.sum(state['mass'] * potential))
+    result['energy'] = result['kinetic'] + result['potential']
+    return result
+
+
+class ConservationMonitor:
+    # Tracks drift of energy, momentum and angular momentum against the first
+    # sample. Bodies changed outside the integrator within a step (merged by
+    # collide, clamped or spawned by the bounding box) are booked into a ledger
+    # incrementally, at O(changed * N) cost, so drift only measures the error
+    # of the force solver and integrator. Edits made between steps (new scene,
+    # added or deleted bodies, a change of G) start a fresh baseline.
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.steps = 0
+        self.samples = 0
+        self.initial = None
+        self.latest = None
+        self.ledger = dict.fromkeys(QUANTITIES, 0.0)
+        self.latest_ledger = self.ledger
+        self.scale = {}
+        self.state_key = None
+        self.before = None
+        self.before_version = None
+
+    def restart(self):
+        self.initial = None
+        self.latest = None
+        self.ledger = dict.fromkeys(QUANTITIES, 0.0)
+        self.steps = 0
+
+    def due(self):
+        return self.initial is None or self.steps % self.interval == 0
+
+    def begin_step(self, simulation):
+        if self.state_key != (simulation.particles.version, simulation.G):
+            self.restart()
+        if hasattr(simulation.solver, "track_potential"):
+            simulation.solver.track_potential = self.due()
+
+    def after_integrate(self, simulation):
+        # Sample at the positions of the closing force evaluation, then keep a
+        # copy of the state so the changes made by collisions can be booked
+        store = simulation.particles
+        state = massive_state(store, copy=True)
+        if self.due() and len(state['ids']):
+            potential = None
+            if hasattr(simulation.solver, "potential_for"):
+                potential = simulation.solver.potential_for(state['x'], state['y'])
+            self.sample(totals(simulation, potential, state), state)
+        self.steps += 1
+        self.before = state
+        self.before_version = store.version
+
+    def sample(self, values, state):
+        self.samples += 1
+        if self.initial is None:
+            self.initial = values
+            self.ledger = dict.fromkeys(QUANTITIES, 0.0)
+            mass = state['mass']
+            speed = np.hypot(state['vx'], state['vy'])
+            self.scale = {'energy': abs(values['energy']) or 1.0,
+                          'momentum': float(np.sum(mass * speed)) or 1.0,
+                          'angular_momentum': float(np.sum(mass * np.hypot(state['x'], state['y']) * speed)) or 1.0,
+                          'mass': values['mass'] or 1.0}
+        # Events booked after this sample belong to the next one
+        self.latest = values
+        self.latest_ledger = dict(self.ledger)
+
+    def after_events(self, simulation):
+        store = simulation.particles
+        if store.version != self.before_version:
+            self.book_changes(simulation)
+        self.before = None
+        self.state_key = (store.version, simulation.G)
+
+    def book_changes(self, simulation):
+        # Bodies that vanished or changed count as removed, bodies that
+        # appeared or changed as added; unchanged bodies are the shared rest
+        before = self.before
+        after = massive_state(simulation.particles)
+        common, old_slot, new_slot = np.intersect1d(before['ids'], after['ids'], return_indices=True)
+        same = np.ones(len(common), dtype=bool)
+        for name in COLUMNS:
+            same &= before[name][old_slot] == after[name][new_slot]
+        removed = np.setdiff1d(np.arange(len(before['ids'])), old_slot[same])
+        added = np.setdiff1d(np.arange(len(after['ids'])), new_slot[same])
+        kept = new_slot[same]
+
+        def part(state, slots):
+            return [state[name][slots] for name in COLUMNS]
+
+        def energy(state, slots):
+            x, y, vx, vy, mass = part(state, slots)
+            values = moments(x, y, vx, vy, mass)
+            shared = potential_at(x, y, after['x'][kept], after['y'][kept], after['mass'][kept],
+                                  simulation.G, simulation.softening)
+            values['energy'] = (values['kinetic'] + float(np.sum(mass * shared))
+                                + pair_energy(x, y, mass, simulation.G, simulation.softening))
+            return values
+
+        gained, lost = energy(after, added), energy(before, removed)
+        for quantity in QUANTITIES:
+            self.ledger[quantity] += gained[quantity] - lost[quantity]
+
+    def drift(self):
+        # Relative drift of each conserved quantity net of the ledger, or None before the first sample
+        if self.initial is None or self.latest is None:
+            return None
+        initial, latest, ledger = self.initial, self.latest, self.latest_ledger
+        momentum = np.hypot(latest['px'] - initial['px'] - ledger['px'],
+                            latest['py'] - initial['py'] - ledger['py'])
+        return {'energy': (latest['energy'] - initial['energy'] - ledger['energy']) / self.scale['energy'],
+                'momentum': float(momentum) / self.scale['momentum'],
+                'angular_momentum': (latest['angular_momentum'] - initial['angular_momentum']
+                                     - ledger['angular_momentum']) / self.scale['angular_momentum'],
+                'mass': (latest['mass'] - initial['mass'] - ledger['mass']) / self.scale['mass']}
@@ -0,0 +1,324 @@
+import numpy as np
+
+# Upper bound on the number of pair interactions evaluated at once, so the
+# temporaries of a chunk stay around a few tens of MB regardless of N
+PAIR_BUDGET = 1 << 22
+
+# Quadtree cells are addressed by interleaved (Morton) keys of this many levels
+MAX_DEPTH = 16
+LEAF_SIZE = 8
+DEFAULT_THETA = 0.5
+
+# Plummer softening length: forces go as G*m*r / (r² + eps²)^(3/2), so near
+# misses stay finite. 0 is the bare inverse-square law.
+DEFAULT_SOFTENING = 0.0
+
+
+class DirectSolver:
+    supports_targets = True
+
+    def __init__(self, pair_budget=PAIR_BUDGET, softening=DEFAULT_SOFTENING):
+        self.pair_budget = pair_budget
+        self.softening = softening
+        # With track_potential set, each evaluation also keeps the per-body
+        # potential from the same distances, see potential_for
+        self.track_potential = False
+        self.potential = None
+        self.potential_x = None
+        self.potential_y = None
+
+    def chunk_rows(self, n):
+        return max(1, self.pair_budget // max(n, 1))
+
+    def accelerations(self, x, y, mass, G, targets=None):
+        # With targets given, only those rows are evaluated (ax/ay are still length N)
+        n = len(x)
+        ax = np.zeros(n)
+        ay = np.zeros(n)
+        potential = None
+        if self.track_potential and targets is None:
+            potential = np.zeros(n)
+        if targets is None:
+            targets = np.arange(n)
+        rows = self.chunk_rows(n)
+        for start in range(0, len(targets), rows):
+            chunk = targets[start:start + rows]
+            ax[chunk], ay[chunk] = self.rows(x, y, mass, G, chunk, potential)
+        if potential is not None:
+            self.potential, self.potential_x, self.potential_y = potential, x.copy(), y.copy()
+        return ax, ay
+
+    def potential_for(self, x, y):
+        # Per-body potential from the last evaluation, if it was made at exactly these positions
+        return matching_potential(self, x, y)
+
+    def rows(self, x, y, mass, G, chunk, potential=None):
+        # Rows are the particles being accelerated, columns the sources
+        dx = x[np.newaxis, :] - x[chunk, np.newaxis]
+        dy = y[np.newaxis, :] - y[chunk, np.newaxis]
+        r = np.sqrt(dx * dx + dy * dy + self.softening * self.softening)
+        r[np.arange(len(chunk)), chunk] = np.inf  # No self-interaction
+
+        # G * m / r² along the unit vector, coincident bodies contribute nothing
+        with np.errstate(divide='ignore'):
+            inv_r3 = np.where(r > 0, 1 / (r * r * r), 0)
+        weight = G * mass[np.newaxis, :] * inv_r3
+        if potential is not None:
+            with np.errstate(divide='ignore'):
+                potential[chunk] = -G * (np.where(r > 0, 1 / r, 0) @ mass)
+        return np.sum(weight * dx, axis=1), np.sum(weight * dy, axis=1)
+
+    def accelerations_and_jerk(self, x, y, vx, vy, mass, G):
+        # Accelerations plus their time derivative, for Hermite integration
+        n = len(x)
+        ax, ay, jx, jy = np.zeros(n), np.zeros(n), np.zeros(n), np.zeros(n)
+        rows = self.chunk_rows(n)
+        for start in range(0, n, rows):
+            chunk = np.arange(start, min(start + rows, n))
+            dx = x[np.newaxis, :] - x[chunk, np.newaxis]
+            dy = y[np.newaxis, :] - y[chunk, np.newaxis]
+            dvx = vx[np.newaxis, :] - vx[chunk, np.newaxis]
+            dvy = vy[np.newaxis, :] - vy[chunk, np.newaxis]
+            r2 = dx * dx + dy * dy + self.softening * self.softening
+            r2[np.arange(len(chunk)), chunk] = np.inf  # No self-interaction
+            with np.errstate(divide='ignore'):
+                inv_r2 = np.where(r2 > 0, 1 / r2, 0)
+            weight = G * mass[np.newaxis, :] * inv_r2 * np.sqrt(inv_r2)
+            rv = 3 * (dx * dvx + dy * dvy) * inv_r2
+            ax[chunk] = np.sum(weight * dx, axis=1)
+            ay[chunk] = np.sum(weight * dy, axis=1)
+            jx[chunk] = np.sum(weight * (dvx - rv * dx), axis=1)
+            jy[chunk] = np.sum(weight * (dvy - rv * dy), axis=1)
+        return ax, ay, jx, jy
+
+
+def matching_potential(solver, x, y):
+    if solver.potential is None or len(solver.potential) != len(x):
+        return None
+    if not (np.array_equal(solver.potential_x, x) and np.array_equal(solver.potential_y, y)):
+        return None
+    return solver.potential
+
+
+def potential_at(tx, ty, sx, sy, smass, G, softening=DEFAULT_SOFTENING, pair_budget=PAIR_BUDGET):
+    # Potential -G * sum(m / sqrt(r² + eps²)) at the target points due to the
+    # sources. Coincident points contribute nothing, as in the force kernels.
+    potential = np.zeros(len(tx))
+    rows = max(1, pair_budget // max(len(sx), 1))
+    for start in range(0, len(tx), rows):
+        dx = sx[np.newaxis, :] - tx[start:start + rows, np.newaxis]
+        dy = sy[np.newaxis, :] - ty[start:start + rows, np.newaxis]
+        r2 = dx * dx + dy * dy
+        with np.errstate(divide='ignore'):
+            inv_r = np.where(r2 > 0, 1 / np.sqrt(r2 + softening * softening), 0)
+        potential[start:start + rows] = -G * (inv_r @ smass)
+    return potential
+
+
+def acceleration_at(tx, ty, sx, sy, smass, G, softening=DEFAULT_SOFTENING, pair_budget=PAIR_BUDGET):
+    # Acceleration at the target points due to the sources, which need not be
+    # among them, e.g. tracers in the field of the massive bodies
+    ax = np.zeros(len(tx))
+    ay = np.zeros(len(tx))
+    rows = max(1, pair_budget // max(len(sx), 1))
+    for start in range(0, len(tx), rows):
+        dx = sx[np.newaxis, :] - tx[start:start + rows, np.newaxis]
+        dy = sy[np.newaxis, :] - ty[start:start + rows, np.newaxis]
+        r2 = dx * dx + dy * dy
+        s2 = r2 + softening * softening
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(r2 > 0, G * smass / (s2 * np.sqrt(s2)), 0)
+        ax[start:start + rows] = np.sum(weight * dx, axis=1)
+        ay[start:start + rows] = np.sum(weight * dy, axis=1)
+    return ax, ay
+
+
+def morton_keys(ix, iy):
+    # Interleave the bits of two 16-bit cell coordinates, x in the even bits
+    keys = np.zeros(len(ix), dtype=np.int64)
+    for bit in range(MAX_DEPTH):
+        keys |= ((ix >> bit) & 1) << (2 * bit)
+        keys |= ((iy >> bit) & 1) << (2 * bit + 1)
+    return keys
+
+
+class QuadTree:
+    # Linear quadtree over Morton-sorted particles. Every node covers a
+    # contiguous range [start, end) of the sorted order, so node masses and
+    # centres of mass come straight from prefix sums.
+    def __init__(self, x, y, mass, leaf_size=LEAF_SIZE):
+        n = len(x)
+        min_x, min_y = float(np.min(x)), float(np.min(y))
+        side = max(float(np.max(x)) - min_x, float(np.max(y)) - min_y)
+        side = side * (1 + 1e-9) if side > 0 else 1.0
+        cells = 1 << MAX_DEPTH
+        ix = np.minimum(((x - min_x) / side * cells).astype(np.int64), cells - 1)
+        iy = np.minimum(((y - min_y) / side * cells).astype(np.int64), cells - 1)
+        keys = morton_keys(ix, iy)
+        self.order = np.argsort(keys, kind='stable')
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[self.order] = np.arange(n)
+        keys = keys[self.order]
+
+        sorted_mass = mass[self.order]
+        cum_mass = np.concatenate(([0.0], np.cumsum(sorted_mass)))
+        cum_mx = np.concatenate(([0.0], np.cumsum(sorted_mass * x[self.order])))
+        cum_my = np.concatenate(([0.0], np.cumsum(sorted_mass * y[self.order])))
+        cum_x = np.concatenate(([0.0], np.cumsum(x[self.order])))
+        cum_y = np.concatenate(([0.0], np.cumsum(y[self.order])))
+
+        starts, ends, levels, children = [np.array([0])], [np.array([n])], [np.array([0])], []
+        prefixes = np.array([0], dtype=np.int64)
+        level_starts, level_ends = np.array([0]), np.array([n])
+        node_count = 1
+        for level in range(MAX_DEPTH):
+            level_children = np.full((len(level_starts), 4), -1, dtype=np.int64)
+            split = np.nonzero(level_ends - level_starts > leaf_size)[0]
+            if len(split) == 0:
+                children.append(level_children)
+                break
+            shift = 2 * (MAX_DEPTH - level - 1)
+            child_prefixes = (prefixes[split, np.newaxis] << 2) + np.arange(4)
+            bounds = np.searchsorted(keys, child_prefixes << shift)
+            bounds = np.clip(bounds, level_starts[split, np.newaxis], level_ends[split, np.newaxis])
+            bounds = np.concatenate((bounds, level_ends[split, np.newaxis]), axis=1)
+            child_starts, child_ends = bounds[:, :4], bounds[:, 1:]
+            occupied = child_ends > child_starts
+            new_ids = node_count + np.cumsum(occupied.ravel()) - 1
+            level_children[split] = np.where(occupied, new_ids.reshape(occupied.shape), -1)
+            children.append(level_children)
+
+            level_starts, level_ends = child_starts[occupied], child_ends[occupied]
+            prefixes = child_prefixes[occupied]
+            node_count += len(level_starts)
+            starts.append(level_starts)
+            ends.append(level_ends)
+            levels.append(np.full(len(level_starts), level + 1))
+        else:
+            children.append(np.full((len(level_starts), 4), -1, dtype=np.int64))
+
+        self.start = np.concatenate(starts)
+        self.end = np.concatenate(ends)
+        self.children = np.concatenate(children)
+        self.size = side / (1 << np.concatenate(levels))
+        self.is_leaf = np.all(self.children < 0, axis=1)
+        self.mass = cum_mass[self.end] - cum_mass[self.start]
+        count = self.end - self.start
+        # Massless nodes fall back to their geometric centroid
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.com_x = np.where(self.mass > 0, (cum_mx[self.end] - cum_mx[self.start]) / self.mass,
+                                  (cum_x[self.end] - cum_x[self.start]) / count)
+            self.com_y = np.where(self.mass > 0, (cum_my[self.end] - cum_my[self.start]) / self.mass,
+                                  (cum_y[self.end] - cum_y[self.start]) / count)
+
+
+class BarnesHutSolver:
+    # O(N log N) approximation: a node is treated as a point mass at its centre
+    # of mass when size / distance < theta, otherwise it is opened
+    supports_targets = True
+
+    def __init__(self, theta=DEFAULT_THETA, leaf_size=LEAF_SIZE, chunk_size=4096, softening=DEFAULT_SOFTENING):
+        self.theta = theta
+        self.softening = softening
+        self.leaf_size = leaf_size
+        self.chunk_size = chunk_size
+        self.track_potential = False
+        self.potential = None
+        self.potential_x = None
+        self.potential_y = None
+
+    def potential_for(self, x, y):
+        return matching_potential(self, x, y)
+
+    def accelerations(self, x, y, mass, G, targets=None):
+        # With targets given, only those rows are evaluated (ax/ay are still length N)
+        n = len(x)
+        ax = np.zeros(n)
+        ay = np.zeros(n)
+        if n == 0:
+            return ax, ay
+        tree = QuadTree(x, y, mass, self.leaf_size)
+        theta2 = self.theta * self.theta
+        eps2 = self.softening * self.softening
+        potential = np.zeros(n) if self.track_potential and targets is None else None
+        # Targets in tree order, so each chunk is spatially coherent
+        order = tree.order if targets is None else targets[np.argsort(tree.rank[targets], kind='stable')]
+
+        for chunk_start in range(0, len(order), self.chunk_size):
+            # Walk the tree for a block of spatially adjacent targets at once
+            target = order[chunk_start:chunk_start + self.chunk_size]
+            node = np.zeros(len(target), dtype=np.int64)
+            hit, fx, fy, phi = [], [], [], []
+            while len(target):
+                dx = tree.com_x[node] - x[target]
+                dy = tree.com_y[node] - y[target]
+                r2 = dx * dx + dy * dy
+                rank = tree.rank[target]
+                inside = (tree.start[node] <= rank) & (rank < tree.end[node])
+                far = ~inside & (tree.size[node] ** 2 < theta2 * r2)
+
+                r = np.sqrt(r2[far] + eps2)
+                weight = G * tree.mass[node[far]] / (r * r * r)
+                hit.append(target[far])
+                fx.append(weight * dx[far])
+                fy.append(weight * dy[far])
+                phi.append(-weight * r * r)
+
+                # Leaves that are too close are summed body by body
+                near_leaf = ~far & tree.is_leaf[node]
+                leaf_nodes, leaf_targets = node[near_leaf], target[near_leaf]
+                counts = tree.end[leaf_nodes] - tree.start[leaf_nodes]
+                i = np.repeat(leaf_targets, counts)
+                offsets = np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+                j = tree.order[np.repeat(tree.start[leaf_nodes], counts) + offsets]
+                keep = i != j
+                i, j = i[keep], j[keep]
+                pdx = x[j] - x[i]
+                pdy = y[j] - y[i]
+                pr2 = pdx * pdx + pdy * pdy
+                pr = np.sqrt(pr2 + eps2)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    pweight = np.where(pr2 > 0, G * mass[j] / (pr * pr * pr), 0)
+                hit.append(i)
+                fx.append(pweight * pdx)
+                fy.append(pweight * pdy)
+                phi.append(-pweight * pr * pr)
+
+                # Everything else descends into its occupied children
+                opened = ~far & ~tree.is_leaf[node]
+                child = tree.children[node[opened]]
+                occupied = child >= 0
+                target = np.repeat(target[opened], occupied.sum(axis=1))
+                node = child[occupied]
+
+            hit = np.concatenate(hit)
+            ax += np.bincount(hit, weights=np.concatenate(fx), minlength=n)
+            ay += np.bincount(hit, weights=np.concatenate(fy), minlength=n)
+            if potential is not None:
+                potential += np.bincount(hit, weights=np.concatenate(phi), minlength=n)
+        if potential is not None:
+            self.potential, self.potential_x, self.potential_y = potential, x.copy(), y.copy()
+        return ax, ay
+
+
+def force_error(solver, x, y, mass, G, sample=1000, seed=0):
+    # Relative acceleration error of solver against the exact direct sum,
+    # measured on a random sample of targets so it stays cheap for large N
+    n = len(x)
+    if n < 2:
+        return {'rms': 0.0, 'median': 0.0, 'max': 0.0}
+    targets = np.arange(n)
+    if n > sample:
+        targets = np.sort(np.random.default_rng(seed).choice(n, sample, replace=False))
+    ax, ay = solver.accelerations(x, y, mass, G)
+    ref_x, ref_y = DirectSolver(softening=getattr(solver, 'softening', DEFAULT_SOFTENING)).accelerations(
+        x, y, mass, G, targets)
+    ref = np.hypot(ref_x[targets], ref_y[targets])
+    err = np.hypot(ax[targets] - ref_x[targets], ay[targets] - ref_y[targets])
+    valid = ref > 0
+    relative = err[valid] / ref[valid]
+    if len(relative) == 0:
+        return {'rms': 0.0, 'median': 0.0, 'max': 0.0}
+    return {'rms': float(np.sqrt(np.mean(relative ** 2))),
+            'median': float(np.median(relative)),
+            'max': float(np.max(relative))}
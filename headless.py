@@ -0,0 +1,164 @@
+import argparse
+import time
+
+from gravity import DEFAULT_SOFTENING, DEFAULT_THETA
+from integrators import INTEGRATORS
+from mesh import DEFAULT_GRID
+from scenarios import SCENARIOS
+from simulation import DEFAULT_G, DT_NORM, GRAVITY_MODES, MAX_PARTICLES, Simulation
+from trajectory import DEFAULT_FIELDS
+
+PRESETS = {
+    'three-body': Simulation.create_three_body_system,
+    'star-system': Simulation.create_star_system,
+    'grid': Simulation.create_grid,
+    'random': Simulation.create_random_scene,
+}
+# Presets whose light bodies can be made tracers
+TRACER_PRESETS = ('star-system', 'disk', 'galaxies', 'hierarchical')
+# Settings a snapshot also holds. Their flags default to None, so --resume
+# keeps the snapshot's value unless one is given explicitly.
+SETTING_DEFAULTS = {
+    'G': DEFAULT_G,
+    'gravity': "direct",
+    'theta': DEFAULT_THETA,
+    'mesh_grid': DEFAULT_GRID,
+    'softening': DEFAULT_SOFTENING,
+    'integrator': "leapfrog",
+    'max_particles': MAX_PARTICLES,
+    'tracer_collisions': False,
+}
+
+
+def apply_settings(simulation, settings):
+    # Applies the settings that are not None. The gravity mode goes last so
+    # its solver is built with the theta, mesh and softening given here.
+    if settings['G'] is not None:
+        simulation.G = settings['G']
+    if settings['theta'] is not None:
+        simulation.set_theta(settings['theta'])
+    if settings['mesh_grid'] is not None:
+        simulation.set_mesh_grid(settings['mesh_grid'])
+    if settings['softening'] is not None:
+        simulation.set_softening(settings['softening'])
+    if settings['gravity'] is not None and settings['gravity'] != simulation.gravity_mode:
+        simulation.set_gravity_mode(settings['gravity'])
+    if settings['integrator'] is not None:
+        simulation.set_integrator(settings['integrator'])
+    if settings['max_particles'] is not None:
+        simulation.max_particles = settings['max_particles']
+    if settings['tracer_collisions'] is not None:
+        simulation.tracer_collisions = settings['tracer_collisions']
+
+
+def run(simulation, steps, dt, checkpoint_every=0, checkpoint_path=None):
+    # Steps back to back with no display, events or frame throttling. Each
+    # step covers dt through advance_time, as a rendered frame would, so
+    # shorter substeps, the substep cap and dropped time all apply here too:
+    # Hermite's own timestep, for one, splits dt. Returns the wall time and
+    # the number of substeps taken.
+    simulation.max_dt = dt
+    substeps = 0
+    start = time.perf_counter()
+    for step in range(1, steps + 1):
+        simulation.profiler.begin_frame()
+        simulation.advance_time(dt)
+        simulation.profiler.end_frame()
+        substeps += simulation.substeps
+        if checkpoint_every and step % checkpoint_every == 0:
+            simulation.save_snapshot(checkpoint_path)
+    return time.perf_counter() - start, substeps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the gravity simulation without a display")
+    parser.add_argument("--preset", choices=sorted(PRESETS) + sorted(SCENARIOS), default="star-system")
+    parser.add_argument("--bodies", type=int, default=10000, help="body count for the generated scenarios")
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--dt", type=float, default=DT_NORM)
+    # Defaults for these are in SETTING_DEFAULTS
+    parser.add_argument("--G", type=float)
+    parser.add_argument("--gravity", choices=GRAVITY_MODES)
+    parser.add_argument("--theta", type=float)
+    parser.add_argument("--mesh-grid", type=int, help="mesh cells per side for --gravity pm/p3m")
+    parser.add_argument("--softening", type=float, help="Plummer softening length")
+    parser.add_argument("--integrator", choices=sorted(INTEGRATORS))
+    parser.add_argument("--workers", type=int, default=None, help="processes for --gravity parallel")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--tracers", action="store_true",
+                        help="make the disk bodies of the " + ", ".join(TRACER_PRESETS) + " presets tracers")
+    parser.add_argument("--tracer-collisions", action="store_true", default=None, help="let tracers merge")
+    parser.add_argument("--max-particles", type=int, help="cull explosion spawns above this many bodies")
+    parser.add_argument("--resume", help="start from this snapshot instead of a preset; settings given "
+                                         "explicitly, and --seed, override the snapshot's")
+    parser.add_argument("--output", help="write the final state to this snapshot file")
+    parser.add_argument("--record", help="stream a trajectory to this file while running")
+    parser.add_argument("--record-stride", type=int, default=1, help="record every this many steps")
+    parser.add_argument("--record-fields", default=",".join(DEFAULT_FIELDS),
+                        help="comma-separated particle fields to record")
+    parser.add_argument("--float32", action="store_true", help="record floats as float32")
+    parser.add_argument("--compress", action="store_true", help="zlib-compress recorded chunks")
+    parser.add_argument("--monitor", type=int, default=0, metavar="STEPS",
+                        help="track energy and momentum drift, sampled every this many steps")
+    parser.add_argument("--profile", action="store_true", help="print per-phase step timings and counters")
+    parser.add_argument("--checkpoint-every", type=int, default=0,
+                        help="also save the --output snapshot every this many steps")
+    args = parser.parse_args(argv)
+    if args.tracers and args.preset not in TRACER_PRESETS:
+        parser.error("--tracers needs one of the presets " + ", ".join(TRACER_PRESETS))
+
+    settings = {name: getattr(args, name) for name in SETTING_DEFAULTS}
+    if not args.resume:
+        settings = {name: SETTING_DEFAULTS[name] if value is None else value for name, value in settings.items()}
+    simulation = Simulation(seed=args.seed, workers=args.workers)
+    if args.resume:
+        simulation.load_snapshot(args.resume)
+        if args.seed is not None:
+            simulation.random.seed(args.seed)
+    apply_settings(simulation, settings)
+    if not args.resume:
+        options = {'tracers': True} if args.tracers else {}
+        if args.preset in SCENARIOS:
+            SCENARIOS[args.preset](simulation, args.bodies, **options)
+        else:
+            PRESETS[args.preset](simulation, **options)
+    bodies = len(simulation.particles)
+    simulation.profiler.window = max(args.steps, 1)
+    simulation.profiler.set_enabled(args.profile)
+    if args.monitor:
+        simulation.start_monitor(interval=args.monitor)
+    if args.record:
+        simulation.start_recording(args.record, fields=args.record_fields.split(","), stride=args.record_stride,
+                                   float32=args.float32, compress=args.compress)
+
+    elapsed, substeps = run(simulation, args.steps, args.dt, args.checkpoint_every if args.output else 0, args.output)
+    recorder = simulation.recorder
+    simulation.stop_recording()
+    simulation.close()
+
+    if args.output:
+        simulation.save_snapshot(args.output)
+    print(f"{args.steps} steps of {bodies} bodies ({len(simulation.particles)} after mergers) "
+          f"in {elapsed:.2f} s: {args.steps / elapsed:.1f} steps/s, "
+          f"{simulation.force_evaluations / max(args.steps, 1):.2f} force evaluations/step")
+    if substeps > args.steps:
+        print(f"  {substeps / args.steps:.2f} substeps/step, the integrator's timestep is below --dt")
+    if recorder is not None and recorder.frames_dropped:
+        print(f"  {recorder.frames_dropped} of {recorder.frames_written + recorder.frames_dropped} trajectory frames "
+              f"dropped, the disk could not keep up")
+    if simulation.dropped_time:
+        print(f"  {simulation.dropped_time:.4g} s of simulated time dropped at the substep cap")
+    drift = simulation.monitor.drift() if simulation.monitor is not None else None
+    if drift is not None:
+        print(f"  drift: energy {drift['energy']:+.3e}, momentum {drift['momentum']:.3e}, "
+              f"angular momentum {drift['angular_momentum']:+.3e}")
+    if args.profile:
+        for phase, stats in simulation.profiler.phase_stats().items():
+            print(f"  {phase:<10} mean {stats['mean']:.3f} ms, p50 {stats['p50']:.3f}, "
+                  f"p95 {stats['p95']:.3f}, max {stats['max']:.3f}")
+        for counter, stats in simulation.profiler.counter_stats().items():
+            print(f"  {counter:<18} {stats['per_frame']:.4g}/step, {stats['total']} total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import numpy as np
+
+from gravity import DirectSolver
+
+# Yoshida's 4th-order composition of three leapfrog steps
+YOSHIDA_W1 = 1 / (2 - 2 ** (1 / 3))
+YOSHIDA_W0 = -2 ** (1 / 3) * YOSHIDA_W1
+
+# Aarseth's timestep criterion for Hermite: the accuracy parameter for the
+# full form with snap and crackle, and for the a/jerk form used on the first
+# step and after anything changes the bodies between steps
+HERMITE_ETA = 0.02
+HERMITE_ETA_START = 0.01
+
+# Block timesteps: a body's step is the global step halved up to this many times
+MAX_BLOCK_LEVEL = 10
+
+
+class Leapfrog:
+    # Kick-drift-kick velocity Verlet. Every particle is advanced from the same
+    # snapshot, and the closing force evaluation is reused as the next step's
+    # opening kick, so a step costs one evaluation.
+    name = "Leapfrog"
+    force_evaluations = 1
+
+    def step(self, simulation, dt):
+        store = simulation.particles
+        ax, ay = simulation.cached_accelerations()
+        store.vx += 0.5 * ax * dt
+        store.vy += 0.5 * ay * dt
+        store.x += store.vx * dt
+        store.y += store.vy * dt
+        ax, ay = simulation.evaluate_forces(store.x, store.y)
+        store.vx += 0.5 * ax * dt
+        store.vy += 0.5 * ay * dt
+        simulation.store_accelerations(ax, ay)
+
+
+class Yoshida4:
+    name = "Yoshida 4"
+    force_evaluations = 3
+
+    def step(self, simulation, dt):
+        store = simulation.particles
+        ax, ay = simulation.cached_accelerations()
+        for weight in (YOSHIDA_W1, YOSHIDA_W0, YOSHIDA_W1):
+            store.vx += 0.5 * weight * ax * dt
+            store.vy += 0.5 * weight * ay * dt
+            store.x += weight * store.vx * dt
+            store.y += weight * store.vy * dt
+            ax, ay = simulation.evaluate_forces(store.x, store.y)
+            store.vx += 0.5 * weight * ax * dt
+            store.vy += 0.5 * weight * ay * dt
+        simulation.store_accelerations(ax, ay)
+
+
+class RungeKutta4:
+    # Classic RK4 on (x, v). Not symplectic, so energy drifts secularly, but
+    # it is accurate per step. Three stages plus the end-of-step evaluation
+    # that the next step starts from.
+    name = "RK4"
+    force_evaluations = 4
+
+    def step(self, simulation, dt):
+        store = simulation.particles
+        x0, y0 = store.x.copy(), store.y.copy()
+        vx0, vy0 = store.vx.copy(), store.vy.copy()
+        k1_ax, k1_ay = simulation.cached_accelerations()
+        k1_ax, k1_ay = k1_ax.copy(), k1_ay.copy()
+
+        k2_vx, k2_vy = vx0 + 0.5 * dt * k1_ax, vy0 + 0.5 * dt * k1_ay
+        k2_ax, k2_ay = simulation.evaluate_forces(x0 + 0.5 * dt * vx0, y0 + 0.5 * dt * vy0)
+        k3_vx, k3_vy = vx0 + 0.5 * dt * k2_ax, vy0 + 0.5 * dt * k2_ay
+        k3_ax, k3_ay = simulation.evaluate_forces(x0 + 0.5 * dt * k2_vx, y0 + 0.5 * dt * k2_vy)
+        k4_vx, k4_vy = vx0 + dt * k3_ax, vy0 + dt * k3_ay
+        k4_ax, k4_ay = simulation.evaluate_forces(x0 + dt * k3_vx, y0 + dt * k3_vy)
+
+        store.x[:] = x0 + dt / 6 * (vx0 + 2 * k2_vx + 2 * k3_vx + k4_vx)
+        store.y[:] = y0 + dt / 6 * (vy0 + 2 * k2_vy + 2 * k3_vy + k4_vy)
+        store.vx[:] = vx0 + dt / 6 * (k1_ax + 2 * k2_ax + 2 * k3_ax + k4_ax)
+        store.vy[:] = vy0 + dt / 6 * (k1_ay + 2 * k2_ay + 2 * k3_ay + k4_ay)
+        simulation.store_accelerations(*simulation.evaluate_forces(store.x, store.y))
+
+
+class Hermite4:
+    # Fourth-order predictor-corrector using accelerations and their time
+    # derivative (jerk). Jerk needs relative velocities, so this scheme
+    # always evaluates with the direct-sum kernel whatever the gravity mode,
+    # with tracers as massless sources rather than split off. A fixed step
+    # diverges through close encounters and wall bounces, so timestep() gives
+    # Simulation.step_limit a shared step from Aarseth's criterion.
+    name = "Hermite 4"
+    force_evaluations = 1
+
+    def __init__(self):
+        self.kernel = DirectSolver()
+        self.jerk = None
+        self.snap = None
+        self.crackle = None
+        self.version = None
+
+    def start(self, simulation):
+        # Accelerations and jerk at the current state, unless the last step left them
+        store = simulation.particles
+        if self.version == simulation.forces_key() and simulation.forces_version == self.version:
+            return store.ax.copy(), store.ay.copy(), *self.jerk
+        ax, ay, jx, jy = self.evaluate(simulation, store.x, store.y, store.vx, store.vy)
+        simulation.store_accelerations(ax, ay)
+        self.jerk = (jx, jy)
+        self.snap = self.crackle = None
+        self.version = simulation.forces_key()
+        return ax, ay, jx, jy
+
+    def timestep(self, simulation):
+        ax, ay, jx, jy = self.start(simulation)
+        a = np.hypot(ax, ay)
+        j = np.hypot(jx, jy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.snap is None:
+                dt = HERMITE_ETA_START * a / j
+            else:
+                s = np.hypot(*self.snap)
+                c = np.hypot(*self.crackle)
+                dt = np.sqrt(HERMITE_ETA * (a * s + j * j) / (j * c + s * s))
+        dt = dt[np.isfinite(dt) & (dt > 0)]
+        return float(np.min(dt)) if len(dt) else np.inf
+
+    def evaluate(self, simulation, x, y, vx, vy):
+        simulation.force_evaluations += 1
+        self.kernel.softening = simulation.softening
+        store = simulation.particles
+        mass = np.where(store.tracer == 0, store.mass, 0)
+        return self.kernel.accelerations_and_jerk(x, y, vx, vy, mass, simulation.G)
+
+    def step(self, simulation, dt):
+        store = simulation.particles
+        ax0, ay0, jx0, jy0 = self.start(simulation)
+
+        # Predict
+        dt2, dt3 = dt * dt / 2, dt * dt * dt / 6
+        px = store.x + store.vx * dt + ax0 * dt2 + jx0 * dt3
+        py = store.y + store.vy * dt + ay0 * dt2 + jy0 * dt3
+        pvx = store.vx + ax0 * dt + jx0 * dt2
+        pvy = store.vy + ay0 * dt + jy0 * dt2
+
+        # Evaluate at the predicted state and correct
+        ax1, ay1, jx1, jy1 = self.evaluate(simulation, px, py, pvx, pvy)
+        vx1 = store.vx + (ax0 + ax1) * dt / 2 + (jx0 - jx1) * dt * dt / 12
+        vy1 = store.vy + (ay0 + ay1) * dt / 2 + (jy0 - jy1) * dt * dt / 12
+        store.x += (store.vx + vx1) * dt / 2 + (ax0 - ax1) * dt * dt / 12
+        store.y += (store.vy + vy1) * dt / 2 + (ay0 - ay1) * dt * dt / 12
+        store.vx[:] = vx1
+        store.vy[:] = vy1
+
+        simulation.store_accelerations(ax1, ay1)
+        self.jerk = (jx1, jy1)
+        # Snap at the end of the step and crackle from the Hermite interpolant
+        crackle = [(12 * (a0 - a1) + 6 * dt * (j0 + j1)) / dt ** 3
+                   for a0, a1, j0, j1 in ((ax0, ax1, jx0, jx1), (ay0, ay1, jy0, jy1))]
+        self.snap = [(-6 * (a0 - a1) - dt * (4 * j0 + 2 * j1)) / (dt * dt) + dt * c
+                     for a0, a1, j0, j1, c in ((ax0, ax1, jx0, jx1, crackle[0]), (ay0, ay1, jy0, jy1, crackle[1]))]
+        self.crackle = crackle
+        self.version = simulation.forces_key()
+
+
+class BlockLeapfrog:
+    # Kick-drift-kick with individual power-of-two timesteps. Each body gets
+    # the global step halved until it resolves its own timescale (see
+    # Simulation.timescales), so only bodies in close encounters sub-step.
+    # Everyone drifts on the finest tick, but forces are only evaluated for
+    # the bodies whose own step ends there. All steps end together at the
+    # end of the global step, whose evaluation covers every body.
+    name = "Block leapfrog"
+    individual_timesteps = True
+
+    def __init__(self):
+        self.force_evaluations = 1
+        self.levels = np.zeros(0, dtype=np.int64)
+
+    def assign_levels(self, simulation, dt):
+        timescale = simulation.eta * simulation.timescales()
+        with np.errstate(divide='ignore'):
+            levels = np.ceil(np.log2(dt / timescale))
+        levels = np.where(np.isfinite(levels), levels, 0)
+        return np.clip(levels, 0, MAX_BLOCK_LEVEL).astype(np.int64)
+
+    def step(self, simulation, dt):
+        store = simulation.particles
+        n = len(store)
+        evaluations = simulation.force_evaluations
+        ax, ay = simulation.cached_accelerations()
+        ax, ay = ax.copy(), ay.copy()
+        self.levels = self.assign_levels(simulation, dt)
+        finest = int(self.levels.max())
+        ticks = 1 << finest
+        tick_dt = dt / ticks
+        # Ticks per body step and the body's own step length
+        period = 1 << (finest - self.levels)
+        body_dt = dt / (1 << self.levels)
+
+        for tick in range(ticks):
+            opening = tick % period == 0
+            store.vx += np.where(opening, 0.5 * ax * body_dt, 0)
+            store.vy += np.where(opening, 0.5 * ay * body_dt, 0)
+            store.x += store.vx * tick_dt
+            store.y += store.vy * tick_dt
+            if tick + 1 == ticks:
+                ax, ay = simulation.evaluate_forces(store.x, store.y)
+                closing = np.ones(n, dtype=bool)
+            else:
+                closing = (tick + 1) % period == 0
+                active = np.nonzero(closing)[0]
+                if len(active):
+                    new_ax, new_ay = simulation.evaluate_forces(store.x, store.y, active)
+                    ax[active], ay[active] = new_ax[active], new_ay[active]
+            store.vx += np.where(closing, 0.5 * ax * body_dt, 0)
+            store.vy += np.where(closing, 0.5 * ay * body_dt, 0)
+        simulation.store_accelerations(ax, ay)
+        self.force_evaluations = simulation.force_evaluations - evaluations
+
+
+INTEGRATORS = {
+    "leapfrog": Leapfrog,
+    "yoshida4": Yoshida4,
+    "rk4": RungeKutta4,
+    "hermite4": Hermite4,
+    "block": BlockLeapfrog,
+}
+
+
+def make_integrator(name):
+    if name not in INTEGRATORS:
+        raise ValueError("Unknown integrator: " + str(name))
+    return INTEGRATORS[name]()
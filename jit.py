@@ -0,0 +1,93 @@
+import numpy as np
+
+from gravity import DEFAULT_SOFTENING, DirectSolver
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Initial room for overlap pairs found by the kernel, grown on demand
+PAIR_CAPACITY = 1024
+
+
+def pairwise_kernel(x, y, mass, radius, G, eps2, ax, ay, pairs):
+    # Each unordered pair is visited once and applied to both bodies (Newton's
+    # third law). Overlapping pairs are recorded while the distance is at hand;
+    # returns how many were found, which may exceed len(pairs).
+    n = len(x)
+    found = 0
+    for i in range(n):
+        ax[i] = 0.0
+        ay[i] = 0.0
+    for i in range(n):
+        xi, yi, mi, ri = x[i], y[i], mass[i], radius[i]
+        axi, ayi = 0.0, 0.0
+        for j in range(i + 1, n):
+            dx = x[j] - xi
+            dy = y[j] - yi
+            r2 = dx * dx + dy * dy
+            reach = ri + radius[j]
+            if r2 < reach * reach:
+                if found < len(pairs):
+                    pairs[found, 0] = i
+                    pairs[found, 1] = j
+                found += 1
+            if r2 > 0.0:
+                s2 = r2 + eps2
+                inv_r3 = G / (s2 * np.sqrt(s2))
+                axi += mass[j] * inv_r3 * dx
+                ayi += mass[j] * inv_r3 * dy
+                ax[j] -= mi * inv_r3 * dx
+                ay[j] -= mi * inv_r3 * dy
+        ax[i] += axi
+        ay[i] += ayi
+    return found
+
+
+if numba is not None:
+    # cache=True keeps the compiled machine code on disk next to this module
+    pairwise_kernel = numba.njit(cache=True, fastmath=False)(pairwise_kernel)
+
+
+class JitDirectSolver:
+    # Compiled direct summation. The overlapping pairs from the last call are
+    # kept so the collision phase can skip its broad phase when the positions
+    # have not moved since.
+    def __init__(self):
+        self.pairs = np.empty((PAIR_CAPACITY, 2), dtype=np.int64)
+        self.overlap_x = None
+        self.overlap_y = None
+        self.overlap_count = 0
+        self.softening = DEFAULT_SOFTENING
+
+    def accelerations(self, x, y, mass, G):
+        n = len(x)
+        ax = np.empty(n)
+        ay = np.empty(n)
+        x = np.ascontiguousarray(x, dtype=np.float64)
+        y = np.ascontiguousarray(y, dtype=np.float64)
+        mass = np.ascontiguousarray(mass, dtype=np.float64)
+        radius = np.cbrt(mass)
+        eps2 = float(self.softening) ** 2
+        found = pairwise_kernel(x, y, mass, radius, float(G), eps2, ax, ay, self.pairs)
+        if found > len(self.pairs):
+            self.pairs = np.empty((2 * found, 2), dtype=np.int64)
+            found = pairwise_kernel(x, y, mass, radius, float(G), eps2, ax, ay, self.pairs)
+        self.overlap_x, self.overlap_y = x.copy(), y.copy()
+        self.overlap_count = found
+        return ax, ay
+
+    def overlaps_for(self, x, y):
+        # Pairs from the last evaluation, if it was made at exactly these positions
+        if self.overlap_x is None or not (np.array_equal(self.overlap_x, x) and np.array_equal(self.overlap_y, y)):
+            return None
+        return self.pairs[:self.overlap_count].copy()
+
+
+def make_jit_solver():
+    # Without numba the interpreted kernel would be far slower than NumPy,
+    # so quietly fall back to the vectorized direct sum
+    if numba is None:
+        return DirectSolver()
+    return JitDirectSolver()
@@ -0,0 +1,224 @@
+import numpy as np
+
+from gravity import DEFAULT_SOFTENING, PAIR_BUDGET, matching_potential
+
+# Mesh cells along each side of the square mesh laid over the particle extent
+DEFAULT_GRID = 256
+# Cell sizes are rounded up to a ladder of this many steps per factor of two,
+# so the transformed kernel is reused while the extent drifts
+CELL_LADDER = 8
+
+# P3M force split: the mesh carries the Gaussian-smoothed part of the force
+# (split scale SPLIT_CELLS cells) and pairs closer than CUTOFF_SPLITS split
+# scales add the rest directly. Beyond the cutoff the short-range part is
+# below erfc(CUTOFF_SPLITS / 2) ~ 1.5e-3 of the pair force.
+SPLIT_CELLS = 1.25
+CUTOFF_SPLITS = 4.5
+
+
+def erfc(x):
+    # Abramowitz and Stegun 7.1.26, absolute error below 1.5e-7 for x >= 0
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return poly * np.exp(-x * x)
+
+
+def short_range(r2, eps2, split):
+    # Short-range part of the softened kernel at R² = r² + eps²: the
+    # acceleration is G * m * g * (dx, dy) and the potential -G * m * phi
+    R = np.sqrt(r2 + eps2)
+    u = R / (2 * split)
+    tail = erfc(u)
+    gauss = np.exp(-u * u) / (split * np.sqrt(np.pi))
+    return (tail / R + gauss) / (R * R), tail / R
+
+
+def cic_weights(x, y, origin_x, origin_y, cell, grid):
+    # Lower-left cell and the weights of the upper neighbours for cloud-in-cell
+    fx = (x - origin_x) / cell
+    fy = (y - origin_y) / cell
+    ix = np.minimum(fx.astype(np.int64), grid - 2)
+    iy = np.minimum(fy.astype(np.int64), grid - 2)
+    return ix, iy, fx - ix, fy - iy
+
+
+class ParticleMeshSolver:
+    # Particle-mesh gravity: masses are deposited on a square mesh with
+    # cloud-in-cell, convolved with the force kernel by FFT (zero-padded to
+    # twice the size, so there are no periodic images) and interpolated back
+    # with the same weights, which keeps forces pairwise antisymmetric. The
+    # kernel is the solver's own inverse-square law rather than a 2D Poisson
+    # Green's function. With short_range set it becomes P3M: the mesh only
+    # carries the smooth long-range part and close pairs are summed directly.
+    # The mesh spans the particle extent, so it suits bounded boxes; a body
+    # far outside the cloud coarsens the mesh for everyone.
+    supports_targets = True
+
+    def __init__(self, grid=DEFAULT_GRID, short_range=False, softening=DEFAULT_SOFTENING, pair_budget=PAIR_BUDGET):
+        self.grid = grid
+        self.short_range = short_range
+        self.softening = softening
+        self.pair_budget = pair_budget
+        self.kernel_key = None
+        self.kernel = None
+        self.track_potential = False
+        self.potential = None
+        self.potential_x = None
+        self.potential_y = None
+
+    def potential_for(self, x, y):
+        return matching_potential(self, x, y)
+
+    def cell_size(self, x, y):
+        side = max(float(np.max(x)) - float(np.min(x)), float(np.max(y)) - float(np.min(y)))
+        if side <= 0:
+            return 1.0
+        return float(2 ** (np.ceil(np.log2(side / (self.grid - 1)) * CELL_LADDER) / CELL_LADDER))
+
+    def mesh_kernel(self, cell):
+        # Transformed x, y and potential kernels indexed by target minus
+        # source cell offset, in FFT wrap-around order
+        key = (self.grid, cell, self.softening, self.short_range)
+        if self.kernel_key == key:
+            return self.kernel
+        size = 2 * self.grid
+        offsets = np.fft.fftfreq(size, 1 / size) * cell
+        ox, oy = np.meshgrid(offsets, offsets, indexing='ij')
+        r2 = ox * ox + oy * oy
+        eps2 = self.softening * self.softening
+        with np.errstate(divide='ignore', invalid='ignore'):
+            R = np.sqrt(r2 + eps2)
+            g = 1 / (R * R * R)
+            phi = 1 / R
+            if self.short_range:
+                short_g, short_phi = short_range(r2, eps2, SPLIT_CELLS * cell)
+                g -= short_g
+                phi -= short_phi
+        g[0, 0] = 0  # No self-force
+        if not np.isfinite(phi[0, 0]):
+            # Unsoftened: the smooth part has a finite limit at zero, the bare law has none
+            phi[0, 0] = 1 / (SPLIT_CELLS * cell * np.sqrt(np.pi)) if self.short_range else 0
+        # Sources pull targets towards them, against the target minus source offset
+        self.kernel = (np.fft.rfft2(-g * ox), np.fft.rfft2(-g * oy), np.fft.rfft2(-phi))
+        self.kernel_key = key
+        return self.kernel
+
+    def accelerations(self, x, y, mass, G, targets=None):
+        # With targets given, only those rows are evaluated (ax/ay are still length N)
+        n = len(x)
+        ax = np.zeros(n)
+        ay = np.zeros(n)
+        if n == 0:
+            return ax, ay
+        grid = self.grid
+        cell = self.cell_size(x, y)
+        origin_x, origin_y = float(np.min(x)), float(np.min(y))
+        kx, ky, kphi = self.mesh_kernel(cell)
+        potential = np.zeros(n) if self.track_potential and targets is None else None
+        if targets is None:
+            targets = np.arange(n)
+
+        ix, iy, wx, wy = cic_weights(x, y, origin_x, origin_y, cell, grid)
+        corners = [(0, 0, (1 - wx) * (1 - wy)), (1, 0, wx * (1 - wy)), (0, 1, (1 - wx) * wy), (1, 1, wx * wy)]
+        density = np.zeros((grid, grid))
+        for cx, cy, weight in corners:
+            density += np.bincount((ix + cx) * grid + iy + cy, weights=mass * weight,
+                                   minlength=grid * grid).reshape(grid, grid)
+        transformed = np.fft.rfft2(density, (2 * grid, 2 * grid))
+        fields = [(ax, kx), (ay, ky)] + ([(potential, kphi)] if potential is not None else [])
+        for out, kernel in fields:
+            field = np.fft.irfft2(transformed * kernel, (2 * grid, 2 * grid))[:grid, :grid]
+            for cx, cy, weight in corners:
+                out[targets] += weight[targets] * field[ix[targets] + cx, iy[targets] + cy]
+        ax *= G
+        ay *= G
+        if potential is not None:
+            potential -= mass * self.self_potential(wx, wy, kphi)
+            potential *= G
+        if self.short_range:
+            self.add_short_range(x, y, mass, G, cell, targets, ax, ay, potential)
+        if potential is not None:
+            self.potential, self.potential_x, self.potential_y = potential, x.copy(), y.copy()
+        return ax, ay
+
+    def self_potential(self, wx, wy, kphi):
+        # Each body's cloud also feels itself through the mesh; this is that
+        # term, for every pair of its own four corners
+        size = 2 * self.grid
+        phi = np.fft.irfft2(kphi, (size, size))
+        cloud_x = ((1 - wx, 0), (wx, 1))
+        cloud_y = ((1 - wy, 0), (wy, 1))
+        total = np.zeros(len(wx))
+        for weight_a, shift_a in cloud_x:
+            for weight_b, shift_b in cloud_x:
+                for weight_c, shift_c in cloud_y:
+                    for weight_d, shift_d in cloud_y:
+                        total += weight_a * weight_b * weight_c * weight_d * phi[shift_a - shift_b, shift_c - shift_d]
+        return total
+
+    def add_short_range(self, x, y, mass, G, cell, targets, ax, ay, potential):
+        # Pairs within the cutoff, found on a grid of cutoff-sized buckets.
+        # Bodies are sorted by bucket so every bucket is a contiguous run. For
+        # a full evaluation each pair is visited once from a half stencil and
+        # applied to both bodies; a subset of targets needs the full stencil.
+        n = len(x)
+        split = SPLIT_CELLS * cell
+        cutoff = CUTOFF_SPLITS * split
+        eps2 = self.softening * self.softening
+        bx = ((x - float(np.min(x))) // cutoff).astype(np.int64)
+        by = ((y - float(np.min(y))) // cutoff).astype(np.int64)
+        keys = (bx << 32) + by
+        order = np.argsort(keys, kind='stable')
+        x, y, mass, bx, by = x[order], y[order], mass[order], bx[order], by[order]
+        bucket_keys, bucket_starts, bucket_counts = np.unique(keys[order], return_index=True, return_counts=True)
+        if len(targets) == n:
+            stencil = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+            queries = np.arange(n)
+        else:
+            stencil = [(ox, oy) for ox in (-1, 0, 1) for oy in (-1, 0, 1)]
+            rank = np.empty(n, dtype=np.int64)
+            rank[order] = np.arange(n)
+            queries = np.sort(rank[targets])
+        symmetric = len(stencil) == 5
+        sums = np.zeros((3, n))
+        rows = max(1, self.pair_budget // (len(stencil) * int(bucket_counts.max())))
+        for start in range(0, len(queries), rows):
+            chunk = queries[start:start + rows]
+            hit, fx, fy, phi = [], [], [], []
+            for ox, oy in stencil:
+                query = ((bx[chunk] + ox) << 32) + by[chunk] + oy
+                slot = np.minimum(np.searchsorted(bucket_keys, query), len(bucket_keys) - 1)
+                found = bucket_keys[slot] == query
+                counts = bucket_counts[slot[found]]
+                i = np.repeat(chunk[found], counts)
+                offsets = np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+                j = np.repeat(bucket_starts[slot[found]], counts) + offsets
+                dx = x[j] - x[i]
+                dy = y[j] - y[i]
+                r2 = dx * dx + dy * dy
+                # Coincident bodies contribute nothing, as in the direct sum
+                near = (r2 < cutoff * cutoff) & (r2 > 0)
+                if symmetric and ox == 0 and oy == 0:
+                    near &= i < j
+                i, j, dx, dy = i[near], j[near], dx[near], dy[near]
+                g, p = short_range(r2[near], eps2, split)
+                g *= G
+                p *= -G
+                hit.append(i)
+                fx.append(mass[j] * g * dx)
+                fy.append(mass[j] * g * dy)
+                phi.append(mass[j] * p)
+                if symmetric:
+                    hit.append(j)
+                    fx.append(-mass[i] * g * dx)
+                    fy.append(-mass[i] * g * dy)
+                    phi.append(mass[i] * p)
+            hit = np.concatenate(hit)
+            sums[0] += np.bincount(hit, weights=np.concatenate(fx), minlength=n)
+            sums[1] += np.bincount(hit, weights=np.concatenate(fy), minlength=n)
+            if potential is not None:
+                sums[2] += np.bincount(hit, weights=np.concatenate(phi), minlength=n)
+        ax[order] += sums[0]
+        ay[order] += sums[1]
+        if potential is not None:
+            potential[order] += sums[2]
@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from gravity import DirectSolver
+
+# Below this many bodies process overhead outweighs the split and the
+# serial kernel is used instead
+MIN_PARALLEL_BODIES = 2000
+# Workers start from a fresh interpreter rather than a fork of this process:
+# a fork copies the SDL and physics threads' locks in whatever state they
+# happen to be in, and the child can deadlock on them
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Worker-side cache of attached shared-memory blocks, keyed by block name
+attached = {}
+
+
+def attach(name):
+    block = attached.get(name)
+    if block is None:
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 registers every attachment with the resource
+            # tracker. Workers started by forkserver or spawn share the
+            # parent's tracker, where the name is already registered, and
+            # the parent unregisters it when it unlinks the block.
+            block = shared_memory.SharedMemory(name=name)
+        # The parent only replaces its block when it grows, so drop older ones
+        for old in attached.values():
+            old.close()
+        attached.clear()
+        attached[name] = block
+    return block
+
+
+def compute_rows(name, capacity, n, G, start, stop, pair_budget, softening):
+    # Runs in a worker: read positions and masses from the shared block and
+    # write the accelerations of targets [start, stop) back into it
+    block = attach(name)
+    x, y, mass, ax, ay = np.ndarray((5, capacity), dtype=np.float64, buffer=block.buf)[:, :n]
+    kernel = DirectSolver(pair_budget, softening)
+    rows = kernel.chunk_rows(n)
+    for chunk_start in range(start, stop, rows):
+        chunk = np.arange(chunk_start, min(chunk_start + rows, stop))
+        ax[chunk], ay[chunk] = kernel.rows(x, y, mass, G, chunk)
+
+
+def release(pool, block):
+    pool.terminate()
+    if block is not None:
+        block.close()
+        block.unlink()
+
+
+class ParallelDirectSolver:
+    # Direct summation with the target particles split across a process pool.
+    # Inputs and results live in one shared-memory block, so a step only
+    # sends each worker a block name and a row range.
+    #
+    # The pool is started here, so build the solver on the main thread.
+    def __init__(self, workers=None, min_bodies=MIN_PARALLEL_BODIES, pair_budget=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_bodies = min_bodies
+        self.serial = DirectSolver() if pair_budget is None else DirectSolver(pair_budget)
+        self.softening = self.serial.softening
+        self.pool = None
+        self.block = None
+        self.capacity = 0
+        self.finalizer = None
+        if self.workers >= 2:
+            self.pool = multiprocessing.get_context(START_METHOD).Pool(self.workers)
+            self.finalizer = weakref.finalize(self, release, self.pool, None)
+
+    def ensure_capacity(self, n):
+        if n <= self.capacity:
+            return
+        self.finalizer.detach()
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+        self.capacity = max(n, 2 * self.capacity)
+        self.block = shared_memory.SharedMemory(create=True, size=5 * self.capacity * 8)
+        self.finalizer = weakref.finalize(self, release, self.pool, self.block)
+
+    def accelerations(self, x, y, mass, G):
+        n = len(x)
+        self.serial.softening = self.softening
+        if n < self.min_bodies or self.pool is None:
+            return self.serial.accelerations(x, y, mass, G)
+        self.ensure_capacity(n)
+        shared = np.ndarray((5, self.capacity), dtype=np.float64, buffer=self.block.buf)
+        shared[0, :n] = x
+        shared[1, :n] = y
+        shared[2, :n] = mass
+
+        bounds = np.linspace(0, n, self.workers + 1).astype(int)
+        tasks = [(self.block.name, self.capacity, n, G, int(start), int(stop), self.serial.pair_budget,
+                  self.softening)
+                 for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        self.pool.starmap(compute_rows, tasks)
+        return shared[3, :n].copy(), shared[4, :n].copy()
+
+    def close(self):
+        if self.finalizer is not None:
+            self.finalizer()
+        self.pool = None
+        self.block = None
+        self.capacity = 0
+        self.finalizer = None
@@ -0,0 +1,370 @@
+import math
+
+import numpy as np
+
+# tracer is 1 for test particles, which feel the gravity of the massive
+# bodies but exert none themselves, and 0 for massive bodies
+FIELDS = ('x', 'y', 'xi', 'yi', 'vx', 'vy', 'vxi', 'vyi', 'ax', 'ay', 'mass', 'radius', 'tracer')
+INITIAL_CAPACITY = 64
+MISSING = -1  # slot_of entry for ids that were removed or never issued
+
+
+def _field(name):
+    def get(self):
+        if self.store is None:
+            return self.values[name]
+        return float(self.store.data[name][self.store.slot_of[self.id]])
+
+    def set(self, value):
+        if self.store is None:
+            self.values[name] = value
+        else:
+            self.store.data[name][self.store.slot_of[self.id]] = value
+            self.store.version += 1
+
+    return property(get, set)
+
+
+class PointMass:
+    # A body either owns its values or is a thin view onto a row of a ParticleStore
+    def __init__(self, name, x, y, vx, vy, mass, color, tracer=False):
+        self.store = None
+        self.id = None
+        self.values = {'name': name, 'color': color, 'x': x, 'y': y, 'xi': x, 'yi': y,
+                       'vx': vx, 'vy': vy, 'vxi': vx, 'vyi': vy, 'ax': 0, 'ay': 0,
+                       'mass': mass, 'radius': math.cbrt(mass), 'tracer': float(tracer)}
+
+    def reset(self):
+        self.vx = self.vxi
+        self.vy = self.vyi
+        self.x = self.xi
+        self.y = self.yi
+
+    @property
+    def name(self):
+        if self.store is None:
+            return self.values['name']
+        return self.store.name(self.store.slot_of[self.id])
+
+    @name.setter
+    def name(self, value):
+        if self.store is None:
+            self.values['name'] = value
+        else:
+            self.store.set_name(self.store.slot_of[self.id], value)
+            self.store.version += 1
+
+    @property
+    def color(self):
+        if self.store is None:
+            return self.values['color']
+        return tuple(int(c) for c in self.store.colors[self.store.slot_of[self.id]])
+
+    @color.setter
+    def color(self, value):
+        if self.store is None:
+            self.values['color'] = value
+        else:
+            self.store.colors[self.store.slot_of[self.id]] = value
+
+
+for _name in FIELDS:
+    setattr(PointMass, _name, _field(_name))
+
+
+def body_name(rows, slot):
+    # rows is a ParticleStore or anything with the same name columns. A
+    # numbered name is the table entry followed by the body's id, so a
+    # generated scene of a million bodies stores one prefix, not a million
+    # strings.
+    name = rows.name_table[rows.name_codes[slot]]
+    return name + str(int(rows.ids[slot])) if rows.numbered[slot] else name
+
+
+def _column(name):
+    def get(self):
+        return self.data[name][:self.count]
+
+    def set(self, value):
+        self.data[name][:self.count] = value
+
+    return property(get, set)
+
+
+class ParticleStore:
+    # Structure-of-arrays container: one contiguous float64 array per field,
+    # with stable ids mapped to slots so add and swap-remove are O(1). Ids are
+    # never reused, so slot_of is an array indexed by id, MISSING once removed.
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.count = 0
+        self.next_id = 0
+        # Bumped on every add, remove or write through a view, so derived
+        # data such as cached accelerations can tell when it is stale
+        self.version = 0
+        self.data = {name: np.zeros(capacity) for name in FIELDS}
+        self.colors = np.zeros((capacity, 3), dtype=np.uint8)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        # Names are a code into name_table per body, plus whether the body's
+        # id is appended to it; see body_name
+        self.name_codes = np.zeros(capacity, dtype=np.int32)
+        self.numbered = np.zeros(capacity, dtype=bool)
+        self.name_table = []
+        self.name_index = {}
+        self.slot_of = np.full(capacity, MISSING, dtype=np.int32)
+        self.views = {}
+
+    @property
+    def capacity(self):
+        return len(self.ids)
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        for name in FIELDS:
+            grown = np.zeros(capacity)
+            grown[:self.count] = self.data[name][:self.count]
+            self.data[name] = grown
+        colors = np.zeros((capacity, 3), dtype=np.uint8)
+        colors[:self.count] = self.colors[:self.count]
+        self.colors = colors
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.count] = self.ids[:self.count]
+        self.ids = ids
+        name_codes = np.zeros(capacity, dtype=np.int32)
+        name_codes[:self.count] = self.name_codes[:self.count]
+        self.name_codes = name_codes
+        numbered = np.zeros(capacity, dtype=bool)
+        numbered[:self.count] = self.numbered[:self.count]
+        self.numbered = numbered
+
+    def reserve_ids(self, next_id):
+        if next_id <= len(self.slot_of):
+            return
+        slot_of = np.full(max(next_id, 2 * len(self.slot_of)), MISSING, dtype=np.int32)
+        slot_of[:len(self.slot_of)] = self.slot_of
+        self.slot_of = slot_of
+
+    def name_code(self, name):
+        code = self.name_index.get(name)
+        if code is None:
+            code = self.name_index[name] = len(self.name_table)
+            self.name_table.append(name)
+        return code
+
+    def name(self, slot):
+        return body_name(self, slot)
+
+    def set_name(self, slot, name):
+        self.name_codes[slot] = self.name_code(name)
+        self.numbered[slot] = False
+
+    def has_id(self, body_id):
+        return 0 <= body_id < len(self.slot_of) and self.slot_of[body_id] != MISSING
+
+    def add(self, name, x, y, vx, vy, mass, color, tracer=False):
+        self.reserve(self.count + 1)
+        self.reserve_ids(self.next_id + 1)
+        slot = self.count
+        body_id = self.next_id
+        self.next_id += 1
+        values = self.data
+        values['x'][slot] = values['xi'][slot] = x
+        values['y'][slot] = values['yi'][slot] = y
+        values['vx'][slot] = values['vxi'][slot] = vx
+        values['vy'][slot] = values['vyi'][slot] = vy
+        values['ax'][slot] = values['ay'][slot] = 0
+        values['mass'][slot] = mass
+        values['radius'][slot] = math.cbrt(mass)
+        values['tracer'][slot] = tracer
+        self.colors[slot] = color
+        self.ids[slot] = body_id
+        self.set_name(slot, name)
+        self.slot_of[body_id] = slot
+        self.count += 1
+        self.version += 1
+        return body_id
+
+    def add_many(self, names, x, y, vx, vy, mass, colors, tracer=False):
+        # tracer is one flag for all the new bodies or one per body. names is
+        # a list with one name per body, or a (codes, numbered) pair of arrays
+        # in the layout of name_codes and numbered, which skips building a
+        # string per body.
+        n = len(x)
+        self.reserve(self.count + n)
+        self.reserve_ids(self.next_id + n)
+        start, stop = self.count, self.count + n
+        values = self.data
+        for name, column in (('x', x), ('y', y), ('vx', vx), ('vy', vy), ('mass', mass)):
+            values[name][start:stop] = column
+        values['xi'][start:stop] = x
+        values['yi'][start:stop] = y
+        values['vxi'][start:stop] = vx
+        values['vyi'][start:stop] = vy
+        values['ax'][start:stop] = 0
+        values['ay'][start:stop] = 0
+        values['radius'][start:stop] = np.cbrt(values['mass'][start:stop])
+        values['tracer'][start:stop] = tracer
+        self.colors[start:stop] = colors
+        new_ids = np.arange(self.next_id, self.next_id + n)
+        self.ids[start:stop] = new_ids
+        self.next_id += n
+        if isinstance(names, tuple):
+            self.name_codes[start:stop], self.numbered[start:stop] = names
+        else:
+            self.name_codes[start:stop] = [self.name_code(name) for name in names]
+            self.numbered[start:stop] = False
+        self.slot_of[new_ids] = np.arange(start, stop)
+        self.count = stop
+        self.version += 1
+        return new_ids
+
+    def append(self, particle: PointMass):
+        if particle.store is not None:
+            raise ValueError("Particle already belongs to a store")
+        values = particle.values
+        body_id = self.add(values['name'], values['x'], values['y'], values['vx'], values['vy'],
+                           values['mass'], values['color'], values['tracer'])
+        slot = self.slot_of[body_id]
+        for name in ('xi', 'yi', 'vxi', 'vyi', 'ax', 'ay', 'radius'):
+            self.data[name][slot] = values[name]
+        particle.store = self
+        particle.id = body_id
+        self.views[body_id] = particle
+
+    def view(self, body_id):
+        particle = self.views.get(body_id)
+        if particle is None:
+            particle = PointMass.__new__(PointMass)
+            particle.store = self
+            particle.id = body_id
+            particle.values = None
+            self.views[body_id] = particle
+        return particle
+
+    def detach(self, particle, slot):
+        # A removed view keeps its last values so anyone still holding it can read them
+        particle.values = {name: float(self.data[name][slot]) for name in FIELDS}
+        particle.values['name'] = self.name(slot)
+        particle.values['color'] = tuple(int(c) for c in self.colors[slot])
+        particle.store = None
+
+    def remove_id(self, body_id):
+        if not self.has_id(body_id):
+            raise KeyError(body_id)
+        slot = int(self.slot_of[body_id])
+        self.slot_of[body_id] = MISSING
+        particle = self.views.pop(body_id, None)
+        if particle is not None:
+            self.detach(particle, slot)
+
+        last = self.count - 1
+        if slot != last:
+            for name in FIELDS:
+                column = self.data[name]
+                column[slot] = column[last]
+            self.colors[slot] = self.colors[last]
+            moved_id = int(self.ids[last])
+            self.ids[slot] = moved_id
+            self.name_codes[slot] = self.name_codes[last]
+            self.numbered[slot] = self.numbered[last]
+            self.slot_of[moved_id] = slot
+        self.count = last
+        self.version += 1
+
+    def remove_many(self, body_ids):
+        # Bulk removal that compacts the remaining rows in order, O(N) in all
+        # rather than a swap-remove per body
+        body_ids = list(body_ids)
+        if not body_ids:
+            return
+        keep = np.ones(self.count, dtype=bool)
+        for body_id in body_ids:
+            if not self.has_id(body_id):
+                raise KeyError(body_id)
+            slot = int(self.slot_of[body_id])
+            keep[slot] = False
+            particle = self.views.pop(body_id, None)
+            if particle is not None:
+                self.detach(particle, slot)
+        self.slot_of[body_ids] = MISSING
+        remaining = int(keep.sum())
+        for name in FIELDS:
+            column = self.data[name]
+            column[:remaining] = column[:self.count][keep]
+        self.colors[:remaining] = self.colors[:self.count][keep]
+        self.ids[:remaining] = self.ids[:self.count][keep]
+        self.name_codes[:remaining] = self.name_codes[:self.count][keep]
+        self.numbered[:remaining] = self.numbered[:self.count][keep]
+        self.count = remaining
+        self.slot_of[self.ids[:remaining]] = np.arange(remaining)
+        self.version += 1
+
+    def remove(self, particle: PointMass):
+        if particle not in self:
+            raise ValueError("Particle is not in this store")
+        self.remove_id(particle.id)
+
+    def clear(self):
+        for particle in self.views.values():
+            self.detach(particle, self.slot_of[particle.id])
+        self.slot_of[self.ids[:self.count]] = MISSING
+        self.count = 0
+        self.name_table = []
+        self.name_index = {}
+        self.views = {}
+        self.version += 1
+
+    def load_arrays(self, data, colors, ids, names, next_id):
+        # Replace the whole contents at once, e.g. from a snapshot. The arrays
+        # are used as given (memory-mapped ones stay mapped until they grow).
+        # names is a list of names, or a (codes, numbered, table) triple in
+        # the layout of name_codes, numbered and name_table.
+        self.clear()
+        self.count = len(ids)
+        self.data = {name: data[name] for name in FIELDS}
+        self.colors = colors
+        self.ids = ids
+        if isinstance(names, tuple):
+            self.name_codes, self.numbered, self.name_table = names
+            self.name_table = list(self.name_table)
+            self.name_index = {name: code for code, name in enumerate(self.name_table)}
+        else:
+            self.name_codes = np.zeros(self.count, dtype=np.int32)
+            self.numbered = np.zeros(self.count, dtype=bool)
+            self.name_codes[:] = [self.name_code(name) for name in names]
+        self.slot_of = np.full(max(next_id, INITIAL_CAPACITY), MISSING, dtype=np.int32)
+        self.slot_of[ids] = np.arange(self.count)
+        self.next_id = next_id
+        self.version += 1
+
+    def index(self, particle: PointMass):
+        if particle not in self:
+            raise ValueError("Particle is not in this store")
+        return int(self.slot_of[particle.id])
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, particle):
+        return isinstance(particle, PointMass) and particle.store is self and self.has_id(particle.id)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.view(int(body_id)) for body_id in self.ids[:self.count][index]]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("particle index out of range")
+        return self.view(int(self.ids[index]))
+
+    def __iter__(self):
+        # Re-checks the length each step, like a list, so bodies appended mid-loop are visited
+        slot = 0
+        while slot < self.count:
+            yield self.view(int(self.ids[slot]))
+            slot += 1
+
+
+for _name in FIELDS:
+    setattr(ParticleStore, _name, _column(_name))
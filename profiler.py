@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+WINDOW = 120  # Frames kept for rolling statistics
+
+
+class Profiler:
+    # Per-frame phase timings and event counters. Every call is a single
+    # attribute check while disabled, so it can stay wired in permanently.
+    # Frames belong to the thread that created the profiler. Other threads
+    # record into their own buffers and hand them over with publish(), which
+    # adds them to the owner's next end_frame.
+    def __init__(self, window=WINDOW):
+        self.enabled = False
+        self.owner = threading.get_ident()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.published_times = {}
+        self.published_counts = {}
+        self.window = window
+        self.history = {}
+        self.counter_history = {}
+        self.frame_times = {}
+        self.frame_counts = {}
+        self.totals = {}
+        self.callbacks = []
+        self.frames = 0
+        self.last = 0.0
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.frame_times = {}
+        self.frame_counts = {}
+        with self.lock:
+            self.published_times = {}
+            self.published_counts = {}
+        self.last = time.perf_counter()
+
+    def add_callback(self, callback):
+        # callback(metrics) is called at the end of every profiled frame
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    def start(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def stop(self, phase, started):
+        # Time since start() is added to phase, phases may nest or repeat within a frame
+        if self.enabled:
+            times = self.buffers()[0]
+            times[phase] = times.get(phase, 0.0) + time.perf_counter() - started
+
+    def lap(self, phase):
+        # Time since the previous lap, for phases that run back to back
+        if self.enabled:
+            now = time.perf_counter()
+            self.frame_times[phase] = self.frame_times.get(phase, 0.0) + now - self.last
+            self.last = now
+
+    def count(self, counter, amount=1):
+        if self.enabled:
+            counts = self.buffers()[1]
+            counts[counter] = counts.get(counter, 0) + amount
+
+    def buffers(self):
+        # (times, counts) that the calling thread records into
+        if threading.get_ident() == self.owner:
+            return self.frame_times, self.frame_counts
+        local = self.local
+        if not hasattr(local, 'times'):
+            local.times, local.counts = {}, {}
+        return local.times, local.counts
+
+    def publish(self):
+        # Called from a thread other than the owner: what it recorded so far
+        # goes into the owner's next frame
+        local = self.local
+        if not hasattr(local, 'times'):
+            return
+        times, counts = local.times, local.counts
+        local.times, local.counts = {}, {}
+        if not self.enabled:
+            return
+        with self.lock:
+            for phase, seconds in times.items():
+                self.published_times[phase] = self.published_times.get(phase, 0.0) + seconds
+            for counter, amount in counts.items():
+                self.published_counts[counter] = self.published_counts.get(counter, 0) + amount
+
+    def begin_frame(self):
+        if self.enabled:
+            self.last = time.perf_counter()
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            published_times, self.published_times = self.published_times, {}
+            published_counts, self.published_counts = self.published_counts, {}
+        for phase, seconds in published_times.items():
+            self.frame_times[phase] = self.frame_times.get(phase, 0.0) + seconds
+        for counter, amount in published_counts.items():
+            self.frame_counts[counter] = self.frame_counts.get(counter, 0) + amount
+        self.frames += 1
+        for phase, seconds in self.frame_times.items():
+            self.history.setdefault(phase, deque(maxlen=self.window)).append(seconds * 1e3)
+        for counter in set(self.counter_history) | set(self.frame_counts):
+            amount = self.frame_counts.get(counter, 0)
+            self.counter_history.setdefault(counter, deque(maxlen=self.window)).append(amount)
+            self.totals[counter] = self.totals.get(counter, 0) + amount
+        metrics = {'frame': self.frames,
+                   'phases_ms': {phase: seconds * 1e3 for phase, seconds in self.frame_times.items()},
+                   'counters': dict(self.frame_counts)}
+        self.frame_times = {}
+        self.frame_counts = {}
+        for callback in self.callbacks:
+            callback(metrics)
+
+    def phase_stats(self):
+        # {phase: {'mean', 'p50', 'p95', 'max'}} in ms over the rolling window
+        stats = {}
+        for phase, samples in self.history.items():
+            values = np.fromiter(samples, dtype=float)
+            p50, p95 = np.percentile(values, (50, 95))
+            stats[phase] = {'mean': float(values.mean()), 'p50': float(p50), 'p95': float(p95),
+                            'max': float(values.max())}
+        return stats
+
+    def counter_stats(self):
+        # {counter: {'per_frame', 'total'}}, per_frame averaged over the rolling window
+        return {counter: {'per_frame': sum(samples) / len(samples), 'total': self.totals[counter]}
+                for counter, samples in self.counter_history.items()}
+
+    def reset(self):
+        self.history = {}
+        self.counter_history = {}
+        self.totals = {}
+        self.frames = 0
@@ -0,0 +1,177 @@
+import numpy as np
+
+# Vectorized initial conditions. Every generator clears the scene, draws from
+# a numpy Generator (seeded from simulation.random unless a seed is given, so
+# seeded simulations stay reproducible) and writes all bodies with a single
+# ParticleStore.add_many call.
+
+CENTRAL_MASS = 1000000
+DISK_MASS = 100  # Total mass of the orbiting bodies of a disk, per 1000 bodies
+PLUMMER_MASS = 100000
+PLUMMER_RADIUS = 300
+
+
+def generator(simulation, seed):
+    if seed is None:
+        seed = simulation.random.getrandbits(64)
+    return np.random.default_rng(seed)
+
+
+def random_colors(rng, n):
+    return rng.integers(0, 256, (n, 3), dtype=np.uint8)
+
+
+def write(simulation, bodies):
+    # bodies: list of (name prefix, x, y, vx, vy, mass, colors) groups, with
+    # an optional eighth item that makes the whole group tracers. A group of
+    # one is named by its prefix alone, larger groups number their bodies.
+    store = simulation.particles
+    store.clear()
+    columns = [np.concatenate([group[i] for group in bodies]) for i in range(1, 7)]
+    tracer = np.concatenate([np.full(len(group[1]), len(group) > 7 and group[7]) for group in bodies])
+    codes = np.concatenate([np.full(len(group[1]), store.name_code(group[0]), dtype=np.int32) for group in bodies])
+    numbered = np.concatenate([np.full(len(group[1]), len(group[1]) > 1) for group in bodies])
+    store.add_many((codes, numbered), *columns, tracer)
+
+
+def disk(rng, n, G, central_mass=CENTRAL_MASS, inner=200, outer=1000, disk_mass=None, clockwise=False):
+    # A central body plus n - 1 bodies on circular orbits with surface density
+    # falling as 1/r. Orbital speeds include the disk mass inside each radius,
+    # taken from the smooth profile rather than sorting the sampled radii.
+    n -= 1
+    if disk_mass is None:
+        disk_mass = DISK_MASS * n / 1000
+    r = rng.uniform(inner, outer, n)
+    angle = rng.uniform(0, 2 * np.pi, n)
+    mass = np.full(n, disk_mass / max(n, 1))
+    enclosed = disk_mass * (r - inner) / (outer - inner)
+    speed = np.sqrt(G * (central_mass + enclosed) / r)
+    if clockwise:
+        speed = -speed
+    x = np.concatenate(([0.0], r * np.cos(angle)))
+    y = np.concatenate(([0.0], r * np.sin(angle)))
+    vx = np.concatenate(([0.0], -speed * np.sin(angle)))
+    vy = np.concatenate(([0.0], speed * np.cos(angle)))
+    return x, y, vx, vy, np.concatenate(([float(central_mass)], mass))
+
+
+def keplerian_disk(simulation, n, seed=None, tracers=False, **options):
+    # With tracers set the disk bodies only feel the star (and each other not
+    # at all), so their orbital speeds leave out the disk's own mass
+    rng = generator(simulation, seed)
+    if tracers:
+        options['disk_mass'] = 0
+    x, y, vx, vy, mass = disk(rng, n, simulation.G, **options)
+    if tracers:
+        mass[1:] = DISK_MASS / 1000
+    colors = random_colors(rng, n)
+    colors[0] = 255
+    write(simulation, [("Star", x[:1], y[:1], vx[:1], vy[:1], mass[:1], colors[:1]),
+                       ("D", x[1:], y[1:], vx[1:], vy[1:], mass[1:], colors[1:], tracers)])
+
+
+def plummer_sphere(simulation, n, seed=None, total_mass=PLUMMER_MASS, scale=PLUMMER_RADIUS):
+    # A Plummer sphere sampled in 3D (Aarseth, Henon and Wielen 1974) and
+    # projected onto the plane. The projection is not an exact equilibrium
+    # of the planar force law, but it stays bound and relaxes quickly.
+    rng = generator(simulation, seed)
+    enclosed = np.cbrt(rng.uniform(1e-6, 1, n))  # Cube root of the enclosed mass fraction
+    radius = scale / np.sqrt(1 / (enclosed * enclosed) - 1)
+    cos_polar = rng.uniform(-1, 1, n)
+    sin_polar = np.sqrt(1 - cos_polar * cos_polar)
+    azimuth = rng.uniform(0, 2 * np.pi, n)
+    x = radius * sin_polar * np.cos(azimuth)
+    y = radius * sin_polar * np.sin(azimuth)
+
+    # Speeds as a fraction q of the local escape speed, by rejection from q²(1 - q²)^3.5
+    q = np.empty(n)
+    pending = np.arange(n)
+    while len(pending):
+        trial = rng.uniform(0, 1, len(pending))
+        rest = 1 - trial * trial
+        accept = rng.uniform(0, 0.1, len(pending)) < trial * trial * rest * rest * rest * np.sqrt(rest)
+        q[pending[accept]] = trial[accept]
+        pending = pending[~accept]
+    escape = np.sqrt(2 * simulation.G * total_mass / np.sqrt(radius * radius + scale * scale))
+    speed = q * escape
+    cos_polar = rng.uniform(-1, 1, n)
+    sin_polar = np.sqrt(1 - cos_polar * cos_polar)
+    azimuth = rng.uniform(0, 2 * np.pi, n)
+    vx = speed * sin_polar * np.cos(azimuth)
+    vy = speed * sin_polar * np.sin(azimuth)
+    write(simulation, [("S", x, y, vx, vy, np.full(n, total_mass / n), random_colors(rng, n))])
+
+
+def uniform_grid(simulation, n, seed=None, spacing=50):
+    # Bodies at rest on a square lattice centred on the origin, a third of
+    # them light (mass 1) and the rest heavy (mass 100) like the S preset
+    rng = generator(simulation, seed)
+    side = int(np.ceil(np.sqrt(n)))
+    index = np.arange(n)
+    x = (index % side - (side - 1) / 2) * spacing
+    y = (index // side - (side - 1) / 2) * spacing
+    mass = np.where(rng.random(n) < 1 / 3, 1.0, 100.0)
+    zeros = np.zeros(n)
+    write(simulation, [("G", x, y, zeros, zeros, mass, random_colors(rng, n))])
+
+
+def colliding_galaxies(simulation, n, seed=None, separation=3000, approach_speed=150, impact=600,
+                       counter_rotating=False, tracers=False):
+    # Two disks of n / 2 bodies each on a collision course, offset sideways
+    # by impact so they pass through each other off-centre. With tracers set
+    # only the two cores are massive, as in Toomre and Toomre (1972).
+    rng = generator(simulation, seed)
+    groups = []
+    for side, label in ((-1, "A"), (1, "B")):
+        count = n // 2 if side < 0 else n - n // 2
+        x, y, vx, vy, mass = disk(rng, count, simulation.G, clockwise=counter_rotating and side > 0,
+                                  disk_mass=0 if tracers else None)
+        if tracers:
+            mass[1:] = DISK_MASS / 1000
+        x += side * separation / 2
+        y += side * impact / 2
+        vx -= side * approach_speed
+        colors = np.tile(np.array([[255, 160, 80]] if side < 0 else [[80, 160, 255]], dtype=np.uint8), (count, 1))
+        colors[0] = 255
+        groups.append((label + " Core", x[:1], y[:1], vx[:1], vy[:1], mass[:1], colors[:1]))
+        groups.append((label, x[1:], y[1:], vx[1:], vy[1:], mass[1:], colors[1:], tracers))
+    write(simulation, groups)
+
+
+def hierarchical_three_body(simulation, n=3, seed=None, mass=10000, inner=60, outer=600, light_mass=1,
+                            tracers=False):
+    # A tight equal-mass binary orbited by a third body far outside it, with
+    # any further bodies as light circumbinary particles between the two
+    # scales, made tracers when tracers is set
+    rng = generator(simulation, seed)
+    G = simulation.G
+    inner_speed = np.sqrt(G * mass / (2 * inner))  # Each member about the binary's centre
+    outer_speed = np.sqrt(G * 3 * mass / outer)  # Tertiary relative to the binary
+    # The binary's centre moves opposite the tertiary so the total momentum is zero
+    binary_vy = -outer_speed / 3
+    x = np.array([-inner / 2, inner / 2, outer])
+    y = np.zeros(3)
+    vx = np.zeros(3)
+    vy = np.array([binary_vy - inner_speed, binary_vy + inner_speed, outer_speed * 2 / 3])
+    masses = np.full(3, float(mass))
+    colors = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255]], dtype=np.uint8)
+    groups = [("Body", x, y, vx, vy, masses, colors)]
+
+    extra = n - 3
+    if extra > 0:
+        r = rng.uniform(3 * inner, outer / 2, extra)
+        angle = rng.uniform(0, 2 * np.pi, extra)
+        speed = np.sqrt(G * 2 * mass / r)
+        groups.append(("P", r * np.cos(angle), r * np.sin(angle), -speed * np.sin(angle),
+                       speed * np.cos(angle) + binary_vy, np.full(extra, float(light_mass)), random_colors(rng, extra),
+                       tracers))
+    write(simulation, groups)
+
+
+SCENARIOS = {
+    'disk': keplerian_disk,
+    'plummer': plummer_sphere,
+    'uniform-grid': uniform_grid,
+    'galaxies': colliding_galaxies,
+    'hierarchical': hierarchical_three_body,
+}
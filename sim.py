@@ -1,27 +1,51 @@
 import pygame
 import pygame.gfxdraw
+import pygame.surfarray
+import argparse
 import sys
 import math
-import random
-from typing import List
+from collections import OrderedDict
 
-# Initialize Pygame
-pygame.init()
+import numpy as np
+
+import snapshot
+from gravity import DEFAULT_THETA
+from integrators import INTEGRATORS
+from particles import FIELDS, PointMass
+from scenarios import keplerian_disk
+from simulation import BLUE, FPS, GRAVITY_MODES, GREEN, RED, WHITE, Simulation
+from spatial import SpatialIndex
+from trajectory import TrajectoryReader
+from worker import PhysicsWorker, capture
 
 # Constants
 WINDOW_WIDTH = 800
 WINDOW_HEIGHT = 600
-FPS = 60
 ZOOM_FACTOR = 1.1
-DT_NORM = 1 / FPS
+PICK_PIXELS = 6  # Bodies drawn smaller than this can still be picked this far from their centre
+SELECT_MIN_PIXELS = 5  # A delete-mode drag shorter than this is a click
+TEXT_CACHE_SIZE = 1024
+SNAPSHOT_PATH = "snapshot.gsnap"
+TRAJECTORY_PATH = "trajectory.gtraj"
+AA_MIN_RADIUS = 3  # Smallest on-screen radius that gets an anti-aliased outline
+DISK_BODIES = 2000  # Bodies in the disk created by K
+TRACER_DISK_BODIES = 100000  # Tracers in the disk created by Shift+K
+
+# draw_particles either draws every body or bins them into a screen-sized
+# histogram weighted by count or by mass
+RENDER_MODES = ("particles", "count density", "mass density")
+# Log color map for the density modes, built from a few anchor colors
+COLORMAP_ANCHORS = np.array([0, 0.25, 0.5, 0.75, 1])
+COLORMAP_COLORS = np.array([(40, 10, 80), (100, 20, 120), (190, 55, 85), (250, 140, 10), (255, 255, 170)])
+COLORMAP = np.stack([np.interp(np.linspace(0, 1, 256), COLORMAP_ANCHORS, COLORMAP_COLORS[:, channel])
+                     for channel in range(3)], axis=1).astype(np.uint8)
+MIN_SOFTENING = 0.5  # First softening length when turning it on from the keyboard
+MIN_MESH_GRID = 32  # Range of the PM mesh size stepped through with = and -
+MAX_MESH_GRID = 1024
 
 # Colors
 BLACK = (0, 0, 0)
-WHITE = (255, 255, 255)
 GRAY = (128, 128, 128)
-RED = (255, 0, 0)
-GREEN = (0, 255, 0)
-BLUE = (0, 0, 255)
 YELLOW = (255, 255, 0)
 
 KEY_HELP = {
@@ -30,6 +54,7 @@ KEY_HELP = {
     'C': 'Reset to Default',
     'W': 'Toggle Following Massive Body',
     'G': 'Toggle Grid',
+    'H': 'Cycle Render Mode (particles, count and mass density)',
     'RIGHT': 'Increase Time Acceleration',
     'LEFT': 'Decrease Time Acceleration',
     'UP': 'Increase G',
@@ -38,21 +63,63 @@ KEY_HELP = {
     '[': 'Decrease Explosion Count',
     'S': 'Spawn Grid of Particles',
     'N': 'Toggle Particle Labels',
-    'B': 'Create Star System',
+    'B': 'Create Star System (Shift: with tracer orbits)',
+    'K': 'Create Keplerian Disk (Shift: 100k tracers)',
     'A': 'Add Particle',
-    'Z': 'Delete Mode',
+    'Z': 'Delete Mode (click a body or drag a box)',
     '3': 'Create Three-Body System',
+    'D': 'Toggle Adaptive Timestep',
+    'I': 'Cycle Integrator',
+    'T': 'Cycle Gravity Mode',
+    '= / -': 'Increase/Decrease Theta (mesh size in PM modes)',
+    '. / ,': 'Increase/Decrease Softening',
+    'V': 'Start/Stop Recording Trajectory',
+    'F5': 'Save Snapshot',
+    'F9': 'Load Snapshot',
+    'P': 'Show/Hide Profiler',
+    'E': 'Toggle Conservation Monitor',
     '/': 'Show/Hide Key Help'
 }
 
 
+class TextCache:
+    # Bounded LRU of rendered text surfaces keyed by (text, antialias, color),
+    # used in place of Font.render so static strings are rasterized once
+    def __init__(self, font, capacity=TEXT_CACHE_SIZE):
+        self.font = font
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, antialias, color):
+        key = (text, antialias, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = self.font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def discard(self, text, antialias, color):
+        self.surfaces.pop((text, antialias, tuple(color)), None)
+
+    def clear(self):
+        self.surfaces.clear()
+
+
 class TextInput:
-    def __init__(self, x, y, width, height, default_text=""):
+    def __init__(self, x, y, width, height, default_text="", font=None):
         self.rect = pygame.Rect(x, y, width, height)
         self.text = default_text
         self.active = False
         self.color = WHITE
-        self.font = pygame.font.Font(None, 24)
+        self.font = font or TextCache(pygame.font.Font(None, 24))
         self.rendered_text = self.font.render(self.text, True, self.color)
 
     def handle_event(self, event):
@@ -78,10 +145,11 @@ class TextInput:
 
 
 class ParticleCreationMenu:
-    def __init__(self, screen_width, screen_height):
+    def __init__(self, screen_width, screen_height, font=None):
+        self.font = font or TextCache(pygame.font.Font(None, 24))
         self.active = False
         menu_width = 400
-        menu_height = 450
+        menu_height = 520
         self.rect = pygame.Rect((screen_width - menu_width) // 2,
                                 (screen_height - menu_height) // 2,
                                 menu_width, menu_height)
@@ -89,12 +157,12 @@ class ParticleCreationMenu:
         # Create input fields
         base_x = self.rect.x + 120
         self.inputs = {
-            "Name: ": TextInput(base_x, self.rect.y + 50, 200, 30, "P1"),
-            "X Position: ": TextInput(base_x, self.rect.y + 100, 200, 30, "0"),
-            "Y Position: ": TextInput(base_x, self.rect.y + 150, 200, 30, "0"),
-            "X Velocity: ": TextInput(base_x, self.rect.y + 200, 200, 30, "0"),
-            "Y Velocity: ": TextInput(base_x, self.rect.y + 250, 200, 30, "0"),
-            "Mass: ": TextInput(base_x, self.rect.y + 300, 200, 30, "1000"),
+            "Name: ": TextInput(base_x, self.rect.y + 50, 200, 30, "P1", self.font),
+            "X Position: ": TextInput(base_x, self.rect.y + 100, 200, 30, "0", self.font),
+            "Y Position: ": TextInput(base_x, self.rect.y + 150, 200, 30, "0", self.font),
+            "X Velocity: ": TextInput(base_x, self.rect.y + 200, 200, 30, "0", self.font),
+            "Y Velocity: ": TextInput(base_x, self.rect.y + 250, 200, 30, "0", self.font),
+            "Mass: ": TextInput(base_x, self.rect.y + 300, 200, 30, "1000", self.font),
         }
 
         # Create color selection buttons
@@ -107,11 +175,14 @@ class ParticleCreationMenu:
         ]
         self.selected_color = WHITE
 
+        # Tracers feel gravity but exert none
+        self.tracer_button = pygame.Rect(self.rect.x + 50, self.rect.y + 395, 200, 30)
+        self.tracer = False
+
         # Create submit button
         self.submit_button = pygame.Rect(self.rect.centerx - 50,
                                          self.rect.bottom - 40, 100, 30)
 
-        self.font = pygame.font.Font(None, 24)
         self.error_message = ""
         self.error_timer = 0
 
@@ -126,6 +197,10 @@ class ParticleCreationMenu:
                     self.selected_color = color
                     return None
 
+            if self.tracer_button.collidepoint(event.pos):
+                self.tracer = not self.tracer
+                return None
+
             # Check submit button
             if self.submit_button.collidepoint(event.pos):
                 return self.create_particle()
@@ -146,7 +221,8 @@ class ParticleCreationMenu:
                 vx=float(self.inputs["X Velocity: "].text),
                 vy=float(self.inputs["Y Velocity: "].text),
                 mass=float(self.inputs["Mass: "].text),
-                color=self.selected_color
+                color=self.selected_color,
+                tracer=self.tracer
             )
             self.active = False
             return particle
@@ -181,6 +257,11 @@ class ParticleCreationMenu:
             if color == self.selected_color:
                 pygame.draw.rect(screen, GREEN, button, 4)
 
+        pygame.draw.rect(screen, GREEN if self.tracer else WHITE, self.tracer_button, 2)
+        tracer_text = self.font.render("Tracer: " + ("on" if self.tracer else "off"), True, WHITE)
+        screen.blit(tracer_text, (self.tracer_button.centerx - tracer_text.get_width() // 2,
+                                  self.tracer_button.centery - tracer_text.get_height() // 2))
+
         # Draw submit button
         pygame.draw.rect(screen, WHITE, self.submit_button, 2)
         submit_text = self.font.render("Create", True, WHITE)
@@ -195,39 +276,15 @@ class ParticleCreationMenu:
             self.error_timer -= 1
 
 
-class PointMass:
-    def __init__(self, name, x, y, vx, vy, mass, color):
-        self.name = name
-        self.x = x
-        self.y = y
-        self.xi = x
-        self.yi = y
-        self.vx = vx
-        self.vy = vy
-        self.vxi = vx
-        self.vyi = vy
-        self.ax = 0
-        self.ay = 0
-        self.mass = mass
-        self.color = color
-        self.radius = math.cbrt(mass)
-
-    def reset(self):
-        self.vx = self.vxi
-        self.vy = self.vyi
-        self.x = self.xi
-        self.y = self.yi
-
-
 class KeyHelpMenu:
-    def __init__(self, screen_width, screen_height):
+    def __init__(self, screen_width, screen_height, font=None):
         self.active = False
         self.menu_width = 500
         self.menu_height = 435
         self.rect = pygame.Rect((screen_width - self.menu_width) // 2,
                                 (screen_height - self.menu_height) // 2,
                                 self.menu_width, self.menu_height)
-        self.font = pygame.font.Font(None, 24)
+        self.font = font or TextCache(pygame.font.Font(None, 24))
         self.current_page = 0
         self.keys_per_page = 12
         self.total_pages = (len(KEY_HELP) + self.keys_per_page - 1) // self.keys_per_page
@@ -275,8 +332,15 @@ class KeyHelpMenu:
             y_offset += 30
 
 
-class PhysicsSimulation:
-    def __init__(self):
+class PhysicsSimulation(Simulation):
+    # The physics runs on a PhysicsWorker thread while run() draws its frames;
+    # subclasses that drive the store from the UI thread turn this off
+    threaded = True
+
+    def __init__(self, gravity_mode="direct", theta=DEFAULT_THETA, seed=None, integrator="leapfrog"):
+        super().__init__(gravity_mode, theta, seed, integrator)
+        pygame.init()
+
         # Get display info and set up fullscreen
         display_info = pygame.display.Info()
         self.SCREEN_WIDTH = display_info.current_w
@@ -287,22 +351,24 @@ class PhysicsSimulation:
         pygame.display.set_caption("Gravity Simulator")
         self.clock = pygame.time.Clock()
 
-        # Simulation properties
-        self.particles: List[PointMass] = []
+        # View properties
         self.show_axes = False
         self.zoom = 1.0
         self.offset_x = self.SCREEN_WIDTH // 2
         self.offset_y = self.SCREEN_HEIGHT // 2
-        self.time = 0
         self.dragging = False
         self.last_mouse_pos = None
 
         # UI elements
-        self.font = pygame.font.Font(None, 24)
-        self.particle_menu = ParticleCreationMenu(self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
+        self.font = TextCache(pygame.font.Font(None, 24))
+        self.particle_labels = {}
+        self.particle_menu = ParticleCreationMenu(self.SCREEN_WIDTH, self.SCREEN_HEIGHT, self.font)
 
         self.delete_button_rect = pygame.Rect(10, 170, 100, 30)
         self.delete_mode = False
+        self.spatial_index = SpatialIndex()
+        self.selection_start = None
+        self.selection_end = None
         self.paused = False
 
         self.windowed_size = (1024, 768)  # Default windowed size
@@ -310,122 +376,57 @@ class PhysicsSimulation:
         self.screen = pygame.display.set_mode(self.windowed_size, pygame.RESIZABLE)
 
         self.following_massive = False
-        self.time_accel = 1
         self.show_labels = True
-
-        self.toCollide = []
-        self.bounding_box = None
-        self.explosion = 0
-        self.G = 20
-        self.key_help_menu = KeyHelpMenu(self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
-
-    def getAccelVector(self, pointMass):
-        ax = 0
-        ay = 0
-        for particle in self.particles:
-            if particle is pointMass:
-                continue
-            self.checkCollision(particle, pointMass)
-
-            # Calculate distance vector components
-            dx = particle.x - pointMass.x
-            dy = particle.y - pointMass.y
-            r = math.sqrt(dx * dx + dy * dy)
-
-            # Calculate gravitational force magnitude
-            if r != 0:
-                gmag = self.G * particle.mass / (r * r)  # Note: using r² for inverse square law
-                # Add acceleration components using normalized direction vector
-                ax += gmag * dx / r
-                ay += gmag * dy / r
-            else:
-                self.toCollide.append((pointMass, particle))
-
-        return (ax, ay)
-
-    def advance(self, time_accel):  # Using leapfrog approach
-        dt = DT_NORM * time_accel
-        for particle in self.particles:
-            particle.ax, particle.ay = self.getAccelVector(particle)
-            particle.vx = particle.vx + 0.5 * particle.ax * dt
-            particle.vy = particle.vy + 0.5 * particle.ay * dt
-            particle.x = particle.x + particle.vx * dt
-            particle.y = particle.y + particle.vy * dt
-
-            particle.ax, particle.ay = self.getAccelVector(particle)
-            particle.vx = particle.vx + 0.5 * particle.ax * dt
-            particle.vy = particle.vy + 0.5 * particle.ay * dt
-
-            if self.bounding_box:
-                left, top, right, bottom = self.bounding_box
-                vmag = math.sqrt(particle.vx ** 2 + particle.vy ** 2)
-                # Elastic bounce conditions
-                if particle.x < left:
-                    particle.x = left
-                    particle.vx = abs(particle.vx)
-                    for _ in range(self.explosion):
-                        self.particles.append(PointMass(particle.name, right, random.random() * (bottom - top) + top,
-                                                        -abs(vmag * math.cos(random.random() * 2 * math.pi)),
-                                                        vmag * math.sin(random.random() * 2 * math.pi), particle.mass,
-                                                        particle.color))
-                elif particle.x > right:
-                    particle.x = right
-                    particle.vx = -abs(particle.vx)
-                    for _ in range(self.explosion):
-                        self.particles.append(PointMass(particle.name, left, random.random() * (bottom - top) + top,
-                                                        abs(vmag * math.cos(random.random() * 2 * math.pi)),
-                                                        vmag * math.sin(random.random() * 2 * math.pi), particle.mass,
-                                                        particle.color))
-                if particle.y > bottom:
-                    particle.y = bottom
-                    particle.vy = -abs(particle.vy)
-                    for _ in range(self.explosion):
-                        self.particles.append(PointMass(particle.name, random.random() * (right - left) + left, top,
-                                                        vmag * math.cos(random.random() * 2 * math.pi),
-                                                        abs(vmag * math.sin(random.random() * 2 * math.pi)),
-                                                        particle.mass, particle.color))
-                elif particle.y < top:
-                    particle.y = top
-                    particle.vy = abs(particle.vy)
-                    for _ in range(self.explosion):
-                        self.particles.append(PointMass(particle.name, random.random() * (right - left) + left, bottom,
-                                                        vmag * math.cos(random.random() * 2 * math.pi),
-                                                        -abs(vmag * math.sin(random.random() * 2 * math.pi)),
-                                                        particle.mass, particle.color))
-
-        self.collide(self.particles)
-
-    def checkCollision(self, particle0, particle1):
-        if particle0.mass >= particle1.mass and math.sqrt((particle0.x - particle1.x) ** 2 + (
-                particle0.y - particle1.y) ** 2) < particle0.radius + particle1.radius:
-            self.toCollide.append((particle0, particle1))
-
-    def collide(self, particlesArray):
-        for pair in self.toCollide:
-            if pair[0] in particlesArray and pair[1] in particlesArray:
-                particle0 = pair[0]
-                particle1 = pair[1]
-                px = particle0.mass * particle0.vx + particle1.mass * particle1.vx
-                py = particle0.mass * particle0.vy + particle1.mass * particle1.vy
-                particlesArray.remove(particle1)
-                particle0.mass += particle1.mass
-                particle0.vx = px / particle0.mass
-                particle0.vy = py / particle0.mass
-                particle0.radius = math.cbrt(particle0.mass)
-                particle0.x = (particle0.mass * particle0.x + particle1.mass * particle1.x) / (
-                            particle0.mass + particle1.mass)
-                particle0.y = (particle0.mass * particle0.y + particle1.mass * particle1.y) / (
-                            particle0.mass + particle1.mass)
-        self.toCollide = []
+        self.render_mode = RENDER_MODES[0]
+        # Density mode scratch: screen coordinates and bins for every body,
+        # kept between frames, and COLORMAP mapped to the screen's pixel format
+        self.density_positions = np.empty((2, 0))
+        self.density_bins = np.empty((2, 0), dtype=np.intp)
+        self.density_palette = (None, None)
+        self.key_help_menu = KeyHelpMenu(self.SCREEN_WIDTH, self.SCREEN_HEIGHT, self.font)
+
+        # Drawing reads self.frame, a snapshot of the bodies, never the live store
+        self.worker = None
+        self.frame = None
+        self.error_requested = False
 
     def center_on_massive(self):
-        if not self.particles:
+        frame = self.frame
+        if not frame:
             return
         # Find most massive particle
-        massive = max(self.particles, key=lambda p: p.mass)
+        massive = int(np.argmax(frame.mass))
         # Center view on it
-        self.offset_x = self.SCREEN_WIDTH // 2 - massive.x * self.zoom
-        self.offset_y = self.SCREEN_HEIGHT // 2 + massive.y * self.zoom
+        self.offset_x = self.SCREEN_WIDTH // 2 - frame.x[massive] * self.zoom
+        self.offset_y = self.SCREEN_HEIGHT // 2 + frame.y[massive] * self.zoom
+
+    def update_frame(self):
+        # The snapshot drawn next: the worker's latest, or a fresh copy of the
+        # store when nothing else is stepping it
+        if self.worker is not None:
+            self.frame = self.worker.latest()
+        else:
+            self.frame = capture(self, self.frame)
+
+    def command(self, function, *args):
+        # Changes to the simulation run on the physics thread between steps
+        # once it is running, and right away before that
+        if self.worker is None:
+            function(*args)
+        else:
+            self.worker.submit(function, *args)
+
+    def request_gravity_error(self):
+        # The measurement reads the store, so it is queued once and runs on
+        # the physics thread; a later settings change asks for a new one
+        if not self.error_requested:
+            self.error_requested = True
+            self.command(self.refresh_gravity_error)
+
+    def refresh_gravity_error(self):
+        self.error_requested = False
+        if self.gravity_error is None and self.particles:
+            self.measure_gravity_error()
 
     def world_to_screen(self, x, y):
         screen_x = self.offset_x + x * self.zoom
@@ -437,9 +438,81 @@ class PhysicsSimulation:
         world_y = (self.offset_y - screen_y) / self.zoom  # Flip y-axis
         return world_x, world_y
 
+    def zoom_at(self, pos, factor):
+        # Get world position of mouse before zoom
+        mouse_world_x, mouse_world_y = self.screen_to_world(*pos)
+        self.zoom *= factor
+        # Get new screen position of the same world point
+        new_mouse_screen_x = self.offset_x + mouse_world_x * self.zoom
+        new_mouse_screen_y = self.offset_y - mouse_world_y * self.zoom
+        # Adjust offset to keep mouse position fixed
+        self.offset_x += pos[0] - new_mouse_screen_x
+        self.offset_y += pos[1] - new_mouse_screen_y
+
     def add_particle(self, particle: PointMass):
         self.particles.append(particle)
 
+    def body_at(self, pos):
+        # Slot in self.frame of the body under a screen position, or None
+        frame = self.frame
+        if frame is None or frame.index is None:
+            return None
+        world_x, world_y = self.screen_to_world(*pos)
+        slot = frame.index.nearest(frame, world_x, world_y)
+        if slot is None:
+            return None
+        reach = max(frame.radius[slot], PICK_PIXELS / self.zoom)
+        if math.hypot(frame.x[slot] - world_x, frame.y[slot] - world_y) > reach:
+            return None
+        return slot
+
+    def delete_selection(self, start, end):
+        # A click deletes the body under it, a drag every body in the rectangle
+        frame = self.frame
+        if abs(end[0] - start[0]) < SELECT_MIN_PIXELS and abs(end[1] - start[1]) < SELECT_MIN_PIXELS:
+            slot = self.body_at(end)
+            slots = [] if slot is None else [slot]
+        elif frame is not None and frame.index is not None:
+            slots = frame.index.in_rect(frame, *self.screen_to_world(*start), *self.screen_to_world(*end))
+        else:
+            slots = []
+        if len(slots):
+            self.command(self.remove_bodies, frame.ids[slots].tolist())
+            self.delete_mode = False
+
+    def draw_selection(self):
+        if self.selection_start is None:
+            return
+        (x0, y0), (x1, y1) = self.selection_start, self.selection_end
+        rect = pygame.Rect(min(x0, x1), min(y0, y1), abs(x1 - x0), abs(y1 - y0))
+        pygame.draw.rect(self.screen, RED, rect, 1)
+
+    def draw_tooltip(self):
+        # Name, mass, velocity and acceleration of the body under the mouse
+        if self.dragging or self.selection_start is not None or self.particle_menu.active:
+            return
+        pos = pygame.mouse.get_pos()
+        slot = self.body_at(pos)
+        if slot is None:
+            return
+        frame = self.frame
+        vx, vy, ax, ay = frame.vx[slot], frame.vy[slot], frame.ax[slot], frame.ay[slot]
+        lines = [frame.name(slot) + (" (tracer)" if frame.tracer[slot] else ""),
+                 f"Mass: {frame.mass[slot]:.4g}",
+                 f"Velocity: ({vx:.3g}, {vy:.3g}), |v| = {math.hypot(vx, vy):.3g}",
+                 f"Acceleration: ({ax:.3g}, {ay:.3g}), |a| = {math.hypot(ax, ay):.3g}"]
+        surfaces = [self.font.render(line, True, WHITE) for line in lines]
+        width = max(surface.get_width() for surface in surfaces) + 10
+        height = sum(surface.get_height() for surface in surfaces) + 10
+        # Below and right of the cursor, flipped to stay on screen
+        x = pos[0] + 15 if pos[0] + 15 + width <= self.screen.get_width() else pos[0] - 15 - width
+        y = pos[1] + 15 if pos[1] + 15 + height <= self.screen.get_height() else pos[1] - 15 - height
+        pygame.draw.rect(self.screen, BLACK, (x, y, width, height))
+        pygame.draw.rect(self.screen, GRAY, (x, y, width, height), 1)
+        for surface in surfaces:
+            self.screen.blit(surface, (x + 5, y + 5))
+            y += surface.get_height()
+
     def draw_grid(self):
         if not self.show_axes:
             return
@@ -484,8 +557,9 @@ class PhysicsSimulation:
             end_x, end_y = self.world_to_screen(right, 0)
             pygame.draw.line(self.screen, WHITE, (0, start_y), (self.SCREEN_WIDTH, end_y), 3)
 
-        if self.bounding_box:
-            l, t, r, b = self.bounding_box
+        bounding_box = self.frame.bounding_box if self.frame is not None else None
+        if bounding_box:
+            l, t, r, b = bounding_box
             top_left = self.world_to_screen(l, t)
             bottom_right = self.world_to_screen(r, b)
             pygame.draw.rect(self.screen, GREEN,
@@ -512,18 +586,32 @@ class PhysicsSimulation:
             y += number_spacing
 
     def draw_ui(self):
-        particle_text = self.font.render("Particle count: " + str(len(self.particles)), True, WHITE)
+        frame = self.frame
+        particle_label = "Particle count: " + str(frame.count)
+        tracers = int(np.count_nonzero(frame.tracer))
+        if tracers:
+            particle_label += f" ({tracers} tracers" + (", colliding)" if self.tracer_collisions else ")")
+        particle_text = self.font.render(particle_label, True, WHITE)
         self.screen.blit(particle_text, (10, 10))
 
         # Draw time
-        time_text = self.font.render(f"Time: {self.time:.2f}" + " (" + str(self.time_accel) + "x)", True, WHITE)
+        time_label = f"Time: {frame.time:.2f}" + " (" + str(self.time_accel) + "x"
+        if self.last_dropped > 0:
+            # More steps per frame than MAX_SUBSTEPS would allow, so the run lags behind
+            time_label += (f", reaching {self.effective_accel():.3g}x at the substep cap, "
+                           f"{self.dropped_time:.3g} s dropped")
+        time_text = self.font.render(time_label + ")", True, RED if self.last_dropped > 0 else WHITE)
         self.screen.blit(time_text, (10, 40))
 
-        G_text = self.font.render("G = " + " " + str(self.G), True, WHITE)
+        G_label = "G = " + " " + str(self.G)
+        if self.softening:
+            G_label += f", softening {self.softening:g}"
+        G_text = self.font.render(G_label, True, WHITE)
         self.screen.blit(G_text, (10, 70))
 
         if self.bounding_box:
-            explosion_text = self.font.render("Explosion count: " + " " + str(self.explosion), True, WHITE)
+            explosion_text = self.font.render("Explosion count: " + " " + str(self.explosion)
+                                              + f" (capped at {self.max_particles} particles)", True, WHITE)
             self.screen.blit(explosion_text, (10, 100))
 
         if self.delete_mode:
@@ -532,29 +620,225 @@ class PhysicsSimulation:
             text_rect = text.get_rect(center=self.delete_button_rect.center)
             self.screen.blit(text, text_rect)
 
+        self.draw_selection()
+        self.draw_tooltip()
+
         # Draw particle creation menu if active
         self.particle_menu.draw(self.screen)
         self.key_help_menu.draw(self.screen)
 
+        solver, gravity_error = self.solver, self.gravity_error
+        if self.gravity_mode == "barnes_hut":
+            if gravity_error is None and frame:
+                self.request_gravity_error()
+            gravity_label = f"Gravity: Barnes-Hut (theta = {self.theta:.2f}"
+            if gravity_error is not None:
+                gravity_label += f", error {gravity_error['rms'] * 100:.2f}%"
+            gravity_text = self.font.render(gravity_label + ")", True, WHITE)
+            self.screen.blit(gravity_text, (10, 210))
+        elif self.gravity_mode == "jit":
+            compiled = "compiled" if hasattr(solver, "overlaps_for") else "numba missing, using NumPy"
+            gravity_text = self.font.render(f"Gravity: JIT direct sum ({compiled})", True, WHITE)
+            self.screen.blit(gravity_text, (10, 210))
+        elif self.gravity_mode in ("pm", "p3m"):
+            if gravity_error is None and frame:
+                self.request_gravity_error()
+            method = "P3M" if self.gravity_mode == "p3m" else "particle-mesh"
+            gravity_label = f"Gravity: {method} ({self.mesh_grid}x{self.mesh_grid} mesh"
+            if gravity_error is not None:
+                gravity_label += f", error {gravity_error['rms'] * 100:.2f}%"
+            gravity_text = self.font.render(gravity_label + ")", True, WHITE)
+            self.screen.blit(gravity_text, (10, 210))
+        elif self.gravity_mode == "parallel" and hasattr(solver, "workers"):
+            # The mode is set after the solver, so they can disagree for a frame
+            gravity_text = self.font.render(f"Gravity: parallel direct sum ({solver.workers} workers)",
+                                            True, WHITE)
+            self.screen.blit(gravity_text, (10, 210))
+
+        step_label = f"Substeps: {self.substeps} (dt = {self.last_dt:.4f}"
+        step_text = self.font.render(step_label + (", adaptive)" if self.adaptive else ")"), True, WHITE)
+        self.screen.blit(step_text, (10, 240))
+
+        integrator_text = self.font.render(f"Integrator: {self.integrator.name} "
+                                           f"({self.integrator.force_evaluations:.3g} force evaluations/step)", True, WHITE)
+        self.screen.blit(integrator_text, (10, 270))
+
+        # The physics thread may stop the recorder or monitor at any moment,
+        # so each is read once, like the solver and gravity error above
+        recorder = self.recorder
+        if recorder is not None:
+            recording_label = f"Recording to {recorder.path} ({recorder.frames_written} frames written"
+            if recorder.frames_dropped:
+                recording_label += f", {recorder.frames_dropped} dropped: disk too slow"
+            recording_text = self.font.render(recording_label + ")", True, RED)
+            self.screen.blit(recording_text, (10, 300))
+
+        monitor = self.monitor
+        if monitor is not None:
+            drift = monitor.drift()
+            if drift is None:
+                drift_label = "Drift: waiting for first sample"
+            else:
+                drift_label = (f"Drift: energy {drift['energy']:+.2e}, momentum {drift['momentum']:.2e}, "
+                               f"angular momentum {drift['angular_momentum']:+.2e}")
+            worst = 0 if drift is None else max(abs(drift['energy']), abs(drift['angular_momentum']))
+            drift_text = self.font.render(drift_label + f" (every {monitor.interval} steps)", True,
+                                          RED if worst > 1e-2 else WHITE)
+            self.screen.blit(drift_text, (10, 330))
+
+        if self.render_mode != "particles":
+            render_text = self.font.render(f"Render: {self.render_mode} (log scale)", True, WHITE)
+            self.screen.blit(render_text, (10, 360))
+
         play_status = "PAUSED" if self.paused else "PLAYING"
         status_text = self.font.render(play_status, True, RED if self.paused else GREEN)
         self.screen.blit(status_text, (10, 130))  # Position below other UI elements
 
-    def draw_particles(self):
-        for particle in self.particles:
-            screen_x, screen_y = self.world_to_screen(particle.x, particle.y)
-
-            # Draw particle
-            pygame.gfxdraw.filled_circle(self.screen, screen_x, screen_y,
-                                         int(particle.radius * self.zoom), particle.color)
-            pygame.gfxdraw.aacircle(self.screen, screen_x, screen_y,
-                                    int(particle.radius * self.zoom), particle.color)
+    def draw_profiler(self):
+        # Rolling per-phase frame times and per-frame counters, top right.
+        # collide, integrate and bounds run inside advance. With the physics
+        # thread they overlap the drawing phases and are added to the frame
+        # that picks up the step's snapshot.
+        lines = [("Phase", "mean", "p50", "p95", "max")]
+        for phase, stats in self.profiler.phase_stats().items():
+            lines.append((phase, *(f"{stats[key]:.2f}" for key in ('mean', 'p50', 'p95', 'max'))))
+        lines.append(("Counter", "/frame", "total", "", ""))
+        for counter, stats in self.profiler.counter_stats().items():
+            lines.append((counter, f"{stats['per_frame']:.3g}", str(stats['total']), "", ""))
+
+        columns = (0, 130, 190, 250, 310)
+        left = self.SCREEN_WIDTH - 380
+        for row, line in enumerate(lines):
+            color = GREEN if row == 0 or line[0] == "Counter" else WHITE
+            for column, cell in zip(columns, line):
+                if cell:
+                    self.screen.blit(self.font.render(cell, True, color), (left + column, 10 + 22 * row))
 
-            # Draw label with offset outside particle radius
-            if self.show_labels:
-                text = self.font.render(particle.name + " (" + str(round(particle.mass)) + ")", True, particle.color)
-                offset = int(particle.radius * self.zoom) + 5  # Offset from particle edge
-                self.screen.blit(text, (screen_x + offset, screen_y - offset))
+    def draw_particles(self):
+        store = self.frame
+        if not store:
+            return
+        if self.render_mode != "particles":
+            self.draw_density()
+            return
+        screen_x = self.offset_x + store.x * self.zoom
+        screen_y = self.offset_y - store.y * self.zoom  # Flip y-axis
+        screen_r = store.radius * self.zoom
+
+        # Cull everything whose disc misses the window
+        visible = np.nonzero((screen_x + screen_r >= 0) & (screen_x - screen_r < self.SCREEN_WIDTH) &
+                             (screen_y + screen_r >= 0) & (screen_y - screen_r < self.SCREEN_HEIGHT))[0]
+        px = screen_x[visible].astype(int)
+        py = screen_y[visible].astype(int)
+        pr = screen_r[visible].astype(int)
+
+        # Sub-pixel bodies become single pixels written in one batch
+        dots = pr == 0
+        self.draw_pixels(px[dots], py[dots], store.colors[visible[dots]])
+
+        for slot, x, y, r in zip(visible[~dots].tolist(), px[~dots].tolist(), py[~dots].tolist(),
+                                 pr[~dots].tolist()):
+            color = tuple(store.colors[slot].tolist())
+            pygame.gfxdraw.filled_circle(self.screen, x, y, r, color)
+            # The anti-aliased outline is invisible on tiny discs
+            if r >= AA_MIN_RADIUS:
+                pygame.gfxdraw.aacircle(self.screen, x, y, r, color)
+
+        # Draw label with offset outside particle radius
+        if self.show_labels:
+            for slot, x, y, r in zip(visible.tolist(), px.tolist(), py.tolist(), pr.tolist()):
+                body_id = int(store.ids[slot])
+                label = (store.name(slot) + " (" + str(round(store.mass[slot])) + ")", True,
+                         tuple(store.colors[slot].tolist()))
+                # A merger changes the mass in the label, drop the outdated surface
+                previous = self.particle_labels.get(body_id)
+                if previous is not None and previous != label:
+                    self.font.discard(*previous)
+                self.particle_labels[body_id] = label
+                text = self.font.render(*label)
+                offset = r + 5  # Offset from particle edge
+                self.screen.blit(text, (x + offset, y - offset))
+
+        # Forget labels of bodies that were absorbed or deleted
+        if len(self.particle_labels) > len(store):
+            alive = set(store.ids.tolist())
+            for body_id in [body_id for body_id in self.particle_labels if body_id not in alive]:
+                self.font.discard(*self.particle_labels.pop(body_id))
+
+    def draw_density(self):
+        # Bins bodies into a histogram with one spare row and column on each
+        # side: clipping lands everything off screen in the margin, so a
+        # single cast and bincount handle all bodies without a mask, and the
+        # few margin bins stay in cache however many bodies they take. Only
+        # occupied pixels are painted, so the grid stays visible.
+        store = self.frame
+        n = len(store.x)
+        if self.density_bins.shape[1] < n:
+            capacity = max(n, 2 * self.density_bins.shape[1])
+            self.density_positions = np.empty((2, capacity))
+            self.density_bins = np.empty((2, capacity), dtype=np.intp)
+        width, height = self.screen.get_width(), self.screen.get_height()
+        columns = np.multiply(store.x, self.zoom, out=self.density_positions[0, :n])
+        columns += self.offset_x + 1
+        np.clip(columns, 0, width + 1, out=columns)
+        rows = np.multiply(store.y, -self.zoom, out=self.density_positions[1, :n])  # Flip y-axis
+        rows += self.offset_y + 1
+        np.clip(rows, 0, height + 1, out=rows)
+        bins, column_bins = self.density_bins[:, :n]
+        np.copyto(bins, rows, casting='unsafe')
+        bins *= width + 2
+        np.copyto(column_bins, columns, casting='unsafe')
+        bins += column_bins
+        weights = store.mass if self.render_mode == "mass density" else None
+        histogram = np.bincount(bins, weights=weights, minlength=(width + 2) * (height + 2))
+        histogram = histogram.reshape(height + 2, width + 2)
+        histogram[[0, -1], :] = 0
+        histogram[:, [0, -1]] = 0
+        histogram = histogram.ravel()
+        occupied = np.flatnonzero(histogram != 0)  # Much faster than on the counts themselves
+        values = histogram[occupied]
+        if len(values) == 0:
+            return
+        # Bin (y + 1) * (width + 2) + x + 1 to pixel y * width + x
+        pixel = occupied // (width + 2)
+        pixel *= -2
+        pixel += occupied
+        pixel -= width + 1
+        level = np.log1p(values / values.min())
+        top = float(level.max())
+        shade = (level * (255 / top)).astype(np.intp) if top > 0 else np.full(len(values), 255)
+        try:
+            pixels = pygame.surfarray.pixels2d(self.screen)
+        except ValueError:
+            # 24-bit surfaces have no integer pixel view
+            y, x = np.divmod(pixel, width)
+            self.draw_pixels(x, y, COLORMAP[shade])
+            return
+        pixel_format = (self.screen.get_bitsize(), self.screen.get_masks())
+        if self.density_palette[0] != pixel_format:
+            self.density_palette = (pixel_format, np.array([self.screen.map_rgb(color) for color in COLORMAP.tolist()],
+                                                           dtype=pixels.dtype))
+        if pixels.T.flags.c_contiguous:
+            pixels.T.reshape(-1)[pixel] = self.density_palette[1][shade]
+        else:
+            y, x = np.divmod(pixel, width)
+            pixels[x, y] = self.density_palette[1][shade]
+        del pixels  # Unlock the surface
+
+    def draw_pixels(self, x, y, colors):
+        if len(x) == 0:
+            return
+        on_screen = (x >= 0) & (x < self.screen.get_width()) & (y >= 0) & (y < self.screen.get_height())
+        x, y, colors = x[on_screen], y[on_screen], colors[on_screen]
+        try:
+            pixels = pygame.surfarray.pixels3d(self.screen)
+        except ValueError:
+            # Palette surfaces have no direct RGB view
+            for px, py, color in zip(x.tolist(), y.tolist(), colors.tolist()):
+                self.screen.set_at((px, py), color)
+            return
+        pixels[x, y] = colors
+        del pixels  # Unlock the surface
 
     def handle_events(self):
         for event in pygame.event.get():
@@ -565,52 +849,37 @@ class PhysicsSimulation:
             new_particle = self.particle_menu.handle_event(event)
             self.key_help_menu.handle_event(event)
             if new_particle:
-                self.add_particle(new_particle)
+                self.command(self.add_particle, new_particle)
                 continue
             # if self.key_help_menu.active:
             # self.key_help_menu.handle_event(event)
 
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # Left click
-                    if self.delete_mode:  # Check if clicked on a particle
-                        for particle in self.particles[:]:  # Create copy of list to avoid modification issues
-                            screen_x, screen_y = self.world_to_screen(particle.x, particle.y)
-                            if math.sqrt((event.pos[0] - screen_x) ** 2 + (
-                                    event.pos[1] - screen_y) ** 2) < particle.radius * self.zoom:
-                                self.particles.remove(particle)
-                                self.delete_mode = False
-                                break
+                    if self.delete_mode:  # Click on a particle or drag a rectangle around several
+                        self.selection_start = self.selection_end = event.pos
                     # Handle dragging (only if not clicking on UI)
                     elif not self.particle_menu.active:
                         self.dragging = True
                         self.last_mouse_pos = event.pos
 
                 elif event.button == 4:  # Mouse wheel up
-                    # Get world position of mouse before zoom
-                    mouse_world_x, mouse_world_y = self.screen_to_world(*event.pos)
-                    self.zoom *= ZOOM_FACTOR
-                    # Get new screen position of the same world point
-                    new_mouse_screen_x = self.offset_x + mouse_world_x * self.zoom
-                    new_mouse_screen_y = self.offset_y - mouse_world_y * self.zoom
-                    # Adjust offset to keep mouse position fixed
-                    self.offset_x += event.pos[0] - new_mouse_screen_x
-                    self.offset_y += event.pos[1] - new_mouse_screen_y
+                    self.zoom_at(event.pos, ZOOM_FACTOR)
 
                 elif event.button == 5:  # Mouse wheel down
-                    # Same logic for zooming out
-                    mouse_world_x, mouse_world_y = self.screen_to_world(*event.pos)
-                    self.zoom /= ZOOM_FACTOR
-                    new_mouse_screen_x = self.offset_x + mouse_world_x * self.zoom
-                    new_mouse_screen_y = self.offset_y - mouse_world_y * self.zoom
-                    self.offset_x += event.pos[0] - new_mouse_screen_x
-                    self.offset_y += event.pos[1] - new_mouse_screen_y
+                    self.zoom_at(event.pos, 1 / ZOOM_FACTOR)
 
             elif event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:  # Left click release
                     self.dragging = False
+                    if self.selection_start is not None:
+                        self.delete_selection(self.selection_start, event.pos)
+                        self.selection_start = self.selection_end = None
 
             elif event.type == pygame.MOUSEMOTION:
-                if self.dragging and not self.particle_menu.active:
+                if self.selection_start is not None:
+                    self.selection_end = event.pos
+                elif self.dragging and not self.particle_menu.active:
                     current_pos = event.pos
                     dx = current_pos[0] - self.last_mouse_pos[0]
                     dy = current_pos[1] - self.last_mouse_pos[1]
@@ -621,24 +890,6 @@ class PhysicsSimulation:
             elif event.type == pygame.KEYDOWN and not self.particle_menu.active:
                 if event.key == pygame.K_SPACE:
                     self.paused = not self.paused
-                elif event.key == pygame.K_q:
-                    self.particles = []
-                    for i in range(math.floor(random.random() * 9 + 2)):
-                        self.particles.append(PointMass(
-                            "P" + str(i),
-                            random.random() * 1000 - 500,
-                            random.random() * 1000 - 500,
-                            random.random() * 300 - 150,
-                            random.random() * 300 - 150,
-                            10 ** (random.random() * 7),
-                            (math.floor(random.random() * 256), math.floor(random.random() * 256),
-                             math.floor(random.random() * 256))
-                        ))
-                elif event.key == pygame.K_c:
-                    self.particles = []
-                    self.time_accel = 1
-                    self.bounding_box = None
-                    self.G = 20
                 elif event.key == pygame.K_w:
                     self.following_massive = not self.following_massive
                     if not self.following_massive:
@@ -647,131 +898,328 @@ class PhysicsSimulation:
                         self.offset_y = self.SCREEN_HEIGHT // 2
                 elif event.key == pygame.K_g:
                     self.show_axes = not self.show_axes
-                elif event.key == pygame.K_RIGHT:
-                    self.time_accel *= 2
-                elif event.key == pygame.K_LEFT:
-                    self.time_accel /= 2
-                elif event.key == pygame.K_s:
-                    self.particles = []
-                    self.show_labels = False
-                    for i in range(-500, 550, 50):
-                        for j in range(-500, 550, 50):
-                            if random.random() < 1 / 3:
-                                mass = 1
-                            else:
-                                mass = 100
-                            self.particles.append(PointMass("P" + str(i) + "," + str(j), i, j, 0, 0, mass,
-                                                            (math.floor(random.random() * 256),
-                                                             math.floor(random.random() * 256),
-                                                             math.floor(random.random() * 256))))
                 elif event.key == pygame.K_n:
                     self.show_labels = not self.show_labels
-                elif event.key == pygame.K_b:
-                    self.particles = []
-                    self.show_labels = False
-                    self.particles.append(PointMass("Star", 0, 0, 0, 0, 1000000, WHITE))
-                    for r in range(200, 1000, 3):
-                        self.create_circular_orbit(r, 100)
+                elif event.key == pygame.K_h:
+                    self.render_mode = RENDER_MODES[(RENDER_MODES.index(self.render_mode) + 1) % len(RENDER_MODES)]
                 elif event.key == pygame.K_a:
                     self.particle_menu.active = True
                 elif event.key == pygame.K_z:
                     self.delete_mode = not self.delete_mode
-                elif event.key == pygame.K_r:
-                    # Create bounding box from origin to current mouse position
-                    mouse_world_x, mouse_world_y = self.screen_to_world(*pygame.mouse.get_pos())
-                    self.bounding_box = (min(mouse_world_x, -mouse_world_x), min(-mouse_world_y, mouse_world_y),
-                                         max(-mouse_world_x, mouse_world_x), max(-mouse_world_y, mouse_world_y))
-                elif event.key == pygame.K_RIGHTBRACKET:
-                    self.explosion += 1
-                elif event.key == pygame.K_LEFTBRACKET and self.explosion > 0:
-                    self.explosion -= 1
-                elif event.key == pygame.K_3:
-                    self.create_three_body_system()
-                elif event.key == pygame.K_UP:
-                    self.G += 1
-                elif event.key == pygame.K_DOWN and self.G > 0:
-                    self.G -= 1
+                elif event.key == pygame.K_p:
+                    self.profiler.set_enabled(not self.profiler.enabled)
                 elif event.key == pygame.K_SLASH:
                     self.key_help_menu.active = not self.key_help_menu.active
+                else:
+                    if event.key in (pygame.K_s, pygame.K_b, pygame.K_k):
+                        self.show_labels = False  # Too many bodies to label
+                    mouse_world = self.screen_to_world(*pygame.mouse.get_pos())
+                    self.command(self.press_key, event.key, event.mod, mouse_world, self.prebuild_solvers(event.key))
 
         return True
 
-    def create_circular_orbit(self, r, mass):
-        theta = random.random() * 2 * math.pi
-        vmag = math.sqrt(20 * 1000000 / r)
-        self.particles.append(PointMass(
-            "C" + str(r),
-            r * math.cos(theta),
-            r * math.sin(theta),
-            vmag * math.cos(theta + math.pi / 2),
-            vmag * math.sin(theta + math.pi / 2),
-            mass,
-            (math.floor(random.random() * 256), math.floor(random.random() * 256), math.floor(random.random() * 256))
-        ))
-
-    def create_three_body_system(self):
-        self.particles = []
-        mass = 10000
-        radius = 100
-
-        # Calculate velocities for stable configuration
-        orbital_velocity = math.sqrt(self.G * mass * 3 / (2 * radius))
-
-        self.particles.append(PointMass("Body1",
-                                        radius * math.cos(0),
-                                        radius * math.sin(0),
-                                        orbital_velocity * math.cos(math.pi / 2),
-                                        orbital_velocity * math.sin(math.pi / 2),
-                                        mass, RED))
-
-        self.particles.append(PointMass("Body2",
-                                        radius * math.cos(2 * math.pi / 3),
-                                        radius * math.sin(2 * math.pi / 3),
-                                        orbital_velocity * math.cos(7 * math.pi / 6),
-                                        orbital_velocity * math.sin(7 * math.pi / 6),
-                                        mass, GREEN))
-
-        self.particles.append(PointMass("Body3",
-                                        radius * math.cos(4 * math.pi / 3),
-                                        radius * math.sin(4 * math.pi / 3),
-                                        orbital_velocity * math.cos(11 * math.pi / 6),
-                                        orbital_velocity * math.sin(11 * math.pi / 6),
-                                        mass, BLUE))
+    def prebuild_solvers(self, key):
+        # The parallel solver starts its process pool when it is built, which
+        # belongs on the main thread, so a key that may switch to it builds it
+        # here for press_key
+        if key == pygame.K_t:
+            mode = GRAVITY_MODES[(GRAVITY_MODES.index(self.gravity_mode) + 1) % len(GRAVITY_MODES)]
+        elif key == pygame.K_F9:
+            try:
+                mode = snapshot.read_header(SNAPSHOT_PATH)[0]['gravity_mode']
+            except (OSError, ValueError):
+                return None
+        else:
+            return None
+        return {mode: self.make_solver(mode)} if mode == "parallel" else None
+
+    def press_key(self, key, mod, mouse_world, prebuilt=None):
+        # Keys that change the simulation, run as a command on the physics
+        # thread. prebuilt holds solvers from prebuild_solvers.
+        try:
+            self.apply_key(key, mod, mouse_world, prebuilt)
+        finally:
+            for solver in (prebuilt or {}).values():
+                solver.close()  # Built for a mode the key did not switch to after all
+
+    def apply_key(self, key, mod, mouse_world, prebuilt):
+        if key == pygame.K_q:
+            self.create_random_scene()
+        elif key == pygame.K_c:
+            self.reset()
+        elif key == pygame.K_RIGHT:
+            self.time_accel *= 2
+        elif key == pygame.K_LEFT:
+            self.time_accel /= 2
+        elif key == pygame.K_s:
+            self.create_grid()
+        elif key == pygame.K_b:
+            self.create_star_system(tracers=bool(mod & pygame.KMOD_SHIFT))
+        elif key == pygame.K_k and mod & pygame.KMOD_SHIFT:
+            keplerian_disk(self, TRACER_DISK_BODIES, tracers=True)
+        elif key == pygame.K_k:
+            keplerian_disk(self, DISK_BODIES)
+        elif key == pygame.K_e:
+            if self.monitor is None:
+                self.start_monitor()
+            else:
+                self.stop_monitor()
+        elif key == pygame.K_r:
+            # Create bounding box from origin to the mouse position
+            mouse_world_x, mouse_world_y = mouse_world
+            self.bounding_box = (min(mouse_world_x, -mouse_world_x), min(-mouse_world_y, mouse_world_y),
+                                 max(-mouse_world_x, mouse_world_x), max(-mouse_world_y, mouse_world_y))
+        elif key == pygame.K_RIGHTBRACKET:
+            self.explosion += 1
+        elif key == pygame.K_LEFTBRACKET and self.explosion > 0:
+            self.explosion -= 1
+        elif key == pygame.K_3:
+            self.create_three_body_system()
+        elif key == pygame.K_UP:
+            self.G += 1
+        elif key == pygame.K_DOWN and self.G > 0:
+            self.G -= 1
+        elif key == pygame.K_d:
+            self.adaptive = not self.adaptive
+        elif key == pygame.K_i:
+            names = list(INTEGRATORS)
+            self.set_integrator(names[(names.index(self.integrator_name) + 1) % len(names)])
+        elif key == pygame.K_t:
+            index = GRAVITY_MODES.index(self.gravity_mode)
+            self.set_gravity_mode(GRAVITY_MODES[(index + 1) % len(GRAVITY_MODES)], prebuilt)
+        elif key == pygame.K_EQUALS and self.gravity_mode in ("pm", "p3m"):
+            self.set_mesh_grid(min(self.mesh_grid * 2, MAX_MESH_GRID))
+        elif key == pygame.K_MINUS and self.gravity_mode in ("pm", "p3m"):
+            self.set_mesh_grid(max(self.mesh_grid // 2, MIN_MESH_GRID))
+        elif key == pygame.K_EQUALS:
+            self.set_theta(round(self.theta + 0.1, 2))
+        elif key == pygame.K_MINUS and self.theta > 0.1:
+            self.set_theta(round(self.theta - 0.1, 2))
+        elif key == pygame.K_PERIOD:
+            self.set_softening(self.softening * 2 if self.softening else MIN_SOFTENING)
+        elif key == pygame.K_COMMA:
+            self.set_softening(self.softening / 2 if self.softening > MIN_SOFTENING else 0)
+        elif key == pygame.K_v:
+            if self.recorder is None:
+                self.start_recording(TRAJECTORY_PATH)
+            else:
+                self.stop_recording()
+        elif key == pygame.K_F5:
+            self.save_snapshot(SNAPSHOT_PATH)
+        elif key == pygame.K_F9:
+            try:
+                self.load_snapshot(SNAPSHOT_PATH, prebuilt)
+            except (OSError, ValueError):
+                pass  # Nothing saved yet
 
     def run(self):
         running = True
+        profiler = self.profiler
+        if self.threaded:
+            self.worker = PhysicsWorker(self)
+            self.worker.start()
         while running:
+            profiler.begin_frame()
             running = self.handle_events()
+            profiler.lap('handle_events')
 
             display_info = pygame.display.Info()
             self.SCREEN_WIDTH = display_info.current_w
             self.SCREEN_HEIGHT = display_info.current_h
             self.key_help_menu.update_dimensions(self.SCREEN_WIDTH, self.SCREEN_HEIGHT)
 
+            # Only advance if not paused and not in menu. The worker steps on
+            # its own, so this frame just picks up its latest snapshot.
+            held = self.particle_menu.active or self.paused or self.key_help_menu.active
+            if self.worker is not None:
+                self.worker.set_paused(held)
+            elif not held:
+                self.advance(self.time_accel)
+            self.update_frame()
+            # The worker reports its own steps under 'advance'
+            profiler.lap('advance' if self.worker is None else 'snapshot')
+
+            if self.following_massive:
+                self.center_on_massive()
+
             # Clear screen
             self.screen.fill(BLACK)
 
             # Draw everything
             self.draw_grid()
+            profiler.lap('draw_grid')
             self.draw_particles()
+            profiler.lap('draw_particles')
             self.draw_ui()
-
-            # Only advance if not paused and not in menu
-            if not self.particle_menu.active and not self.paused and not self.key_help_menu.active:
-                self.advance(self.time_accel)
-                self.time += 1 / FPS * self.time_accel
-
-            if self.following_massive:
-                self.center_on_massive()
+            if profiler.enabled:
+                self.draw_profiler()
+            profiler.lap('draw_ui')
 
             # Update display
             pygame.display.flip()
+            profiler.lap('flip')
             self.clock.tick(FPS)
-
+            profiler.lap('idle')
+            profiler.end_frame()
+
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+        self.stop_recording()
+        self.close()
         pygame.quit()
         sys.exit()
 
 
+class ReplayViewer(PhysicsSimulation):
+    # Plays back a recorded trajectory through the normal drawing code. The
+    # run loop is inherited; advance moves the playback position instead of
+    # stepping physics.
+    threaded = False
+
+    def __init__(self, path):
+        self.reader = None
+        super().__init__()
+        self.reader = TrajectoryReader(path)
+        self.show_labels = False
+        self.position = 0.0  # Fractional frame index
+        self.playback_speed = 1.0  # Recorded frames per displayed frame
+        self.direction = 1
+        self.scrubbing = False
+        self.shown_frame = None
+        if len(self.reader):
+            self.show_frame(0)
+
+    def scrub_rect(self):
+        return pygame.Rect(10, self.SCREEN_HEIGHT - 30, self.SCREEN_WIDTH - 20, 12)
+
+    def show_frame(self, index):
+        index = max(0, min(len(self.reader) - 1, index))
+        if index == self.shown_frame:
+            return
+        frame = self.reader.frame(index)
+        ids = np.array(frame['ids'])
+        n = len(ids)
+        data = {name: np.array(frame[name], dtype=float) if name in frame else np.zeros(n) for name in FIELDS}
+        if 'mass' not in frame:
+            data['mass'] = np.ones(n)
+        if 'radius' not in frame:
+            data['radius'] = np.cbrt(data['mass'])
+        colors = np.array(frame['colors']) if 'colors' in frame else np.full((n, 3), 255, dtype=np.uint8)
+        names = (np.zeros(n, dtype=np.int32), np.ones(n, dtype=bool), ["#"])
+        self.particles.load_arrays(data, colors, ids, names, int(ids.max()) + 1 if n else 0)
+        self.time = frame['time']
+        self.shown_frame = index
+        self.reader.prefetch(index, self.direction)
+
+    def advance(self, time_accel):
+        if not len(self.reader):
+            return
+        self.position += self.direction * self.playback_speed
+        if not 0 <= self.position <= len(self.reader) - 1:
+            self.position = max(0.0, min(len(self.reader) - 1.0, self.position))
+            self.paused = True
+        self.show_frame(int(round(self.position)))
+
+    def seek(self, position):
+        self.position = max(0.0, min(len(self.reader) - 1.0, position))
+        self.show_frame(int(round(self.position)))
+
+    def seek_to_mouse(self, pos):
+        rect = self.scrub_rect()
+        self.seek((pos[0] - rect.x) / max(rect.width, 1) * (len(self.reader) - 1))
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (
+                    event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                return False
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1:
+                    if self.scrub_rect().inflate(0, 16).collidepoint(event.pos):
+                        self.scrubbing = True
+                        self.seek_to_mouse(event.pos)
+                    else:
+                        self.dragging = True
+                        self.last_mouse_pos = event.pos
+                elif event.button == 4:  # Mouse wheel up
+                    self.zoom_at(event.pos, ZOOM_FACTOR)
+                elif event.button == 5:  # Mouse wheel down
+                    self.zoom_at(event.pos, 1 / ZOOM_FACTOR)
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                self.dragging = False
+                self.scrubbing = False
+            elif event.type == pygame.MOUSEMOTION:
+                if self.scrubbing:
+                    self.seek_to_mouse(event.pos)
+                elif self.dragging:
+                    self.offset_x += event.pos[0] - self.last_mouse_pos[0]
+                    self.offset_y += event.pos[1] - self.last_mouse_pos[1]
+                    self.last_mouse_pos = event.pos
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    self.paused = not self.paused
+                elif event.key == pygame.K_RIGHT:
+                    self.playback_speed *= 2
+                elif event.key == pygame.K_LEFT:
+                    self.playback_speed /= 2
+                elif event.key == pygame.K_r:
+                    self.direction = -self.direction
+                elif event.key == pygame.K_PERIOD:
+                    self.seek(self.position + 1)
+                elif event.key == pygame.K_COMMA:
+                    self.seek(self.position - 1)
+                elif event.key == pygame.K_HOME:
+                    self.seek(0)
+                elif event.key == pygame.K_END:
+                    self.seek(len(self.reader) - 1)
+                elif event.key == pygame.K_w:
+                    self.following_massive = not self.following_massive
+                    if not self.following_massive:
+                        # Return to origin
+                        self.offset_x = self.SCREEN_WIDTH // 2
+                        self.offset_y = self.SCREEN_HEIGHT // 2
+                elif event.key == pygame.K_g:
+                    self.show_axes = not self.show_axes
+                elif event.key == pygame.K_n:
+                    self.show_labels = not self.show_labels
+        return True
+
+    def draw_ui(self):
+        lines = [
+            f"Replay: {self.reader.path}",
+            f"Frame {self.shown_frame if self.shown_frame is not None else 0} / {max(len(self.reader) - 1, 0)}",
+            f"Time: {self.time:.2f}",
+            f"Speed: {'-' if self.direction < 0 else ''}{self.playback_speed:g}x",
+            "Particle count: " + str(len(self.particles)),
+            "SPACE pause, LEFT/RIGHT speed, R reverse, ,/. step, HOME/END, drag the bar to scrub",
+        ]
+        for i, line in enumerate(lines):
+            self.screen.blit(self.font.render(line, True, WHITE), (10, 10 + 30 * i))
+
+        rect = self.scrub_rect()
+        pygame.draw.rect(self.screen, GRAY, rect, 1)
+        if len(self.reader) > 1:
+            marker_x = rect.x + int(self.position / (len(self.reader) - 1) * rect.width)
+            pygame.draw.line(self.screen, GREEN, (marker_x, rect.y - 4), (marker_x, rect.bottom + 4), 3)
+
+        play_status = "PAUSED" if self.paused else "PLAYING"
+        status_text = self.font.render(play_status, True, RED if self.paused else GREEN)
+        self.screen.blit(status_text, (10, 10 + 30 * len(lines)))
+        self.draw_tooltip()
+
+    def close(self):
+        super().close()
+        if self.reader is not None:
+            self.reader.close()
+
+
 if __name__ == "__main__":
-    s = PhysicsSimulation()
+    parser = argparse.ArgumentParser(description="Gravity Simulator")
+    parser.add_argument("--replay", help="play back a recorded trajectory instead of simulating")
+    args = parser.parse_args()
+    if args.replay:
+        s = ReplayViewer(args.replay)
+    else:
+        s = PhysicsSimulation()
     s.run()
\ No newline at end of file
@@ -0,0 +1,464 @@
+import math
+import random
+
+import numpy as np
+
+import snapshot
+from boundaries import explosion_spawns, reflect
+from collisions import find_overlaps, merge_overlapping
+from diagnostics import ConservationMonitor
+from gravity import DEFAULT_SOFTENING, DEFAULT_THETA, BarnesHutSolver, DirectSolver, acceleration_at, force_error
+from integrators import make_integrator
+from jit import make_jit_solver
+from mesh import DEFAULT_GRID, ParticleMeshSolver
+from parallel import ParallelDirectSolver
+from particles import ParticleStore, PointMass
+from profiler import Profiler
+from trajectory import TrajectoryRecorder
+
+FPS = 60
+DT_NORM = 1 / FPS
+DEFAULT_G = 20
+
+# Sub-stepping: no physics step is longer than MAX_DT, and a single frame
+# never runs more than MAX_SUBSTEPS of them (leftover time carries over, up
+# to MAX_SUBSTEPS full steps; beyond that it is dropped and counted)
+MAX_DT = DT_NORM
+MAX_SUBSTEPS = 64
+ADAPTIVE_ETA = 0.05
+
+# Explosion spawns stop growing the scene past this many bodies
+MAX_PARTICLES = 20000
+
+GRAVITY_MODES = ("direct", "barnes_hut", "parallel", "jit", "pm", "p3m")
+
+# Colors
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+BLUE = (0, 0, 255)
+
+
+class Simulation:
+    # Physics state and presets only, no pygame, so it can run headless
+    def __init__(self, gravity_mode="direct", theta=DEFAULT_THETA, seed=None, integrator="leapfrog", workers=None):
+        self.particles = ParticleStore()
+        self.time = 0
+        self.time_accel = 1
+        self.bounding_box = None
+        self.explosion = 0
+        self.max_particles = MAX_PARTICLES
+        self.spawned_ids = []
+        # Tracers only merge when this is set, with each other and with massive bodies
+        self.tracer_collisions = False
+        self.G = DEFAULT_G
+        self.random = random.Random(seed)
+        self.max_dt = MAX_DT
+        self.adaptive = False
+        self.eta = ADAPTIVE_ETA
+        self.accumulator = 0
+        # Simulated time thrown away at the substep cap, in all and in the last frame
+        self.dropped_time = 0
+        self.last_dropped = 0
+        self.substeps = 0
+        self.last_dt = 0
+        self.force_evaluations = 0
+        self.forces_version = None
+        self.recorder = None
+        # Optional SpatialIndex, refreshed after every advance for picking
+        self.spatial_index = None
+        self.profiler = Profiler()
+        self.monitor = None
+        self.set_integrator(integrator)
+        self.theta = theta
+        self.mesh_grid = DEFAULT_GRID
+        self.softening = DEFAULT_SOFTENING
+        self.workers = workers
+        self.gravity_error = None
+        self.solver = None
+        self.set_gravity_mode(gravity_mode)
+
+    def reset(self):
+        self.particles.clear()
+        self.time_accel = 1
+        self.bounding_box = None
+        self.G = DEFAULT_G
+
+    def make_solver(self, mode):
+        if mode not in GRAVITY_MODES:
+            raise ValueError("Unknown gravity mode: " + str(mode))
+        if mode == "direct":
+            return DirectSolver()
+        elif mode == "barnes_hut":
+            return BarnesHutSolver(self.theta)
+        elif mode == "parallel":
+            return ParallelDirectSolver(self.workers)
+        elif mode == "jit":
+            return make_jit_solver()
+        return ParticleMeshSolver(self.mesh_grid, short_range=mode == "p3m")
+
+    def set_gravity_mode(self, mode, prebuilt=None):
+        # prebuilt maps modes to solvers made ahead of time with make_solver,
+        # on a thread that may start processes; the one used is popped
+        if mode not in GRAVITY_MODES:
+            raise ValueError("Unknown gravity mode: " + str(mode))
+        self.close()
+        self.solver = prebuilt.pop(mode) if prebuilt and mode in prebuilt else self.make_solver(mode)
+        self.solver.softening = self.softening
+        self.gravity_mode = mode
+        self.gravity_error = None
+        if self.monitor is not None:
+            self.monitor.restart()
+        self.forces_version = None
+
+    def close(self):
+        # Release worker processes and shared memory held by the solver
+        if hasattr(self.solver, "close"):
+            self.solver.close()
+
+    def start_recording(self, path, **options):
+        self.stop_recording()
+        self.recorder = TrajectoryRecorder(path, **options)
+        self.recorder.record(self)  # The state recording starts from
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            recorder.close()
+
+    def start_monitor(self, **options):
+        self.monitor = ConservationMonitor(**options)
+
+    def stop_monitor(self):
+        self.monitor = None
+        if hasattr(self.solver, "track_potential"):
+            self.solver.track_potential = False
+
+    def save_snapshot(self, path):
+        snapshot.save(self, path)
+
+    def load_snapshot(self, path, prebuilt=None):
+        return snapshot.load(self, path, prebuilt)
+
+    def set_integrator(self, name):
+        self.integrator = make_integrator(name)
+        self.integrator_name = name
+
+    def set_theta(self, theta):
+        self.theta = theta
+        if self.gravity_mode == "barnes_hut":
+            self.solver.theta = theta
+            self.gravity_error = None
+            if self.monitor is not None:
+                self.monitor.restart()
+
+    def set_mesh_grid(self, grid):
+        self.mesh_grid = grid
+        if self.gravity_mode in ("pm", "p3m"):
+            self.solver.grid = grid
+            self.gravity_error = None
+            if self.monitor is not None:
+                self.monitor.restart()
+
+    def set_softening(self, softening):
+        self.softening = softening
+        self.solver.softening = softening
+        self.gravity_error = None
+        if self.monitor is not None:
+            self.monitor.restart()
+
+    def measure_gravity_error(self, sample=200):
+        # Relative force error of the active solver against the direct sum,
+        # over the massive bodies since tracers never reach the solver
+        store = self.particles
+        massive = self.massive()
+        self.gravity_error = force_error(self.solver, store.x[massive], store.y[massive], store.mass[massive], self.G,
+                                         sample)
+        return self.gravity_error
+
+    def getAccelVector(self, pointMass):
+        ax = 0
+        ay = 0
+        for particle in self.particles:
+            if particle is pointMass or particle.tracer:
+                continue  # Tracers exert no gravity
+            # Calculate distance vector components
+            dx = particle.x - pointMass.x
+            dy = particle.y - pointMass.y
+            r = math.sqrt(dx * dx + dy * dy)
+
+            # Calculate gravitational force magnitude
+            if r != 0:
+                # Inverse square law, Plummer-softened: G * m * r / (r² + eps²)^(3/2)
+                gmag = self.G * particle.mass * r / (r * r + self.softening * self.softening) ** 1.5
+                # Add acceleration components using normalized direction vector
+                ax += gmag * dx / r
+                ay += gmag * dy / r
+
+        return (ax, ay)
+
+    def computeAccelerations(self, x, y, mass, targets=None):
+        # Batched equivalent of calling getAccelVector for every particle. Only
+        # the rows in targets are needed when given, solvers that cannot
+        # restrict their work evaluate them all. Tracers feel the massive
+        # bodies but exert nothing, so the solver only sees the massive set
+        # and tracers cost O(massive * tracers) on top.
+        tracer = self.particles.tracer
+        if not tracer.any():
+            return self.solve(x, y, mass, targets)
+        massive = np.flatnonzero(tracer == 0)
+        tracers = np.flatnonzero(tracer)
+        ax = np.zeros(len(x))
+        ay = np.zeros(len(x))
+        if targets is not None:
+            wanted = np.zeros(len(x), dtype=bool)
+            wanted[targets] = True
+            tracers = tracers[wanted[tracers]]
+        if len(massive):
+            massive_targets = None if targets is None else np.flatnonzero(wanted[massive])
+            ax[massive], ay[massive] = self.solve(x[massive], y[massive], mass[massive], massive_targets)
+            ax[tracers], ay[tracers] = acceleration_at(x[tracers], y[tracers], x[massive], y[massive], mass[massive],
+                                                       self.G, self.softening)
+        return ax, ay
+
+    def solve(self, x, y, mass, targets=None):
+        if targets is not None and getattr(self.solver, "supports_targets", False):
+            return self.solver.accelerations(x, y, mass, self.G, targets)
+        return self.solver.accelerations(x, y, mass, self.G)
+
+    def massive(self):
+        # Slots of the bodies that exert gravity
+        return np.flatnonzero(self.particles.tracer == 0)
+
+    def evaluate_forces(self, x, y, targets=None):
+        # A partial evaluation counts as its fraction of a full one
+        n = len(x)
+        rows = n if targets is None else len(targets)
+        self.force_evaluations += rows / n if n else 1
+        sources = n - int(np.count_nonzero(self.particles.tracer))
+        self.profiler.count('pair_interactions', rows * max(sources - 1, 0))
+        return self.computeAccelerations(x, y, self.particles.mass, targets)
+
+    def store_accelerations(self, ax, ay):
+        # Accelerations at the current positions, reused by the next step
+        self.particles.ax[:] = ax
+        self.particles.ay[:] = ay
+        self.forces_version = self.forces_key()
+
+    def forces_key(self):
+        # Cached accelerations stay valid while none of these change
+        return self.particles.version, self.G, self.gravity_mode, self.theta, self.mesh_grid, self.softening
+
+    def cached_accelerations(self):
+        store = self.particles
+        if self.forces_version != self.forces_key():
+            self.store_accelerations(*self.evaluate_forces(store.x, store.y))
+        return store.ax, store.ay
+
+    def advance(self, time_accel):
+        self.advance_time(DT_NORM * time_accel)
+
+    def effective_accel(self):
+        # Time acceleration actually reached by the last frame
+        if self.time_accel <= 0:
+            return self.time_accel
+        return self.time_accel * max(0.0, 1 - self.last_dropped / (DT_NORM * self.time_accel))
+
+    def advance_time(self, frame_dt):
+        # Fixed-timestep accumulator: a frame's worth of simulated time is
+        # covered by as many short steps as needed instead of one long one.
+        # A frame never owes more than MAX_SUBSTEPS full steps; the rest is
+        # dropped and counted, so the run falls behind time_accel visibly.
+        owed = self.accumulator + frame_dt
+        self.accumulator = min(owed, MAX_SUBSTEPS * self.max_dt)
+        self.last_dropped = owed - self.accumulator
+        self.dropped_time += self.last_dropped
+        self.substeps = 0
+        while self.accumulator > 1e-12 and self.substeps < MAX_SUBSTEPS:
+            dt = min(self.accumulator, self.step_limit())
+            self.step(dt)
+            self.accumulator -= dt
+            self.last_dt = dt
+            self.substeps += 1
+        if self.spatial_index is not None:
+            self.spatial_index.refresh(self.particles)
+
+    def step_limit(self):
+        # Integrators with individual timesteps resolve close encounters
+        # themselves, so the global step stays at max_dt for them. Those with
+        # their own stability criterion (Hermite) always get it, adaptive or not.
+        if not self.particles:
+            return self.max_dt
+        if hasattr(self.integrator, "timestep"):
+            return min(self.max_dt, self.integrator.timestep(self))
+        if not self.adaptive or getattr(self.integrator, "individual_timesteps", False):
+            return self.max_dt
+        timescale = self.timescales()
+        timescale = timescale[np.isfinite(timescale) & (timescale > 0)]
+        if len(timescale) == 0:
+            return self.max_dt
+        return min(self.max_dt, self.eta * float(np.min(timescale)))
+
+    def timescales(self):
+        # Per-body velocity-change time |v|/|a|, with sqrt(radius/|a|) covering
+        # bodies that are nearly at rest, so close encounters get small steps
+        store = self.particles
+        ax, ay = self.cached_accelerations()
+        accel = np.hypot(ax, ay)
+        speed = np.hypot(store.vx, store.vy)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.minimum(speed / accel, np.sqrt(np.maximum(store.radius, 1) / accel))
+
+    def step(self, dt):
+        profiler = self.profiler
+        monitor = self.monitor
+        if monitor is not None:
+            monitor.begin_step(self)
+        started = profiler.start()
+        if self.particles:
+            self.integrator.step(self, dt)
+        profiler.stop('integrate', started)
+        if monitor is not None:
+            monitor.after_integrate(self)
+
+        started = profiler.start()
+        spawns = None
+        if self.bounding_box and self.particles:
+            hits, speed = reflect(self.particles, self.bounding_box)
+            if self.explosion:
+                # One Generator per step, seeded from self.random so runs stay reproducible
+                rng = np.random.default_rng(self.random.getrandbits(64))
+                spawns = explosion_spawns(self.particles, self.bounding_box, hits, speed, self.explosion, rng)
+        profiler.stop('bounds', started)
+
+        started = profiler.start()
+        profiler.count('merged', self.collide(self.particles))
+        profiler.stop('collide', started)
+        if spawns is not None:
+            profiler.count('spawned', self.commit_spawns(spawns))
+        if monitor is not None:
+            monitor.after_events(self)
+        self.time += dt
+        if self.recorder is not None:
+            self.recorder.record(self)
+
+    def commit_spawns(self, spawns):
+        # Spawns are buffered during the step and added here in one batch.
+        # Above max_particles, spawned bodies (the live ones and this batch
+        # alike) are culled uniformly at random down to the cap; the bodies
+        # the scene started with are never culled. Returns how many were added.
+        store = self.particles
+        self.spawned_ids = [body_id for body_id in self.spawned_ids if store.has_id(body_id)]
+        new = len(spawns['x'])
+        excess = len(store) + new - self.max_particles if self.max_particles is not None else 0
+        keep_new = np.arange(new)
+        if excess > 0:
+            candidates = len(self.spawned_ids) + new
+            culled = np.zeros(candidates, dtype=bool)
+            culled[self.random.sample(range(candidates), min(excess, candidates))] = True
+            old_culled = culled[:len(self.spawned_ids)]
+            store.remove_many(np.array(self.spawned_ids)[old_culled].tolist())
+            self.spawned_ids = np.array(self.spawned_ids)[~old_culled].tolist()
+            keep_new = np.nonzero(~culled[len(old_culled):])[0]
+        if len(keep_new) == 0:
+            return 0
+        codes, numbered = spawns['names']
+        new_ids = store.add_many((codes[keep_new], numbered[keep_new]), spawns['x'][keep_new], spawns['y'][keep_new],
+                                 spawns['vx'][keep_new], spawns['vy'][keep_new], spawns['mass'][keep_new],
+                                 spawns['colors'][keep_new], spawns['tracer'][keep_new])
+        self.spawned_ids.extend(new_ids.tolist())
+        return len(keep_new)
+
+    def collide(self, particlesArray):
+        # Separate broad-phase pass, unless the force kernel already found the
+        # overlaps at these exact positions
+        pairs = None
+        if hasattr(self.solver, "overlaps_for"):
+            pairs = self.solver.overlaps_for(particlesArray.x, particlesArray.y)
+        if pairs is None and not self.tracer_collisions and particlesArray.tracer.any():
+            massive = self.massive()
+            pairs = massive[find_overlaps(particlesArray.x[massive], particlesArray.y[massive],
+                                          particlesArray.radius[massive])]
+        return merge_overlapping(particlesArray, pairs)
+
+    def remove_bodies(self, body_ids):
+        # Bodies picked from an older frame may have merged away since
+        store = self.particles
+        store.remove_many([body_id for body_id in body_ids if store.has_id(body_id)])
+
+    def random_color(self):
+        return (math.floor(self.random.random() * 256), math.floor(self.random.random() * 256),
+                math.floor(self.random.random() * 256))
+
+    def create_random_scene(self):
+        self.particles.clear()
+        for i in range(math.floor(self.random.random() * 9 + 2)):
+            self.particles.append(PointMass(
+                "P" + str(i),
+                self.random.random() * 1000 - 500,
+                self.random.random() * 1000 - 500,
+                self.random.random() * 300 - 150,
+                self.random.random() * 300 - 150,
+                10 ** (self.random.random() * 7),
+                self.random_color()
+            ))
+
+    def create_grid(self):
+        self.particles.clear()
+        for i in range(-500, 550, 50):
+            for j in range(-500, 550, 50):
+                if self.random.random() < 1 / 3:
+                    mass = 1
+                else:
+                    mass = 100
+                self.particles.append(PointMass("P" + str(i) + "," + str(j), i, j, 0, 0, mass,
+                                                self.random_color()))
+
+    def create_star_system(self, tracers=False):
+        self.particles.clear()
+        self.particles.append(PointMass("Star", 0, 0, 0, 0, 1000000, WHITE))
+        for r in range(200, 1000, 3):
+            self.create_circular_orbit(r, 100, tracers)
+
+    def create_circular_orbit(self, r, mass, tracer=False):
+        theta = self.random.random() * 2 * math.pi
+        vmag = math.sqrt(20 * 1000000 / r)
+        self.particles.append(PointMass(
+            "C" + str(r),
+            r * math.cos(theta),
+            r * math.sin(theta),
+            vmag * math.cos(theta + math.pi / 2),
+            vmag * math.sin(theta + math.pi / 2),
+            mass,
+            self.random_color(),
+            tracer
+        ))
+
+    def create_three_body_system(self):
+        self.particles.clear()
+        mass = 10000
+        radius = 100
+
+        # Calculate velocities for stable configuration
+        orbital_velocity = math.sqrt(self.G * mass * 3 / (2 * radius))
+
+        self.particles.append(PointMass("Body1",
+                                        radius * math.cos(0),
+                                        radius * math.sin(0),
+                                        orbital_velocity * math.cos(math.pi / 2),
+                                        orbital_velocity * math.sin(math.pi / 2),
+                                        mass, RED))
+
+        self.particles.append(PointMass("Body2",
+                                        radius * math.cos(2 * math.pi / 3),
+                                        radius * math.sin(2 * math.pi / 3),
+                                        orbital_velocity * math.cos(7 * math.pi / 6),
+                                        orbital_velocity * math.sin(7 * math.pi / 6),
+                                        mass, GREEN))
+
+        self.particles.append(PointMass("Body3",
+                                        radius * math.cos(4 * math.pi / 3),
+                                        radius * math.sin(4 * math.pi / 3),
+                                        orbital_velocity * math.cos(11 * math.pi / 6),
+                                        orbital_velocity * math.sin(11 * math.pi / 6),
+                                        mass, BLUE))
@@ -0,0 +1,134 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from gravity import DEFAULT_SOFTENING
+from mesh import DEFAULT_GRID
+from particles import FIELDS
+
+# File layout: magic, little-endian uint64 header length, JSON header, then
+# the raw arrays, each starting on an ALIGNMENT boundary so they can be
+# memory-mapped in place
+MAGIC = b"GSNAP\x00\x01\x00"
+ALIGNMENT = 64
+NAME_SEPARATOR = "\x00"
+
+
+def aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save(simulation, path):
+    store = simulation.particles
+    n = store.count
+    arrays = {name: np.ascontiguousarray(store.data[name][:n]) for name in FIELDS}
+    arrays['colors'] = np.ascontiguousarray(store.colors[:n])
+    arrays['ids'] = np.ascontiguousarray(store.ids[:n])
+    arrays['name_codes'] = np.ascontiguousarray(store.name_codes[:n])
+    arrays['numbered'] = np.ascontiguousarray(store.numbered[:n])
+    arrays['name_table'] = np.frombuffer(NAME_SEPARATOR.join(store.name_table).encode('utf-8'), dtype=np.uint8)
+    # Explosion spawns that may still be culled, kept so a resumed run culls the same bodies
+    arrays['spawned_ids'] = np.array(simulation.spawned_ids, dtype=np.int64)
+
+    version, state, gauss_next = simulation.random.getstate()
+    header = {
+        'count': n,
+        'next_id': store.next_id,
+        'time': simulation.time,
+        'G': simulation.G,
+        'time_accel': simulation.time_accel,
+        'bounding_box': simulation.bounding_box,
+        'explosion': simulation.explosion,
+        'max_particles': simulation.max_particles,
+        'tracer_collisions': simulation.tracer_collisions,
+        'gravity_mode': simulation.gravity_mode,
+        'theta': simulation.theta,
+        'mesh_grid': simulation.mesh_grid,
+        'softening': simulation.softening,
+        'integrator': simulation.integrator_name,
+        'random_state': [version, list(state), gauss_next],
+        'arrays': {},
+    }
+    # Offsets are relative to the start of the data section, which follows
+    # the header, so they do not depend on the header's own length
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = aligned(offset + array.nbytes)
+
+    encoded = json.dumps(header).encode('utf-8')
+    data_start = aligned(len(MAGIC) + 8 + len(encoded))
+    # Written beside the target and renamed over it: the store may still be
+    # memory-mapped from the file being replaced, and truncating that would
+    # pull the pages out from under it. The rename also means a crash never
+    # leaves a half-written snapshot behind.
+    temporary = str(path) + ".tmp"
+    try:
+        with open(temporary, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(encoded)))
+            f.write(encoded)
+            for name, array in arrays.items():
+                f.seek(data_start + header['arrays'][name]['offset'])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a simulation snapshot: " + str(path))
+        length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+    return header, aligned(len(MAGIC) + 8 + length)
+
+
+def open_arrays(path):
+    # Copy-on-write memory maps: nothing is read until touched, and changes
+    # made by the running simulation never reach the file
+    header, data_start = read_header(path)
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        if int(np.prod(spec['shape'])) == 0:
+            arrays[name] = np.zeros(spec['shape'], dtype=spec['dtype'])
+            continue
+        arrays[name] = np.memmap(path, dtype=spec['dtype'], mode='c', offset=data_start + spec['offset'],
+                                 shape=tuple(spec['shape']))
+    return header, arrays
+
+
+def load(simulation, path, prebuilt=None):
+    header, arrays = open_arrays(path)
+    if 'name_codes' in arrays:
+        table = bytes(arrays['name_table']).decode('utf-8').split(NAME_SEPARATOR) if header['count'] else []
+        names = (arrays['name_codes'], arrays['numbered'], table)
+    else:
+        # Written before names were stored as codes: one name per body
+        names = bytes(arrays['names']).decode('utf-8').split(NAME_SEPARATOR) if header['count'] else []
+    # Fields added since a snapshot was written, such as tracer, start out zero
+    data = {name: arrays[name] if name in arrays else np.zeros(header['count']) for name in FIELDS}
+    simulation.particles.load_arrays(data, arrays['colors'], arrays['ids'], names, header['next_id'])
+    simulation.time = header['time']
+    simulation.G = header['G']
+    simulation.time_accel = header['time_accel']
+    simulation.bounding_box = tuple(header['bounding_box']) if header['bounding_box'] else None
+    simulation.explosion = header['explosion']
+    simulation.tracer_collisions = header.get('tracer_collisions', False)
+    simulation.max_particles = header.get('max_particles', simulation.max_particles)
+    simulation.spawned_ids = arrays['spawned_ids'].tolist() if 'spawned_ids' in arrays else []
+    version, state, gauss_next = header['random_state']
+    simulation.random.setstate((version, tuple(state), gauss_next))
+    simulation.theta = header['theta']
+    simulation.mesh_grid = header.get('mesh_grid', DEFAULT_GRID)
+    simulation.set_gravity_mode(header['gravity_mode'], prebuilt)
+    simulation.set_integrator(header['integrator'])
+    simulation.set_softening(header.get('softening', DEFAULT_SOFTENING))
+    simulation.accumulator = 0
+    return header
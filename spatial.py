@@ -0,0 +1,150 @@
+import numpy as np
+
+# Cells hold about this many bodies on average when the index is built
+BODIES_PER_CELL = 2
+# Cell coordinates are biased so keys of bodies that drift below the
+# origin stay non-negative and keep their row order
+BIAS = 1 << 30
+# A refresh rebuilds from scratch once the bodies spread over this many
+# times the cells the grid was sized for
+REBUILD_SPREAD = 4
+
+
+class SpatialIndex:
+    # Bodies sorted by the key of their grid cell, so a cell is a contiguous
+    # run found with two binary searches and a rectangle is one run per
+    # column of cells. refresh() keeps the sorted order between frames:
+    # bodies move little, so re-sorting the previous order is nearly linear.
+    # Adding or removing bodies renumbers slots and forces a rebuild.
+    def __init__(self):
+        self.version = None
+        self.count = 0
+        self.cell = 1.0
+        self.origin_x = 0.0
+        self.origin_y = 0.0
+        self.order = np.empty(0, dtype=np.int64)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.bounds = None
+
+    def refresh(self, store):
+        if store.version != self.version or store.count != self.count or not self.fits(store):
+            self.build(store)
+            return
+        keys = self.cell_keys(store.x[self.order], store.y[self.order])
+        resort = np.argsort(keys, kind='stable')
+        self.order = self.order[resort]
+        self.keys = keys[resort]
+        self.bounds = self.cell_bounds(store)
+
+    def ensure(self, store):
+        # Queries after an edit (new scene, added or deleted bodies) see the edit
+        if store.version != self.version or store.count != self.count:
+            self.build(store)
+
+    def build(self, store):
+        n = store.count
+        self.version = store.version
+        self.count = n
+        if n == 0:
+            self.order = np.empty(0, dtype=np.int64)
+            self.keys = np.empty(0, dtype=np.int64)
+            self.bounds = None
+            return
+        x, y = store.x, store.y
+        self.origin_x, self.origin_y = float(np.min(x)), float(np.min(y))
+        side = max(float(np.max(x)) - self.origin_x, float(np.max(y)) - self.origin_y)
+        self.cell = side / np.sqrt(n / BODIES_PER_CELL) if side > 0 else 1.0
+        keys = self.cell_keys(x, y)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+        self.bounds = self.cell_bounds(store)
+
+    def fits(self, store):
+        # The grid still suits the bodies if they have not spread much
+        if self.bounds is None or store.count == 0:
+            return False
+        span = max(self.cell_coordinate(float(np.max(store.x)), self.origin_x)
+                   - self.cell_coordinate(float(np.min(store.x)), self.origin_x),
+                   self.cell_coordinate(float(np.max(store.y)), self.origin_y)
+                   - self.cell_coordinate(float(np.min(store.y)), self.origin_y))
+        return span <= REBUILD_SPREAD * np.sqrt(store.count / BODIES_PER_CELL) + 1
+
+    def cell_coordinate(self, value, origin):
+        return int(np.floor((value - origin) / self.cell))
+
+    def cell_keys(self, x, y):
+        cx = np.floor((x - self.origin_x) / self.cell).astype(np.int64) + BIAS
+        cy = np.floor((y - self.origin_y) / self.cell).astype(np.int64) + BIAS
+        return (cx << 32) + cy
+
+    def cell_bounds(self, store):
+        # Range of occupied cells, which ends the ring search of nearest()
+        return (self.cell_coordinate(float(np.min(store.x)), self.origin_x),
+                self.cell_coordinate(float(np.min(store.y)), self.origin_y),
+                self.cell_coordinate(float(np.max(store.x)), self.origin_x),
+                self.cell_coordinate(float(np.max(store.y)), self.origin_y))
+
+    def runs(self, cx, cy0, cy1):
+        # Slots of the bodies in cells (cx, cy0..cy1), for arrays of columns
+        base = (np.asarray(cx, dtype=np.int64) + BIAS) << 32
+        starts = np.searchsorted(self.keys, base + np.asarray(cy0) + BIAS)
+        stops = np.searchsorted(self.keys, base + np.asarray(cy1) + BIAS + 1)
+        counts = stops - starts
+        index = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+        return self.order[index]
+
+    def in_rect(self, store, x0, y0, x1, y1):
+        # Slots of the bodies inside the world rectangle, corners in any order
+        self.ensure(store)
+        if self.bounds is None:
+            return np.empty(0, dtype=np.int64)
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        min_cx, min_cy, max_cx, max_cy = self.bounds
+        cx0 = max(self.cell_coordinate(x0, self.origin_x), min_cx)
+        cx1 = min(self.cell_coordinate(x1, self.origin_x), max_cx)
+        cy0 = max(self.cell_coordinate(y0, self.origin_y), min_cy)
+        cy1 = min(self.cell_coordinate(y1, self.origin_y), max_cy)
+        if cx0 > cx1 or cy0 > cy1:
+            return np.empty(0, dtype=np.int64)
+        slots = self.runs(np.arange(cx0, cx1 + 1), cy0, cy1)
+        x, y = store.x[slots], store.y[slots]
+        return slots[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+
+    def nearest(self, store, x, y, max_distance=np.inf):
+        # Slot of the body whose centre is closest to (x, y), or None if none
+        # lies within max_distance. Rings of cells are searched outwards
+        # until no unvisited cell can hold anything closer.
+        self.ensure(store)
+        if self.bounds is None:
+            return None
+        min_cx, min_cy, max_cx, max_cy = self.bounds
+        cx = self.cell_coordinate(x, self.origin_x)
+        cy = self.cell_coordinate(y, self.origin_y)
+        best, best_d2 = None, max_distance * max_distance
+        # Rings before the first occupied cell and after the last are empty
+        ring = max(min_cx - cx, cx - max_cx, min_cy - cy, cy - max_cy, 0)
+        last = max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy)
+        while ring <= last:
+            # Cells of a ring are at least ring - 1 cells away from the point
+            if ring > 1 and ((ring - 1) * self.cell) ** 2 > best_d2:
+                break
+            if ring == 0:
+                slots = self.runs([cx], cy, cy)
+            else:
+                # Left and right columns whole, then the top and bottom cells between them
+                inner = np.arange(cx - ring + 1, cx + ring)
+                columns = np.concatenate(([cx - ring, cx + ring], inner, inner))
+                low = np.concatenate(([cy - ring, cy - ring], np.full(len(inner), cy - ring),
+                                      np.full(len(inner), cy + ring)))
+                high = np.concatenate(([cy + ring, cy + ring], low[2:]))
+                slots = self.runs(columns, low, high)
+            if len(slots):
+                dx = store.x[slots] - x
+                dy = store.y[slots] - y
+                d2 = dx * dx + dy * dy
+                closest = int(np.argmin(d2))
+                if d2[closest] <= best_d2:
+                    best, best_d2 = int(slots[closest]), float(d2[closest])
+            ring += 1
+        return best
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation import Simulation  # noqa: E402
+
+
+def add_random_bodies(simulation, n, seed=1, half_width=500, tracers=0):
+    # n bodies spread uniformly over a square, the last `tracers` of them tracers
+    rng = np.random.default_rng(seed)
+    tracer = np.zeros(n, dtype=bool)
+    tracer[n - tracers:] = tracers > 0
+    return simulation.particles.add_many([f"P{i}" for i in range(n)],
+                                         rng.uniform(-half_width, half_width, n),
+                                         rng.uniform(-half_width, half_width, n),
+                                         rng.normal(0, 5, n), rng.normal(0, 5, n), rng.uniform(1, 100, n),
+                                         rng.integers(0, 256, (n, 3)), tracer)
+
+
+@pytest.fixture
+def simulation():
+    simulation = Simulation(seed=1)
+    yield simulation
+    simulation.stop_recording()
+    simulation.close()
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from collisions import find_overlaps, merge_overlapping
+from conftest import add_random_bodies
+
+
+def brute_force_overlaps(x, y, radius):
+    dx = x[:, np.newaxis] - x[np.newaxis, :]
+    dy = y[:, np.newaxis] - y[np.newaxis, :]
+    reach = radius[:, np.newaxis] + radius[np.newaxis, :]
+    i, j = np.nonzero(np.triu(dx * dx + dy * dy < reach * reach, k=1))
+    return np.column_stack((i, j))
+
+
+@pytest.mark.parametrize("decades", [0, 2, 6])
+def test_find_overlaps_matches_brute_force(decades):
+    # Masses spread over `decades` orders of magnitude put bodies on several grid levels
+    rng = np.random.default_rng(decades)
+    n = 2000
+    x = rng.uniform(-300, 300, n)
+    y = rng.uniform(-300, 300, n)
+    radius = np.cbrt(10 ** rng.uniform(0, decades, n)) if decades else np.full(n, 2.0)
+    np.testing.assert_array_equal(find_overlaps(x, y, radius), brute_force_overlaps(x, y, radius))
+
+
+def test_find_overlaps_handles_tiny_inputs():
+    assert find_overlaps(np.zeros(1), np.zeros(1), np.ones(1)).shape == (0, 2)
+    np.testing.assert_array_equal(find_overlaps(np.zeros(2), np.zeros(2), np.zeros(2) + 1), [[0, 1]])
+
+
+def test_merging_conserves_mass_and_momentum(simulation):
+    add_random_bodies(simulation, 500, half_width=60)
+    store = simulation.particles
+    mass = store.mass.sum()
+    momentum = np.array([(store.mass * store.vx).sum(), (store.mass * store.vy).sum()])
+    merged = merge_overlapping(store)
+    assert merged > 0
+    assert len(store) == 500 - merged
+    assert store.mass.sum() == pytest.approx(mass)
+    np.testing.assert_allclose([(store.mass * store.vx).sum(), (store.mass * store.vy).sum()], momentum)
@@ -0,0 +1,69 @@
+import pytest
+
+from diagnostics import totals
+
+
+def assert_conserved(drift, tolerance):
+    for quantity, value in drift.items():
+        assert abs(value) < tolerance, quantity
+
+
+def test_drift_of_a_smooth_orbit_is_small(simulation):
+    simulation.create_three_body_system()
+    simulation.start_monitor(interval=5)
+    assert simulation.monitor.drift() is None
+    for _ in range(50):
+        simulation.step(0.01)
+    assert simulation.monitor.samples == 10
+    assert_conserved(simulation.monitor.drift(), 1e-4)
+
+
+def test_mergers_are_booked_in_the_ledger(simulation):
+    # Two bodies on a head-on course: the merger keeps mass and momentum but
+    # loses kinetic energy, which the ledger accounts for
+    store = simulation.particles
+    store.add("A", -20, 0, 50, 0, 100, (255, 0, 0))
+    store.add("B", 20, 0, -30, 0, 50, (0, 255, 0))
+    simulation.start_monitor(interval=1)
+    before = totals(simulation)
+    for _ in range(60):
+        simulation.step(0.01)
+    assert len(store) == 1
+    assert totals(simulation)['energy'] < before['energy'] - 1
+    monitor = simulation.monitor
+    assert monitor.latest_ledger['energy'] < -1
+    # What is left is the integration error of the close approach
+    drift = monitor.drift()
+    assert abs(drift.pop('energy')) < 1e-3
+    assert_conserved(drift, 1e-12)
+
+
+def test_explosion_spawns_are_booked_in_the_ledger(simulation):
+    # Four light bodies heading for the four walls, each spawning two copies
+    store = simulation.particles
+    for x, y, vx, vy in ((90, 0, 50, 0), (-90, 10, -50, 0), (10, 90, 0, 50), (0, -90, 0, -50)):
+        store.add("P", x, y, vx, vy, 1, (255, 255, 255))
+    simulation.bounding_box = (-100, -100, 100, 100)
+    simulation.explosion = 2
+    simulation.start_monitor(interval=1)
+    for _ in range(10):
+        simulation.step(0.05)
+    assert len(store) == 12
+    monitor = simulation.monitor
+    assert monitor.latest_ledger['mass'] == 8
+    drift = monitor.drift()
+    assert abs(drift.pop('energy')) < 1e-4
+    assert_conserved(drift, 1e-9)
+
+
+def test_edits_between_steps_start_a_new_baseline(simulation):
+    simulation.create_three_body_system()
+    simulation.start_monitor(interval=1)
+    for _ in range(5):
+        simulation.step(0.01)
+    first = simulation.monitor.initial
+    simulation.particles.add("Extra", 500, 500, 0, 0, 5000, (255, 255, 255))
+    simulation.step(0.01)
+    assert simulation.monitor.initial is not first
+    assert simulation.monitor.initial['mass'] == pytest.approx(first['mass'] + 5000)
+    assert_conserved(simulation.monitor.drift(), 1e-6)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from conftest import add_random_bodies
+
+
+def scalar_accelerations(simulation):
+    # The reference: the original per-particle loop
+    return np.array([simulation.getAccelVector(particle) for particle in simulation.particles])
+
+
+def relative_errors(ax, ay, expected):
+    # Per-body error against the RMS acceleration, so bodies whose pulls
+    # nearly cancel do not dominate
+    scale = np.sqrt(np.mean(expected[:, 0] ** 2 + expected[:, 1] ** 2))
+    return np.hypot(ax - expected[:, 0], ay - expected[:, 1]) / scale
+
+
+@pytest.fixture
+def bodies(simulation):
+    add_random_bodies(simulation, 300)
+    simulation.set_softening(5.0)
+    return simulation
+
+
+# Exact solvers agree to rounding; the approximate ones are held to a typical
+# (median) and worst-case error. P3M's worst case is a pair about two mesh
+# cells apart, where the smoothed part of the split is still poorly resolved.
+# Plain PM smooths every close pair over a cell, so only its median counts.
+@pytest.mark.parametrize("mode, median, worst", [
+    ("direct", 1e-12, 1e-12),
+    ("jit", 1e-12, 1e-12),
+    ("parallel", 1e-12, 1e-12),
+    ("barnes_hut", 5e-3, 2e-2),
+    ("p3m", 5e-3, 0.25),
+    ("pm", 5e-3, None),
+])
+def test_solver_matches_scalar_loop(bodies, mode, median, worst):
+    expected = scalar_accelerations(bodies)
+    if mode == "parallel":
+        bodies.workers = 2  # A pool even on one core
+    bodies.set_gravity_mode(mode)
+    if mode == "parallel":
+        assert bodies.solver.pool is not None
+        bodies.solver.min_bodies = 0  # and used for a few bodies
+    store = bodies.particles
+    errors = relative_errors(*bodies.solver.accelerations(store.x, store.y, store.mass, bodies.G), expected)
+    assert np.median(errors) < median
+    if worst is not None:
+        assert errors.max() < worst
+
+
+def test_barnes_hut_opens_every_node_at_zero_theta(bodies):
+    expected = scalar_accelerations(bodies)
+    bodies.set_theta(0)
+    bodies.set_gravity_mode("barnes_hut")
+    store = bodies.particles
+    errors = relative_errors(*bodies.solver.accelerations(store.x, store.y, store.mass, bodies.G), expected)
+    assert errors.max() < 1e-12
+
+
+@pytest.mark.parametrize("mode", ["direct", "barnes_hut", "pm"])
+def test_targets_only_evaluate_their_rows(bodies, mode):
+    bodies.set_gravity_mode(mode)
+    store = bodies.particles
+    full = bodies.solver.accelerations(store.x, store.y, store.mass, bodies.G)
+    targets = np.arange(0, len(store), 7)
+    ax, ay = bodies.solver.accelerations(store.x, store.y, store.mass, bodies.G, targets)
+    np.testing.assert_allclose(ax[targets], full[0][targets], rtol=1e-12)
+    np.testing.assert_allclose(ay[targets], full[1][targets], rtol=1e-12)
+    others = np.setdiff1d(np.arange(len(store)), targets)
+    assert not ax[others].any() and not ay[others].any()
+
+
+def test_tracers_feel_gravity_but_exert_none(simulation):
+    add_random_bodies(simulation, 120, tracers=40)
+    simulation.set_softening(5.0)
+    expected = scalar_accelerations(simulation)
+    store = simulation.particles
+    ax, ay = simulation.computeAccelerations(store.x, store.y, store.mass)
+    assert relative_errors(ax, ay, expected).max() < 1e-12
@@ -0,0 +1,21 @@
+import pytest
+
+from headless import run
+
+
+def test_fixed_step_integrators_take_one_step_per_dt(simulation):
+    simulation.create_three_body_system()
+    elapsed, substeps = run(simulation, 5, 0.05)
+    assert substeps == 5
+    assert simulation.time == pytest.approx(0.25)
+
+
+def test_hermite_timestep_splits_each_step(simulation):
+    # A step of dt = 5 would throw the inner orbits apart; Aarseth's criterion cuts it up
+    simulation.set_integrator("hermite4")
+    simulation.create_star_system()
+    elapsed, substeps = run(simulation, 2, 5.0)
+    assert substeps > 2
+    assert simulation.last_dt < 5.0
+    assert simulation.time + simulation.accumulator == pytest.approx(10.0)
+
@@ -0,0 +1,74 @@
+import math
+
+import pytest
+
+from diagnostics import totals
+from simulation import Simulation
+
+# Worst relative energy error over one orbit of the binary below at 200 steps per orbit
+DRIFT_BOUNDS = {"leapfrog": 5e-3, "yoshida4": 5e-5, "rk4": 5e-6, "hermite4": 5e-5}
+ORDERS = {"leapfrog": 2, "yoshida4": 4, "rk4": 4, "hermite4": 4}
+
+
+def binary(simulation, eccentricity=0.5, a=100.0, mass=1000.0):
+    # Two equal masses starting at apocentre, unsoftened so the orbit is an
+    # exact Kepler ellipse. Returns the orbital period.
+    simulation.set_softening(0)
+    r = a * (1 + eccentricity)
+    speed = math.sqrt(simulation.G * 2 * mass * (1 - eccentricity) / r)
+    simulation.particles.add("A", -r / 2, 0, 0, -speed / 2, mass, (255, 0, 0))
+    simulation.particles.add("B", r / 2, 0, 0, speed / 2, mass, (0, 255, 0))
+    return 2 * math.pi * math.sqrt(a ** 3 / (simulation.G * 2 * mass))
+
+
+def energy_errors(simulation, integrator, steps_per_orbit, orbits=1):
+    # Worst relative energy error within each orbit
+    simulation.set_integrator(integrator)
+    period = binary(simulation)
+    initial = totals(simulation)['energy']
+    errors = []
+    for _ in range(orbits):
+        worst = 0.0
+        for _ in range(steps_per_orbit):
+            simulation.step(period / steps_per_orbit)
+            worst = max(worst, abs(totals(simulation)['energy'] / initial - 1))
+        errors.append(worst)
+    return errors
+
+
+@pytest.mark.parametrize("integrator", sorted(DRIFT_BOUNDS))
+def test_energy_drift_over_an_orbit(simulation, integrator):
+    error, = energy_errors(simulation, integrator, 200)
+    assert error < DRIFT_BOUNDS[integrator]
+
+
+@pytest.mark.parametrize("integrator", sorted(ORDERS))
+def test_energy_error_shrinks_at_the_scheme_order(integrator):
+    errors = []
+    for steps in (200, 400):
+        simulation = Simulation(seed=1)
+        errors.extend(energy_errors(simulation, integrator, steps))
+        simulation.close()
+    # Halving the step divides the error by 2^order, give or take
+    assert errors[0] / errors[1] > 0.7 * 2 ** ORDERS[integrator]
+
+
+def test_leapfrog_energy_error_does_not_grow(simulation):
+    # Symplectic: the error oscillates within each orbit instead of accumulating
+    errors = energy_errors(simulation, "leapfrog", 50, orbits=10)
+    assert errors[-1] < 1.1 * errors[0]
+
+
+def test_block_timesteps_resolve_pericentre():
+    # At 50 steps per orbit the shared leapfrog step is too long near
+    # pericentre; the block scheme halves it there for both bodies
+    errors = {}
+    for integrator in ("leapfrog", "block"):
+        simulation = Simulation(seed=1)
+        errors[integrator] = energy_errors(simulation, integrator, 50, orbits=2)
+        if integrator == "block":
+            # Sub-stepped evaluations on top of one per global step
+            assert simulation.force_evaluations > 2 * 50 + 1
+        simulation.close()
+    assert max(errors["block"]) < max(errors["leapfrog"]) / 20
+    assert max(errors["block"]) < 1e-3
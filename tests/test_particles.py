@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from particles import ParticleStore, PointMass
+
+
+def add_bodies(store, n):
+    return [store.add(f"P{i}", float(i), -float(i), 0, 0, i + 1.0, (i % 256, 0, 0)) for i in range(n)]
+
+
+def assert_consistent(store, expected_x):
+    # Every id still finds its own row, whatever slot it moved to
+    for body_id in store.ids[:store.count].tolist():
+        slot = store.slot_of[body_id]
+        assert store.ids[slot] == body_id
+        assert store.x[slot] == expected_x[body_id]
+    assert [body_id for body_id in range(store.next_id) if store.has_id(body_id)] == sorted(expected_x)
+
+
+def test_remove_id_keeps_other_ids_stable():
+    store = ParticleStore(capacity=4)  # Also grows a few times
+    ids = add_bodies(store, 20)
+    expected_x = {body_id: float(body_id) for body_id in ids}
+    for body_id in (0, 19, 7, 8):
+        store.remove_id(body_id)
+        del expected_x[body_id]
+    assert len(store) == 16
+    assert_consistent(store, expected_x)
+
+
+def test_remove_many_keeps_order_and_ids():
+    store = ParticleStore()
+    ids = add_bodies(store, 10)
+    store.remove_many([3, 0, 9])
+    assert store.ids[:store.count].tolist() == [1, 2, 4, 5, 6, 7, 8]
+    assert [store.name(slot) for slot in range(len(store))] == ["P1", "P2", "P4", "P5", "P6", "P7", "P8"]
+    assert_consistent(store, {body_id: float(body_id) for body_id in ids if body_id not in (0, 3, 9)})
+
+
+def test_ids_are_never_reused():
+    store = ParticleStore()
+    add_bodies(store, 3)
+    store.remove_id(2)
+    store.remove_many([0])
+    assert store.add("new", 0, 0, 0, 0, 1, (0, 0, 0)) == 3
+    assert store.add_many(["a", "b"], np.zeros(2), np.zeros(2), np.zeros(2), np.zeros(2), np.ones(2),
+                          np.zeros((2, 3))).tolist() == [4, 5]
+
+
+def test_views_follow_their_body_and_detach_on_removal():
+    store = ParticleStore()
+    add_bodies(store, 5)
+    view = store.view(4)
+    store.remove_id(1)  # Swap-remove moves body 4 into slot 1
+    assert store.slot_of[4] == 1
+    assert view.x == 4.0 and view in store
+    version = store.version
+    view.x = 40.0
+    assert store.x[1] == 40.0 and store.version > version
+    store.remove_id(4)
+    assert view not in store
+    assert view.x == 40.0  # Keeps its last values
+    with pytest.raises(ValueError):
+        store.remove(view)
+
+
+def test_appended_point_mass_joins_the_store():
+    store = ParticleStore()
+    particle = PointMass("Sun", 1, 2, 3, 4, 1000, (255, 255, 0))
+    store.append(particle)
+    assert particle in store and store[0] is particle
+    with pytest.raises(ValueError):
+        store.append(particle)
+
+
+def test_numbered_names_follow_their_body():
+    store = ParticleStore()
+    add_bodies(store, 2)
+    code = store.name_code("D")
+    new_ids = store.add_many((np.full(3, code, dtype=np.int32), np.ones(3, dtype=bool)), np.zeros(3), np.zeros(3),
+                             np.zeros(3), np.zeros(3), np.ones(3), np.zeros((3, 3)))
+    assert [store.name(slot) for slot in range(len(store))] == ["P0", "P1", "D2", "D3", "D4"]
+    store.remove_id(0)  # Swap-remove moves D4 into slot 0
+    assert store.name(0) == "D4" and store.view(3).name == "D3"
+    view = store.view(2)
+    view.name = "Renamed"
+    assert view.name == "Renamed" and store.name(2) == "Renamed" and store.name(3) == "D3"
+    store.remove_many(new_ids.tolist())
+    assert view.name == "Renamed" and [store.name(slot) for slot in range(len(store))] == ["P1"]
+    with pytest.raises(KeyError):
+        store.remove_id(2)
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from headless import run
+from profiler import Profiler
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    started = profiler.start()
+    profiler.stop('phase', started)
+    profiler.count('events')
+    profiler.end_frame()
+    assert profiler.frames == 0 and profiler.phase_stats() == {} and profiler.counter_stats() == {}
+
+
+def test_frames_collect_phases_counters_and_callbacks():
+    profiler = Profiler(window=3)
+    profiler.set_enabled(True)
+    metrics = []
+    profiler.add_callback(metrics.append)
+    for frame in range(5):
+        profiler.begin_frame()
+        for _ in range(2):  # A phase may repeat within a frame
+            profiler.stop('work', profiler.start())
+        profiler.lap('rest')
+        profiler.count('events', frame)
+        profiler.end_frame()
+    assert profiler.frames == 5
+    assert [m['counters']['events'] for m in metrics] == [0, 1, 2, 3, 4]
+    assert set(metrics[-1]['phases_ms']) == {'work', 'rest'}
+    stats = profiler.phase_stats()['work']
+    assert 0 <= stats['p50'] <= stats['p95'] <= stats['max']
+    assert len(profiler.history['work']) == 3  # Rolling window
+    assert profiler.counter_stats()['events'] == {'per_frame': 3.0, 'total': 10}
+    profiler.reset()
+    assert profiler.frames == 0 and profiler.phase_stats() == {}
+
+
+def test_other_threads_publish_into_the_owners_next_frame():
+    profiler = Profiler()
+    profiler.set_enabled(True)
+
+    def worker():
+        profiler.stop('physics', profiler.start())
+        profiler.count('steps', 2)
+        profiler.publish()
+        profiler.count('steps')  # Not yet published
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    profiler.end_frame()
+    assert profiler.counter_stats()['steps']['total'] == 2
+    assert 'physics' in profiler.phase_stats()
+
+
+def test_headless_steps_are_profiled(simulation):
+    simulation.create_three_body_system()
+    simulation.profiler.set_enabled(True)
+    run(simulation, 4, 0.01)
+    assert simulation.profiler.frames == 4
+    assert {'integrate', 'collide'} <= set(simulation.profiler.phase_stats())
+    assert simulation.profiler.phase_stats()['integrate']['mean'] == pytest.approx(
+        sum(simulation.profiler.history['integrate']) / 4)
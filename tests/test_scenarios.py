@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import scenarios
+from diagnostics import totals
+from particles import FIELDS
+
+
+def names(store):
+    return [store.name(slot) for slot in range(len(store))]
+
+
+@pytest.mark.parametrize("name", sorted(scenarios.SCENARIOS))
+def test_generators_are_reproducible_from_a_seed(simulation, name):
+    generate = scenarios.SCENARIOS[name]
+    generate(simulation, 200, seed=7)
+    first = {field: simulation.particles.data[field][:len(simulation.particles)].copy() for field in FIELDS}
+    first_names = names(simulation.particles)
+    generate(simulation, 200, seed=7)
+    store = simulation.particles
+    assert len(store) == 200
+    for field in FIELDS:
+        np.testing.assert_array_equal(store.data[field][:len(store)], first[field])
+    # Numbered names carry the new ids, the prefixes repeat
+    assert [name.rstrip("0123456789") for name in names(store)] == [name.rstrip("0123456789") for name in first_names]
+
+
+def test_keplerian_disk_orbits_are_circular(simulation):
+    scenarios.keplerian_disk(simulation, 1000, seed=1)
+    store = simulation.particles
+    assert names(store)[:2] == ["Star", "D" + str(int(store.ids[1]))]
+    x, y, vx, vy = store.x[1:], store.y[1:], store.vx[1:], store.vy[1:]
+    r = np.hypot(x, y)
+    # Velocities are tangential, counter-clockwise, and at least the Keplerian speed of the star alone
+    np.testing.assert_allclose((x * vx + y * vy) / r, 0, atol=1e-9)
+    assert np.all(x * vy - y * vx > 0)
+    assert np.all(np.hypot(vx, vy) >= np.sqrt(simulation.G * scenarios.CENTRAL_MASS / r) * (1 - 1e-12))
+    assert store.mass[1:].sum() == pytest.approx(scenarios.DISK_MASS * 999 / 1000)
+
+
+def test_keplerian_disk_tracers_orbit_the_star_alone(simulation):
+    scenarios.keplerian_disk(simulation, 100, seed=1, tracers=True)
+    store = simulation.particles
+    assert store.tracer[0] == 0 and np.all(store.tracer[1:] == 1)
+    r = np.hypot(store.x[1:], store.y[1:])
+    np.testing.assert_allclose(np.hypot(store.vx[1:], store.vy[1:]),
+                               np.sqrt(simulation.G * scenarios.CENTRAL_MASS / r))
+
+
+def test_plummer_sphere_is_bound(simulation):
+    scenarios.plummer_sphere(simulation, 500, seed=1)
+    store = simulation.particles
+    assert store.mass.sum() == pytest.approx(scenarios.PLUMMER_MASS)
+    assert totals(simulation)['energy'] < 0
+
+
+def test_uniform_grid_is_a_centred_lattice_at_rest(simulation):
+    scenarios.uniform_grid(simulation, 100, seed=1, spacing=50)
+    store = simulation.particles
+    assert np.all(store.vx == 0) and np.all(store.vy == 0)
+    assert store.x.mean() == pytest.approx(0) and store.y.mean() == pytest.approx(0)
+    assert sorted(set(store.x.tolist())) == [-225.0 + 50 * i for i in range(10)]
+    assert set(store.mass.tolist()) <= {1.0, 100.0}
+
+
+@pytest.mark.parametrize("tracers", [False, True])
+def test_colliding_galaxies_approach_each_other(simulation, tracers):
+    scenarios.colliding_galaxies(simulation, 400, seed=1, tracers=tracers)
+    store = simulation.particles
+    cores = [slot for slot, name in enumerate(names(store)) if name.endswith("Core")]
+    assert [names(store)[slot] for slot in cores] == ["A Core", "B Core"]
+    a, b = cores
+    assert store.x[a] < store.x[b] and store.vx[a] > store.vx[b]
+    assert np.sum(store.mass * store.vx) == pytest.approx(0, abs=1e-6 * np.sum(store.mass * np.abs(store.vx)))
+    assert int(store.tracer.sum()) == (398 if tracers else 0)
+
+
+def test_hierarchical_three_body_has_no_net_momentum(simulation):
+    scenarios.hierarchical_three_body(simulation, 10, seed=1, tracers=True)
+    store = simulation.particles
+    assert names(store)[:3] == ["Body" + str(int(body_id)) for body_id in store.ids[:3]]
+    massive = store.tracer == 0
+    assert int(massive.sum()) == 3
+    assert np.sum(store.mass[massive] * store.vy[massive]) == pytest.approx(0, abs=1e-9)
+    assert np.sum(store.mass[massive] * store.vx[massive]) == 0
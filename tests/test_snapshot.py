@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from particles import FIELDS
+from simulation import Simulation
+
+
+def assert_same_bodies(a, b):
+    n = a.particles.count
+    assert b.particles.count == n
+    for name in FIELDS:
+        np.testing.assert_array_equal(a.particles.data[name][:n], b.particles.data[name][:n])
+    np.testing.assert_array_equal(a.particles.colors[:n], b.particles.colors[:n])
+    np.testing.assert_array_equal(a.particles.ids[:n], b.particles.ids[:n])
+    assert [a.particles.name(slot) for slot in range(n)] == [b.particles.name(slot) for slot in range(n)]
+
+
+def test_round_trip_restores_state_and_settings(simulation, tmp_path):
+    simulation.create_star_system()
+    simulation.set_integrator("rk4")
+    simulation.set_softening(0.5)
+    simulation.explosion = 2
+    simulation.bounding_box = (-900, -900, 900, 900)
+    for _ in range(5):
+        simulation.step(0.05)
+    path = tmp_path / "state.gsnap"
+    simulation.save_snapshot(path)
+
+    restored = Simulation()
+    restored.load_snapshot(path)
+    assert_same_bodies(simulation, restored)
+    for setting in ("time", "G", "time_accel", "bounding_box", "explosion", "max_particles", "tracer_collisions",
+                    "spawned_ids", "gravity_mode", "theta", "mesh_grid", "softening", "integrator_name"):
+        assert getattr(restored, setting) == getattr(simulation, setting), setting
+    assert restored.particles.next_id == simulation.particles.next_id
+    assert restored.random.getstate() == simulation.random.getstate()
+
+
+def test_resumed_run_continues_identically(simulation, tmp_path):
+    simulation.create_star_system()
+    for _ in range(3):
+        simulation.step(0.05)
+    path = tmp_path / "state.gsnap"
+    simulation.save_snapshot(path)
+    restored = Simulation()
+    restored.load_snapshot(path)
+    for _ in range(5):
+        simulation.step(0.05)
+        restored.step(0.05)
+    assert_same_bodies(simulation, restored)
+    assert restored.time == simulation.time
+
+
+def test_loaded_store_can_grow_past_the_file(simulation, tmp_path):
+    simulation.create_three_body_system()
+    path = tmp_path / "state.gsnap"
+    simulation.save_snapshot(path)
+    restored = Simulation()
+    restored.load_snapshot(path)
+    for i in range(100):
+        restored.particles.add(f"extra{i}", i, i, 0, 0, 1, (0, 0, 0))
+    assert len(restored.particles) == len(simulation.particles) + 100
+    # Copy-on-write maps never write back
+    again = Simulation()
+    again.load_snapshot(path)
+    assert_same_bodies(simulation, again)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not-a-snapshot"
+    path.write_bytes(b"hello")
+    with pytest.raises(ValueError):
+        Simulation().load_snapshot(path)
+
+
+def test_saving_over_the_loaded_file(simulation, tmp_path):
+    # The loaded store is memory-mapped from the file it is saved over
+    simulation.create_star_system()
+    path = tmp_path / "state.gsnap"
+    simulation.save_snapshot(path)
+    restored = Simulation()
+    restored.load_snapshot(path)
+    for _ in range(2):
+        simulation.step(0.05)
+        restored.step(0.05)
+    restored.save_snapshot(path)
+    assert_same_bodies(simulation, restored)
+    again = Simulation()
+    again.load_snapshot(path)
+    assert_same_bodies(simulation, again)
+    assert [p.name for p in tmp_path.iterdir()] == ["state.gsnap"]
@@ -0,0 +1,62 @@
+import numpy as np
+
+from conftest import add_random_bodies
+from spatial import SpatialIndex
+
+
+def brute_nearest(store, x, y):
+    return int(np.argmin((store.x - x) ** 2 + (store.y - y) ** 2))
+
+
+def brute_in_rect(store, x0, y0, x1, y1):
+    x0, x1 = min(x0, x1), max(x0, x1)
+    y0, y1 = min(y0, y1), max(y0, y1)
+    return np.nonzero((store.x >= x0) & (store.x <= x1) & (store.y >= y0) & (store.y <= y1))[0]
+
+
+def assert_matches_brute_force(index, store, rng):
+    for x, y in rng.uniform(-800, 800, (50, 2)):
+        assert index.nearest(store, x, y) == brute_nearest(store, x, y)
+    for x0, y0, x1, y1 in rng.uniform(-600, 600, (20, 4)):
+        np.testing.assert_array_equal(np.sort(index.in_rect(store, x0, y0, x1, y1)),
+                                      brute_in_rect(store, x0, y0, x1, y1))
+
+
+def test_queries_match_brute_force(simulation):
+    add_random_bodies(simulation, 2000)
+    store = simulation.particles
+    index = SpatialIndex()
+    assert_matches_brute_force(index, store, np.random.default_rng(2))
+    assert index.nearest(store, 5000, 5000, max_distance=100) is None
+
+
+def test_refresh_follows_moving_bodies(simulation):
+    add_random_bodies(simulation, 1000)
+    store = simulation.particles
+    index = SpatialIndex()
+    index.build(store)
+    rng = np.random.default_rng(3)
+    for _ in range(5):
+        store.x += rng.normal(0, 20, len(store))
+        store.y += rng.normal(0, 20, len(store))
+        index.refresh(store)
+        assert_matches_brute_force(index, store, rng)
+    # Spreading far past the grid it was built for rebuilds it
+    cell = index.cell
+    store.x *= 10
+    store.y *= 10
+    index.refresh(store)
+    assert index.cell > cell
+    assert_matches_brute_force(index, store, rng)
+
+
+def test_edits_rebuild_the_index(simulation):
+    store = simulation.particles
+    index = SpatialIndex()
+    assert index.nearest(store, 0, 0) is None
+    assert len(index.in_rect(store, -1, -1, 1, 1)) == 0
+    add_random_bodies(simulation, 100)
+    rng = np.random.default_rng(4)
+    assert_matches_brute_force(index, store, rng)
+    store.remove_many(store.ids[:50].tolist())
+    assert_matches_brute_force(index, store, rng)
@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+import pytest
+
+from trajectory import TrajectoryReader
+
+
+@pytest.mark.parametrize("float32, compress", [(False, False), (True, False), (False, True)])
+def test_round_trip_matches_recorded_states(simulation, tmp_path, float32, compress):
+    simulation.create_star_system()
+    path = tmp_path / "run.traj"
+    expected = []
+
+    def capture():
+        store = simulation.particles
+        n = store.count
+        expected.append((simulation.time, store.ids[:n].copy(), store.x[:n].copy(), store.y[:n].copy(),
+                         store.mass[:n].copy(), store.colors[:n].copy()))
+
+    capture()  # Recording starts with the current state
+    simulation.start_recording(path, stride=2, chunk_frames=3, float32=float32, compress=compress)
+    for step in range(1, 12):
+        simulation.step(0.05)
+        if step % 2 == 0:
+            capture()
+    simulation.stop_recording()
+
+    reader = TrajectoryReader(path)
+    try:
+        assert len(reader) == len(expected)
+        assert reader.stride == 2
+        float_dtype = np.float32 if float32 else np.float64
+        for index in (*range(len(reader)), 0):  # Seeking back works too
+            frame = reader.frame(index)
+            time, ids, x, y, mass, colors = expected[index]
+            assert frame['time'] == time
+            np.testing.assert_array_equal(frame['ids'], ids)
+            np.testing.assert_array_equal(frame['x'], x.astype(float_dtype))
+            np.testing.assert_array_equal(frame['y'], y.astype(float_dtype))
+            np.testing.assert_array_equal(frame['mass'], mass.astype(float_dtype))
+            np.testing.assert_array_equal(frame['colors'], colors)
+    finally:
+        reader.close()
+    assert expected[0][0] == 0
+
+
+def test_body_count_may_change_between_frames(simulation, tmp_path):
+    simulation.create_three_body_system()
+    path = tmp_path / "run.traj"
+    simulation.start_recording(path, fields=('x',))
+    simulation.particles.add("late", 1, 2, 0, 0, 1, (0, 0, 0))
+    simulation.step(0.05)
+    simulation.stop_recording()
+    reader = TrajectoryReader(path)
+    try:
+        assert [len(reader.frame(i)['ids']) for i in range(len(reader))] == [3, 4]
+    finally:
+        reader.close()
+
+
+def test_writer_that_falls_behind_drops_frames_instead_of_blocking(simulation, tmp_path):
+    simulation.create_three_body_system()
+    simulation.start_recording(tmp_path / "run.traj", chunk_frames=1, max_queued_bytes=1)
+    recorder = simulation.recorder
+    deadline = time.monotonic() + 10
+    while recorder.queued_bytes and time.monotonic() < deadline:
+        time.sleep(0.01)  # Let the writer finish the initial frame, it is idle after that
+    assert recorder.queued_bytes == 0
+    recorder.queued_bytes = 1  # As if a chunk were still waiting for the disk
+    with pytest.warns(RuntimeWarning):
+        simulation.step(0.05)
+    assert recorder.frames_dropped == 1
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from conftest import add_random_bodies
+from worker import PhysicsWorker, capture
+
+
+def test_frames_keep_names_until_the_store_changes(simulation):
+    add_random_bodies(simulation, 5)
+    frame = capture(simulation)
+    assert [frame.name(slot) for slot in range(len(frame))] == ["P0", "P1", "P2", "P3", "P4"]
+    simulation.particles.x[:] += 1
+    ids = frame.ids
+    capture(simulation, frame)
+    assert frame.ids is ids  # Same version: ids and names are not copied again
+    np.testing.assert_array_equal(frame.x, simulation.particles.x)
+
+    simulation.particles.view(3).name = "Renamed"
+    simulation.particles.remove_id(0)  # Swap-remove moves P4 into slot 0
+    capture(simulation, frame)
+    assert [frame.name(slot) for slot in range(len(frame))] == ["P4", "P1", "P2", "Renamed"]
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline
+        time.sleep(0.001)
+
+
+def test_the_drawn_frame_is_never_refilled(simulation):
+    # Published by hand, so the handoff is deterministic
+    add_random_bodies(simulation, 20)
+    worker = PhysicsWorker(simulation)
+    worker.publish()
+    drawn = worker.latest()
+    x = drawn.x.copy()
+    frames = {id(drawn)}
+    for _ in range(5):
+        simulation.particles.x[:] += 1
+        worker.publish()
+        frames.add(id(worker.front))
+        assert worker.front is not drawn
+        np.testing.assert_array_equal(drawn.x, x)  # However many frames go by
+    drawn = worker.latest()
+    np.testing.assert_array_equal(drawn.x, simulation.particles.x)
+    # Double-buffered, plus the frame being drawn when the worker laps the renderer
+    assert len(frames | {id(drawn)}) <= 3
+
+
+def test_worker_steps_runs_commands_and_pauses(simulation):
+    simulation.create_three_body_system()
+    worker = PhysicsWorker(simulation, rate=1000)
+    worker.start()
+    try:
+        wait_for(lambda: worker.latest().time > 0)
+        ran_on = []
+        worker.submit(lambda: ran_on.append(threading.current_thread().name))
+        wait_for(lambda: ran_on)
+        assert ran_on == ["physics"]
+        worker.set_paused(True)
+        wait_for(lambda: worker.paused)
+        paused_at = simulation.time
+        time.sleep(0.05)
+        assert simulation.time == paused_at
+        worker.submit(simulation.particles.remove_id, 0)
+        wait_for(lambda: len(worker.latest()) == 2)  # Edits still publish while paused
+    finally:
+        worker.stop()
+
+
+def test_worker_errors_reach_the_renderer(simulation):
+    worker = PhysicsWorker(simulation, rate=1000)
+    worker.start()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    worker.submit(fail)
+    worker.thread.join(10)
+    with pytest.raises(RuntimeError, match="boom"):
+        worker.latest()
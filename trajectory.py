@@ -0,0 +1,267 @@
+import json
+import mmap
+import queue
+import struct
+import threading
+import warnings
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from particles import FIELDS
+
+# File layout: magic, little-endian uint64 header length, JSON header, then
+# self-describing chunks appended one after another. Every chunk starts with
+# CHUNK_HEADER and an uncompressed frame table, followed by the payload with
+# each frame's ids and fields. Stable ids let the body count change freely.
+MAGIC = b"GTRAJ\x00\x01\x00"
+CHUNK_TAG = b"CHNK"
+CHUNK_HEADER = struct.Struct('<4s4xQQQ')  # tag, padding, frames, stored bytes, raw bytes
+FRAME_TABLE = np.dtype([('time', '<f8'), ('count', '<u8'), ('offset', '<u8')])
+DEFAULT_FIELDS = ('x', 'y', 'mass', 'colors')
+CHUNK_FRAMES = 64
+# Chunks waiting for the writer thread may hold this much memory; beyond it
+# new chunks are dropped and counted instead of making the step wait
+MAX_QUEUED_BYTES = 256 * 2 ** 20
+
+
+def padded(nbytes):
+    return (nbytes + 7) // 8 * 8
+
+
+def field_dtype(name, float_dtype):
+    return np.dtype(np.uint8) if name == 'colors' else np.dtype(float_dtype)
+
+
+def field_width(name):
+    return 3 if name == 'colors' else 1
+
+
+class TrajectoryRecorder:
+    # Captures selected fields every `stride` steps and hands full chunks to a
+    # background thread, so stepping never waits on the disk. A writer that
+    # falls max_queued_bytes behind loses whole chunks, counted in
+    # frames_dropped, with a warning the first time.
+    def __init__(self, path, fields=DEFAULT_FIELDS, stride=1, float32=False, compress=False,
+                 chunk_frames=CHUNK_FRAMES, max_queued_bytes=MAX_QUEUED_BYTES):
+        for name in fields:
+            if name not in FIELDS and name != 'colors':
+                raise ValueError("Unknown field: " + str(name))
+        self.path = path
+        self.fields = tuple(fields)
+        self.stride = max(1, int(stride))
+        self.float_dtype = np.dtype('<f4' if float32 else '<f8')
+        self.compress = compress
+        self.chunk_frames = chunk_frames
+        self.steps = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.max_queued_bytes = max_queued_bytes
+        self.queued_bytes = 0
+        self.lock = threading.Lock()
+        self.pending = []
+        self.error = None
+
+        header = {'fields': list(self.fields), 'float_dtype': self.float_dtype.str,
+                  'stride': self.stride, 'compression': 'zlib' if compress else None}
+        encoded = json.dumps(header).encode('utf-8')
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.file.write(struct.pack('<Q', len(encoded)))
+        self.file.write(encoded)
+        self.file.write(b'\x00' * (padded(self.file.tell()) - self.file.tell()))
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, simulation):
+        if self.error is not None:
+            raise self.error
+        self.steps += 1
+        if (self.steps - 1) % self.stride:
+            return
+        store = simulation.particles
+        n = store.count
+        frame = [simulation.time, store.ids[:n].copy()]
+        for name in self.fields:
+            if name == 'colors':
+                frame.append(store.colors[:n].copy())
+            else:
+                frame.append(store.data[name][:n].astype(self.float_dtype))
+        self.pending.append(frame)
+        if len(self.pending) >= self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        frames, self.pending = self.pending, []
+        nbytes = sum(array.nbytes for frame in frames for array in frame[1:])
+        with self.lock:
+            # A chunk bigger than the ceiling still goes through an empty queue
+            behind = self.queued_bytes > 0 and self.queued_bytes + nbytes > self.max_queued_bytes
+            if not behind:
+                self.queued_bytes += nbytes
+        if behind:
+            if not self.frames_dropped:
+                warnings.warn(f"Trajectory writer for {self.path} is falling behind, dropping frames",
+                              RuntimeWarning)
+            self.frames_dropped += len(frames)
+            return
+        self.queue.put((frames, nbytes))
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frames, nbytes = item
+            try:
+                self.write_chunk(frames)
+            except Exception as error:  # Surfaced on the next record() or close()
+                self.error = error
+            with self.lock:
+                self.queued_bytes -= nbytes
+
+    def write_chunk(self, frames):
+        table = np.zeros(len(frames), dtype=FRAME_TABLE)
+        parts = []
+        offset = 0
+        for index, frame in enumerate(frames):
+            table[index] = (frame[0], len(frame[1]), offset)
+            for array in frame[1:]:
+                raw = array.tobytes()
+                parts.append(raw)
+                parts.append(b'\x00' * (padded(len(raw)) - len(raw)))
+                offset += padded(len(raw))
+        payload = b''.join(parts)
+        stored = zlib.compress(payload, 1) if self.compress else payload
+        self.file.write(CHUNK_HEADER.pack(CHUNK_TAG, len(frames), len(stored), len(payload)))
+        self.file.write(table.tobytes())
+        self.file.write(stored)
+        self.file.write(b'\x00' * (padded(len(stored)) - len(stored)))
+        self.frames_written += len(frames)
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+
+class TrajectoryReader:
+    # Random access to a recorded trajectory. Only chunk headers and frame
+    # tables are scanned on open; frame data is sliced lazily out of a memory
+    # map (or decompressed per chunk), and the chunks just ahead of the
+    # playback position are prefetched.
+    def __init__(self, path, window=4):
+        self.path = path
+        self.window = window
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = memoryview(self.map)
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ValueError("Not a trajectory file: " + str(path))
+        length, = struct.unpack_from('<Q', data, len(MAGIC))
+        header = json.loads(bytes(data[len(MAGIC) + 8:len(MAGIC) + 8 + length]).decode('utf-8'))
+        self.fields = header['fields']
+        self.float_dtype = np.dtype(header['float_dtype'])
+        self.stride = header['stride']
+        self.compressed = header['compression'] == 'zlib'
+
+        chunk_starts, chunk_sizes, chunk_raw, tables = [], [], [], []
+        position = padded(len(MAGIC) + 8 + length)
+        while position + CHUNK_HEADER.size <= len(self.map):
+            tag, frames, stored, raw = CHUNK_HEADER.unpack_from(data, position)
+            if tag != CHUNK_TAG:
+                break
+            table_start = position + CHUNK_HEADER.size
+            payload_start = table_start + frames * FRAME_TABLE.itemsize
+            if payload_start + stored > len(self.map):
+                break  # Chunk still being written
+            tables.append(np.frombuffer(self.map, dtype=FRAME_TABLE, count=frames, offset=table_start))
+            chunk_starts.append(payload_start)
+            chunk_sizes.append(stored)
+            chunk_raw.append(raw)
+            position = payload_start + padded(stored)
+        del data
+
+        self.chunk_start = np.array(chunk_starts, dtype=np.int64)
+        self.chunk_size = np.array(chunk_sizes, dtype=np.int64)
+        self.chunk_raw = np.array(chunk_raw, dtype=np.int64)
+        table = np.concatenate(tables) if tables else np.zeros(0, dtype=FRAME_TABLE)
+        self.times = table['time'].copy()
+        self.counts = table['count'].astype(np.int64)
+        self.offsets = table['offset'].astype(np.int64)
+        self.frame_chunk = np.repeat(np.arange(len(tables)), [len(t) for t in tables])
+        self.decoded = OrderedDict()
+        self.prefetcher = ThreadPoolExecutor(max_workers=1)
+        self.prefetching = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def chunk_payload(self, chunk):
+        if not self.compressed:
+            return self.map, int(self.chunk_start[chunk])
+        payload = self.decoded.get(chunk)
+        if payload is None:
+            pending = self.prefetching.pop(chunk, None)
+            payload = pending.result() if pending is not None else self.decompress(chunk)
+            self.decoded[chunk] = payload
+            while len(self.decoded) > self.window:
+                self.decoded.popitem(last=False)
+        else:
+            self.decoded.move_to_end(chunk)
+        return payload, 0
+
+    def decompress(self, chunk):
+        start = int(self.chunk_start[chunk])
+        return zlib.decompress(self.map[start:start + int(self.chunk_size[chunk])])
+
+    def prefetch(self, index, direction=1):
+        # Warm the next chunks in the playback direction in the background
+        first = int(self.frame_chunk[index])
+        for step in range(1, self.window):
+            chunk = first + step * (1 if direction >= 0 else -1)
+            if not 0 <= chunk < len(self.chunk_start):
+                break
+            if self.compressed:
+                if chunk not in self.decoded and chunk not in self.prefetching:
+                    self.prefetching[chunk] = self.prefetcher.submit(self.decompress, chunk)
+            elif hasattr(self.map, 'madvise'):
+                start = int(self.chunk_start[chunk]) // mmap.PAGESIZE * mmap.PAGESIZE
+                end = int(self.chunk_start[chunk] + self.chunk_size[chunk])
+                self.map.madvise(mmap.MADV_WILLNEED, start, end - start)
+
+    def frame(self, index):
+        # Returns the frame's time, ids and one array per recorded field; for
+        # uncompressed files these are read-only views into the memory map
+        chunk = int(self.frame_chunk[index])
+        buffer, base = self.chunk_payload(chunk)
+        count = int(self.counts[index])
+        position = base + int(self.offsets[index])
+        ids = np.frombuffer(buffer, dtype='<i8', count=count, offset=position)
+        position += padded(ids.nbytes)
+        frame = {'time': float(self.times[index]), 'ids': ids}
+        for name in self.fields:
+            dtype = field_dtype(name, self.float_dtype)
+            array = np.frombuffer(buffer, dtype=dtype, count=count * field_width(name), offset=position)
+            frame[name] = array.reshape(count, 3) if name == 'colors' else array
+            position += padded(array.nbytes)
+        return frame
+
+    def close(self):
+        self.prefetcher.shutdown(wait=True)
+        self.decoded.clear()
+        self.prefetching.clear()
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # Frames handed out still view the map, it is released with them
+        self.file.close()
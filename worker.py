@@ -0,0 +1,186 @@
+import copy
+import queue
+import threading
+import time
+
+import numpy as np
+
+from particles import body_name
+from simulation import FPS
+
+# Per-body columns copied into every frame: enough to draw the bodies and to
+# describe the one under the mouse
+FRAME_FIELDS = ('x', 'y', 'vx', 'vy', 'ax', 'ay', 'mass', 'radius', 'tracer')
+
+
+class Frame:
+    # Read-only copy of the bodies at one moment, duck-typing the parts of a
+    # ParticleStore that drawing and SpatialIndex queries use. The columns are
+    # read-only views of buffers the frame owns, so a retired frame is
+    # refilled in place instead of reallocated.
+    def __init__(self, capacity):
+        self.buffers = {name: np.zeros(capacity) for name in FRAME_FIELDS}
+        self.color_buffer = np.zeros((capacity, 3), dtype=np.uint8)
+        self.id_buffer = np.zeros(capacity, dtype=np.int64)
+        self.name_code_buffer = np.zeros(capacity, dtype=np.int32)
+        self.numbered_buffer = np.zeros(capacity, dtype=bool)
+        self.count = 0
+        self.version = None
+        self.time = 0
+        self.bounding_box = None
+        self.name_table = []
+        self.index = None
+
+    @property
+    def capacity(self):
+        return len(self.id_buffer)
+
+    def fill(self, simulation):
+        store = simulation.particles
+        n = store.count
+        for name in FRAME_FIELDS:
+            setattr(self, name, self.copy(self.buffers[name], store.data[name], n))
+        self.colors = self.copy(self.color_buffer, store.colors, n)
+        # Ids and names only change with store.version, so a frame refilled
+        # at the version it already holds keeps them. The store appends to its
+        # name table or replaces it, never edits it, so sharing it is safe.
+        if self.version != store.version or self.count != n:
+            self.ids = self.copy(self.id_buffer, store.ids, n)
+            self.name_codes = self.copy(self.name_code_buffer, store.name_codes, n)
+            self.numbered = self.copy(self.numbered_buffer, store.numbered, n)
+            self.name_table = store.name_table
+        self.count = n
+        self.version = store.version
+        self.time = simulation.time
+        self.bounding_box = simulation.bounding_box
+        # SpatialIndex replaces its arrays rather than writing into them, so a
+        # shallow copy stays consistent with these positions
+        self.index = copy.copy(simulation.spatial_index)
+
+    @staticmethod
+    def copy(buffer, source, n):
+        view = buffer[:n]
+        view[...] = source[:n]
+        view = view.view()
+        view.flags.writeable = False
+        return view
+
+    def name(self, slot):
+        return body_name(self, slot)
+
+    def __len__(self):
+        return self.count
+
+
+def capture(simulation, frame=None):
+    # Fills frame from the simulation, or a new frame if it is missing or too small
+    if frame is None or frame.capacity < simulation.particles.count:
+        frame = Frame(simulation.particles.capacity)
+    frame.fill(simulation)
+    return frame
+
+
+class PhysicsWorker:
+    # Advances a simulation on a background thread at a fixed rate and
+    # publishes a Frame after every step. Anything else that changes the
+    # simulation is queued with submit() and run between steps, so the
+    # physics thread is the only one touching the ParticleStore.
+    #
+    # Frames are double-buffered: the renderer draws the frame it last took
+    # from latest() while the worker fills the other one. If the worker
+    # finishes again before the renderer comes back, it needs the frame being
+    # drawn; it allocates a third instead of waiting. The lock only covers
+    # swapping references, never a step or a draw.
+    def __init__(self, simulation, rate=FPS):
+        self.simulation = simulation
+        self.interval = 1 / rate
+        self.commands = queue.Queue()
+        self.paused = False
+        self.requested_paused = False
+        self.stopping = False
+        self.error = None
+        self.lock = threading.Lock()
+        self.front = None  # Newest complete frame
+        self.reading = None  # Frame the renderer holds
+        self.back = None  # Retired frame, refilled by the next publish
+        self.thread = threading.Thread(target=self.run, name="physics", daemon=True)
+
+    def start(self):
+        self.publish()  # The renderer has a frame before the first step
+        self.thread.start()
+
+    def stop(self):
+        self.stopping = True
+        self.submit(lambda: None)  # Wake a worker that is waiting for commands
+        self.thread.join()
+
+    def submit(self, function, *args):
+        self.commands.put((function, args))
+
+    def set_paused(self, paused):
+        # Queued like any other command, so it takes effect in order with them
+        if paused != self.requested_paused:
+            self.requested_paused = paused
+            self.submit(setattr, self, 'paused', paused)
+
+    def latest(self):
+        # Renderer side: the newest complete frame. It stays untouched until
+        # the next call, however many frames are published meanwhile.
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            if self.reading is not self.front:
+                retired, self.reading = self.reading, self.front
+                if retired is not None and self.back is None:
+                    self.back = retired
+            return self.reading
+
+    def publish(self):
+        simulation = self.simulation
+        if simulation.spatial_index is not None:
+            simulation.spatial_index.ensure(simulation.particles)
+        with self.lock:
+            frame, self.back = self.back, None
+        frame = capture(simulation, frame)
+        with self.lock:
+            retired, self.front = self.front, frame
+            if retired is not self.reading:
+                self.back = retired
+
+    def apply_commands(self, deadline):
+        # Runs queued commands until the deadline, returns how many ran
+        applied = 0
+        while not self.stopping:
+            timeout = deadline - time.perf_counter()
+            try:
+                function, args = self.commands.get(timeout=timeout) if timeout > 0 else self.commands.get_nowait()
+            except queue.Empty:
+                break
+            function(*args)
+            applied += 1
+        return applied
+
+    def run(self):
+        simulation = self.simulation
+        profiler = simulation.profiler
+        try:
+            next_step = time.perf_counter()
+            while not self.stopping:
+                changed = self.apply_commands(next_step)
+                if self.stopping:
+                    break
+                if not self.paused:
+                    started = profiler.start()
+                    simulation.advance(simulation.time_accel)
+                    profiler.stop('advance', started)
+                    changed = True
+                if changed:
+                    self.publish()
+                    # Step timings and counters count towards the frame that draws this step
+                    profiler.publish()
+                # After a slow step the next one starts right away: the
+                # simulation slows down rather than catching up in a burst
+                next_step = max(next_step + self.interval, time.perf_counter())
+        except BaseException as error:
+            # Raised again in the rendering thread by the next latest()
+            self.error = error